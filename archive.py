@@ -0,0 +1,84 @@
+import gzip
+import json
+import os
+from decimal import Decimal
+from functools import cached_property
+from typing import Dict, Iterator, List, Protocol
+
+# Location of the archive segments of the payments, e.g. s3://my-bucket/archive or a local directory
+ARCHIVE_URL = 'ARCHIVE_URL'
+
+
+class ArchiveStore(Protocol):
+    """Object store of the archive segments, keyed by paths like the keys of S3"""
+
+    def put(self, key: str, data: bytes) -> None:
+        ...
+
+    def get(self, key: str) -> bytes:
+        ...
+
+
+class DirectoryStore:
+    """Keeps the segments as files under a directory, e.g. in the tests or for a bot run on a server"""
+
+    def __init__(self, root: str):
+        self._root = root
+
+    def put(self, key: str, data: bytes) -> None:
+        path = os.path.join(self._root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The segment shows up complete or not at all, like an object of S3
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(f'{path}.tmp', path)
+
+    def get(self, key: str) -> bytes:
+        with open(os.path.join(self._root, key), 'rb') as f:
+            return f.read()
+
+
+class S3Store:
+
+    def __init__(self, bucket: str, prefix: str = ''):
+        self._bucket = bucket
+        self._prefix = prefix.strip('/')
+
+    @cached_property
+    def _client(self):
+        import boto3
+        return boto3.client('s3')
+
+    def put(self, key: str, data: bytes) -> None:
+        self._client.put_object(Bucket=self._bucket, Key=self._key(key), Body=data)
+
+    def get(self, key: str) -> bytes:
+        return self._client.get_object(Bucket=self._bucket, Key=self._key(key))['Body'].read()
+
+    def _key(self, key: str) -> str:
+        return f'{self._prefix}/{key}' if self._prefix else key
+
+
+def open_store(url: str) -> ArchiveStore:
+    """Returns the store of an s3://bucket/prefix URL, or of a local directory"""
+    if url.startswith('s3://'):
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        return S3Store(bucket, prefix)
+    return DirectoryStore(url)
+
+
+def encode_segment(items: List[Dict]) -> bytes:
+    """Writes the items of the payments as gzipped JSON lines, the amounts in minor units are integers"""
+    lines = (json.dumps(item, default=_integer, ensure_ascii=False) for item in items)
+    return gzip.compress('\n'.join(lines).encode(), mtime=0)
+
+
+def decode_segment(data: bytes) -> Iterator[Dict]:
+    for line in gzip.decompress(data).decode().splitlines():
+        yield json.loads(line)
+
+
+def _integer(value):
+    if isinstance(value, Decimal):
+        return int(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from moto import mock_aws
+
+from test.local_dynamodb import create_table
+
+# Two users and three wallets, the payments are spread evenly over the wallets
+BENCHMARK_CONFIG = {
+    "bot_token": "123456:my_bot_token",
+    "wallets": [{"currency": "Dollar", "symbol": "$"}, {"currency": "Euro", "symbol": "€"},
+                {"currency": "Toman", "symbol": "T", "precision": 0}],
+    "users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}],
+}
+os.environ["JSON_CONFIG"] = json.dumps(BENCHMARK_CONFIG)
+
+import export  # noqa: E402
+from configuration import Configuration  # noqa: E402
+from database import MAX_BATCH_SIZE, Database  # noqa: E402
+from payment import Payment, PersistedPayment  # noqa: E402
+from sort_keys import import_key  # noqa: E402
+
+DEFAULT_SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+
+# DynamoDB operations that read the table
+READ_OPERATIONS = {"Query", "Scan", "GetItem", "BatchGetItem"}
+
+# Bytes of a read unit, which reads twice as much when it is eventually consistent
+READ_UNIT_BYTES = 4096
+
+
+def seed(database: Database, config: Configuration, size: int):
+    """
+    Writes `size` payments of the two users, one second apart, at the keys an import of them would write, and builds
+    the balance aggregates and the monthly stats of the wallets
+    """
+    rng = random.Random(size)
+    wallets, users = config.get_currencies(), config.get_usernames()
+    start = datetime(2020, 1, 1)
+    batch = []
+    for i in range(size):
+        wallet = wallets[i % len(wallets)]
+        payment = Payment(rng.choice(users), str(rng.randint(1, 100000)), wallet,
+                          config.get_wallet_symbol(wallet), f"note {i}")
+        batch.append((payment, import_key((start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"), 0)))
+        if len(batch) == MAX_BATCH_SIZE:
+            database.add_payments(batch)
+            batch = []
+    if batch:
+        database.add_payments(batch)
+    for wallet in wallets:
+        database.rebuild_balance(wallet)
+        database.rebuild_stats(wallet)
+
+
+def operations(config: Configuration) -> Dict[str, Callable[[Database], object]]:
+    # The hot paths of the commands. Every operation runs on a new database, hence with a cold ledger cache, except
+    # the ones named warm that run right after the same operation
+    wallet = config.get_currencies()[0]
+    payer = config.get_usernames()[1]
+    return {
+        "get_payments": lambda database: database.get_payments(),
+        "get_balance": lambda database: database.get_balance(wallet),
+        "get_balance_warm": lambda database: database.get_balance(wallet),
+        "last_5_payments": lambda database: database.get_last_payments(5),
+        "last_5_payments_warm": lambda database: database.get_last_payments(5),
+        "history_payments": lambda database: export.export_payments(database.iter_payments(archived=True),
+                                                                     "json").getbuffer(),
+        "jsonify_all": lambda database: len(PersistedPayment.jsonify_all(database.get_payments())),
+        "history_frames": lambda database: export.export_frames(database.iter_frames(archived=True),
+                                                                "json").getbuffer(),
+        "frame_totals": lambda database: database.get_frame(notes=False).totals(),
+        # A year of /stats from the monthly stats, and computed from the payments instead
+        "stats_year": lambda database: database.get_stats(wallet, 12, "2020-12"),
+        "stats_year_from_payments": lambda database: database.get_frame(wallet, notes=False).monthly_totals(),
+        # An hour of payments and the payments of a payer from the key conditions and the payer index, and filtered
+        # from all the payments instead
+        "payments_hour": lambda database: database.get_payments(since="2020-01-01 01", until="2020-01-01 01"),
+        "payments_hour_filtered": lambda database: [p for p in database.get_payments()
+                                                    if p.key.startswith("2020-01-01 01")],
+        "payer_payments": lambda database: database.get_payments(payer=payer),
+        "payer_payments_filtered": lambda database: [p for p in database.get_payments() if p.payer == payer],
+        "payer_last_20": lambda database: database.get_last_payments(20, payer=payer),
+        "payer_last_20_filtered": lambda database: [p for p in database.get_payments() if p.payer == payer][-20:],
+    }
+
+
+def measure(config: Configuration, name: str, operation: Callable[[Database], object]) -> Dict:
+    # The latency and the reads are measured first, tracemalloc slows the operation down
+    database = prepare(config, name, operation)
+    reads, read_bytes = [], []
+
+    def count_read(model, **kwargs):
+        if model.name in READ_OPERATIONS:
+            reads.append(model.name)
+
+    def count_read_bytes(model, http_response, **kwargs):
+        # moto reports a unit per request whatever it reads, the units are estimated from the size of the responses
+        if model.name in READ_OPERATIONS:
+            read_bytes.append(len(http_response.content))
+
+    database._table.meta.client.meta.events.register("before-call.dynamodb", count_read)
+    database._table.meta.client.meta.events.register("after-call.dynamodb", count_read_bytes)
+    started = time.perf_counter()
+    operation(database)
+    seconds = time.perf_counter() - started
+
+    # The peak includes the allocations of the stand-in for its responses, like the parsing of real responses
+    database = prepare(config, name, operation)
+    tracemalloc.start()
+    operation(database)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    read_units = sum(-(-size // READ_UNIT_BYTES) / 2 for size in read_bytes)
+    return {"operation": name, "seconds": round(seconds, 6), "peak_bytes": peak, "read_calls": len(reads),
+            "read_units": read_units}
+
+
+def prepare(config: Configuration, name: str, operation: Callable[[Database], object]) -> Database:
+    database = Database(config)
+    if name.endswith("_warm"):
+        operation(database)
+    return database
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: List[int], only: Optional[List[str]] = None) -> Dict:
+    config = Configuration()
+    results = []
+    for size in sizes:
+        with mock_aws():
+            create_table()
+            started = time.perf_counter()
+            seed(Database(config), config, size)
+            print(f"Seeded {size} payments in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+            for name, operation in operations(config).items():
+                if only and name not in only:
+                    continue
+                result = {"payments": size, **measure(config, name, operation)}
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+    return {"commit": git_commit(), "python": platform.python_version(), "results": results}
+
+
+def compare(report: Dict, baseline: Dict) -> str:
+    """Lists the ratios of the results of the report to the ones of the baseline, above 1 means slower or bigger"""
+    previous = {(r["payments"], r["operation"]): r for r in baseline["results"]}
+    lines = [f"{'payments':>9} {'operation':<24} {'time':>7} {'memory':>7} {'reads':>7} {'units':>7}"]
+    for result in report["results"]:
+        before = previous.get((result["payments"], result["operation"]))
+        if before:
+            ratios = [result[key] / before[key] if before.get(key) else float("nan")
+                      for key in ("seconds", "peak_bytes", "read_calls", "read_units")]
+            lines.append(f"{result['payments']:>9} {result['operation']:<24} " +
+                         " ".join(f"{ratio:6.2f}x" for ratio in ratios))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures the latency, the peak memory, the read calls and the estimated read units of the hot "
+                    "paths of the bot, on synthetic ledgers in moto's in-process DynamoDB. Unlike DynamoDB, moto "
+                    "does not split the results of a query in pages of 1 MB, hence the read calls of the big ledgers "
+                    "are a lower bound")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="numbers of payments of the ledgers, e.g. 1000 10000 100000 1000000")
+    parser.add_argument("--operations", nargs="+", help="operations to measure, all of them by default")
+    parser.add_argument("--output", default="ledger_benchmark.json", help="file of the results in JSON")
+    parser.add_argument("--baseline", help="results of a previous run to compare with, e.g. of another commit")
+    args = parser.parse_args()
+    benchmark = run(args.sizes, args.operations)
+    with open(args.output, "w") as f:
+        json.dump(benchmark, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(compare(benchmark, json.load(f)))
@@ -0,0 +1,23 @@
+import argparse
+import timeit
+
+import num2persian
+from test import num2persian_reference
+
+# Amounts of Toman as they are written in the wallets, and the largest numbers supported by both implementations
+AMOUNTS = ["0", "7", "250", "45000", "1250000", "987654321", "120000000000", "9" * 61]
+
+
+def main(number: int):
+    print(f"{'amount':>20} {'before (us)':>12} {'table (us)':>12} {'speedup':>8}")
+    for amount in AMOUNTS:
+        before = timeit.timeit(lambda: num2persian_reference.to_persian(amount), number=number) / number * 1e6
+        after = timeit.timeit(lambda: num2persian.to_persian(amount), number=number) / number * 1e6
+        label = amount if len(amount) <= 20 else f"{amount[:8]}...({len(amount)} digits)"
+        print(f"{label:>20} {before:12.2f} {after:12.2f} {before / after:7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the speed of num2persian with the implementation before")
+    parser.add_argument("--number", type=int, default=20000, help="conversions of every amount")
+    main(parser.parse_args().number)
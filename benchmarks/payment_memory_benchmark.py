@@ -0,0 +1,65 @@
+import argparse
+import gc
+import random
+import tracemalloc
+from typing import Callable, Dict, List
+
+from ledger_frame import LedgerFrame
+from payment import PersistedPayment
+
+DEFAULT_SIZES = [10 ** 4, 10 ** 5, 10 ** 6]
+WALLETS = [("Dollar", "$", 2), ("Euro", "€", 2), ("Toman", "T", 0)]
+PAYERS = ["Julia", "Jack"]
+
+
+def items(size: int) -> List[Dict]:
+    """Payments as the items of DynamoDB pages, one microsecond apart, with the amounts in minor units"""
+    rng = random.Random(size)
+    return [{"wallet": WALLETS[i % len(WALLETS)][0],
+             "timestamp": f"2020-01-01 00:{i // 10 ** 6:02d}:00.{i % 10 ** 6:06d}~0000",
+             "payer": rng.choice(PAYERS), "amount": rng.randint(1, 10 ** 7), "note": f"note {i % 100}"}
+            for i in range(size)]
+
+
+def to_payments(rows: List[Dict]) -> List[PersistedPayment]:
+    symbols = {wallet: symbol for wallet, symbol, _ in WALLETS}
+    return [PersistedPayment(row["payer"], str(row["amount"]), row["wallet"], symbols[row["wallet"]], row["note"],
+                             row["timestamp"][:19], row["timestamp"]) for row in rows]
+
+
+def to_frame(rows: List[Dict]) -> LedgerFrame:
+    frame = LedgerFrame()
+    wallet_ids = {wallet: frame.wallet_id(wallet, symbol, precision) for wallet, symbol, precision in WALLETS}
+    for row in rows:
+        frame.append(row["timestamp"], row["payer"], row["amount"], wallet_ids[row["wallet"]], row["note"])
+    return frame
+
+
+def retained(build: Callable[[List[Dict]], object], rows: List[Dict]) -> int:
+    # The bytes still allocated by the representation once it is built, the rows are allocated before
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    representation = build(rows)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del representation
+    return after - before
+
+
+def main(sizes: List[int]):
+    print(f"{'payments':>9} {'payments (B/row)':>17} {'frame (B/row)':>14} {'ratio':>6}")
+    for size in sizes:
+        rows = items(size)
+        payments = retained(to_payments, rows)
+        frame = retained(to_frame, rows)
+        print(f"{size:>9} {payments / size:17.1f} {frame / size:14.1f} {payments / frame:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures the memory kept by a ledger read as PersistedPayment objects and as a LedgerFrame. The "
+                    "keys and the notes of the payments are shared with the items they are read from, as they are "
+                    "when the items of a page are converted, hence only the representation itself is measured")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of payments")
+    main(parser.parse_args().sizes)
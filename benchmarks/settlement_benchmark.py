@@ -0,0 +1,61 @@
+import argparse
+import random
+import time
+from typing import Dict, List
+
+from ledger_frame import LedgerFrame
+from settlement import net_balances, settle
+
+DEFAULT_MEMBERS = [2, 10, 100, 500, 1000]
+DEFAULT_PAYMENTS = [10 ** 4, 10 ** 5, 10 ** 6]
+
+
+def ledger(members: List[str], size: int) -> List[tuple]:
+    """(key, payer, amount) rows of random payments of the members in a wallet, one microsecond apart, in minor units"""
+    rng = random.Random(size + len(members))
+    return [(f"2020-01-01 00:{i // 10 ** 6:02d}:00.{i % 10 ** 6:06d}~0000", rng.choice(members), rng.randint(1, 100000))
+            for i in range(size)]
+
+
+def measure(members: int, size: int, repeat: int) -> Dict:
+    names = [f"member{i}" for i in range(members)]
+    rows = ledger(names, size)
+
+    # The totals are what the balance aggregate of the wallet keeps, they are summed once by rebuild_balance and then
+    # updated by every payment, while /settle only reads them. rebuild_balance sums the pages as LedgerFrames
+    started = time.perf_counter()
+    frame = LedgerFrame()
+    wallet_id = frame.wallet_id("Dollar", "$", 2)
+    for key, payer, amount in rows:
+        frame.append(key, payer, amount, wallet_id, None)
+    totals = frame.totals()["Dollar"]
+    totals_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        transfers = settle(net_balances(totals, names))
+    settle_seconds = (time.perf_counter() - started) / repeat
+    return {"members": members, "payments": size, "totals_ms": totals_seconds * 1000,
+            "settle_ms": settle_seconds * 1000, "transfers": len(transfers)}
+
+
+def main(members: List[int], sizes: List[int], repeat: int):
+    print(f"{'members':>8} {'payments':>9} {'totals (ms)':>12} {'settle (ms)':>12} {'transfers':>10}")
+    for size in sizes:
+        for count in members:
+            result = measure(count, size, repeat)
+            print(f"{result['members']:>8} {result['payments']:>9} {result['totals_ms']:12.2f} "
+                  f"{result['settle_ms']:12.3f} {result['transfers']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures /settle on random ledgers: the sum of the totals of the members, done once when the "
+                    "balance aggregate is rebuilt, and the netting of the totals into transfers, done by every "
+                    "/settle. The netting does not depend on the length of the ledger, and makes at most N - 1 "
+                    "transfers for N members")
+    parser.add_argument("--members", type=int, nargs="+", default=DEFAULT_MEMBERS, help="numbers of members")
+    parser.add_argument("--payments", type=int, nargs="+", default=DEFAULT_PAYMENTS, help="lengths of the ledgers")
+    parser.add_argument("--repeat", type=int, default=100, help="runs of the netting, to average its time")
+    args = parser.parse_args()
+    main(args.members, args.payments, args.repeat)
@@ -0,0 +1,46 @@
+import argparse
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from archive import ArchiveStore, open_store
+from database import Database
+from registry import Registry
+
+# Payments older than this number of days are moved to the archive, they are not edited anymore
+DEFAULT_HOT_DAYS = 90
+
+
+def compact(registry: Registry, days: int = DEFAULT_HOT_DAYS, archive_store: Optional[ArchiveStore] = None,
+            now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Archives the payments older than `days` of every wallet of every group, and returns the number of archived
+    payments per wallet.
+    """
+    before = datetime.strftime((now or datetime.now()) - timedelta(days=days), "%Y-%m-%d %H:%M:%S")
+    archived = {}
+    for group in registry.get_groups():
+        config = registry.get_configuration(group)
+        database = Database(config, archive_store=archive_store)
+        for wallet in config.get_currencies():
+            archived[f"{group}/{wallet}" if group else wallet] = database.compact(wallet, before)
+    return archived
+
+
+def lambda_handler(event, context):
+    # Invoked on a schedule, see terraform/main.tf. The archive is configured by the ARCHIVE_URL variable
+    archived = compact(Registry(), int(event.get("days", DEFAULT_HOT_DAYS)))
+    # The Lambda runtime only logs the warnings and errors of the root logger by default
+    logging.getLogger().setLevel(logging.INFO)
+    logging.info("Archived payments: %s", archived)
+    return archived
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Moves the old payments of the wallets configured by JSON_CONFIG to compressed archive segments, "
+                    "and keeps their balances in a checkpoint per wallet")
+    parser.add_argument("--days", type=int, default=DEFAULT_HOT_DAYS, help="age of the payments to archive")
+    parser.add_argument("--archive", help="s3://bucket/prefix or a local directory, ARCHIVE_URL by default")
+    args = parser.parse_args()
+    print(compact(Registry(), args.days, open_store(args.archive) if args.archive else None))
@@ -1,84 +1,126 @@
 import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 import logging
 
+# Number of decimal digits of the amounts of a wallet, unless configured otherwise
+DEFAULT_PRECISION = 2
+MAX_PRECISION = 6
+
+# Minimum number of users sharing the wallets
+MIN_USERS = 2
+
 
 class Configuration:
 
-    def __init__(self):
-        data = json.loads(os.environ["JSON_CONFIG"])
-        logging.info(f'ENV VARIABLE JSON_CONFIG: {data}')
+    def __init__(self, data: Optional[Dict] = None):
+        """
+        Reads the configuration of the group from `data`, or from the JSON_CONFIG environment variable by default.
+        """
+        if data is None:
+            data = json.loads(os.environ["JSON_CONFIG"])
+            logging.info(f'ENV VARIABLE JSON_CONFIG: {data}')
         self.token = data['bot_token']
+        self._group: Optional[str] = data.get('group')
+        self._table: Optional[str] = data.get('table')
 
         # Initialize wallets
         self._wallets: List[Dict[str, str]] = data['wallets']
         currencies = [w['currency'] for w in self._wallets]
         if len(set(currencies)) < len(currencies):
             raise ConfigurationError('Configuration error: the wallet must have unique currency names.')
-
-        # Validate and initialize users
-        self._users = data['users']
-        if len(self._users) != 2:
+        for w in self._wallets:
+            precision = w.get('precision', DEFAULT_PRECISION)
+            if type(precision) != int or not 0 <= precision <= MAX_PRECISION:
+                raise ConfigurationError(
+                    f'Configuration error: precision of the wallets must be an int between 0 and {MAX_PRECISION}')
+
+        # Validate and initialize users, a wallet is shared by two or more of them
+        self._users: List[Dict] = data['users']
+        if len(self._users) < MIN_USERS:
             raise ConfigurationError(
-                f'Configuration error: number of configured users must be 2, while it is {len(self._users)}')
-        self._user1 = data['users'][0]
-        self._user2 = data['users'][1]
-        if 'name' not in self._user1 or 'name' not in self._user2:
+                f'Configuration error: number of configured users must be at least {MIN_USERS}, '
+                f'while it is {len(self._users)}')
+        if any('name' not in u for u in self._users):
             raise ConfigurationError('Configuration error: "name" not defined in at least one user.')
-        if 'chat_id' not in self._user1 or 'chat_id' not in self._user2:
+        if any('chat_id' not in u for u in self._users):
             raise ConfigurationError('Configuration error: "chat_id" not defined in at least one user.')
-        if self._user1['name'] == self._user2['name']:
-            raise ConfigurationError('Configuration error: usernames cannot be the same.')
-        if type(self._user1['name']) != str or type(self._user2['name']) != str:
+        if any(type(u['name']) != str for u in self._users):
             raise ConfigurationError('Type of the configured usernames is not str')
-        if type(self._user1['chat_id']) != int or type(self._user2['chat_id']) != int:
+        if any(type(u['chat_id']) != int for u in self._users):
             raise ConfigurationError('Type of the configured chat IDs is not int')
+        if len({u['name'] for u in self._users}) < len(self._users):
+            raise ConfigurationError('Configuration error: usernames cannot be the same.')
+        if len({u['chat_id'] for u in self._users}) < len(self._users):
+            raise ConfigurationError('Configuration error: chat IDs cannot be the same.')
+        # terraform names the table of a group after its two users, or after its deployment, see terraform/main.tf
+        if len(self._users) > 2 and not self._table:
+            raise ConfigurationError(
+                'Configuration error: a group of more than 2 users must set the "table" of its deployment, e.g. '
+                '"table-sw-<deployment>-payments" for the terraform variable deployment = "<deployment>"')
 
-        logging.info(f'Configured users: {self._user1["name"]} and {self._user2["name"]}')
-        logging.info(f'Configured user IDs: {self._user2["chat_id"]} and {self._user2["chat_id"]}')
+        logging.info(f'Configured users: {", ".join(u["name"] for u in self._users)}')
+        logging.info(f'Configured user IDs: {", ".join(str(u["chat_id"]) for u in self._users)}')
+
+        # Indexes of the lookups done for every update
+        self._wallets_by_currency = {w['currency']: w for w in self._wallets}
+        self._chat_ids_by_name = {u['name']: u['chat_id'] for u in self._users}
 
     def get_token(self) -> str:
         return self.token
 
+    def get_group(self) -> Optional[str]:
+        """Name of the group in a multi-tenant deployment, None for the deployments of a single group"""
+        return self._group
+
+    def get_table_name(self) -> str:
+        if self._table:
+            return self._table
+        return f"table-sw-{'-'.join(self.get_usernames()).lower()}-payments"
+
     def get_usernames(self) -> List[str]:
-        return [self._user1['name'], self._user2['name']]
+        return [u['name'] for u in self._users]
 
     def get_other_username(self, username: str) -> str:
-        if username == self._user1['name']:
-            return self._user2['name']
-        elif username == self._user2['name']:
-            return self._user1['name']
-        else:
+        """The other user of a wallet of two users"""
+        others = [u['name'] for u in self._users if u['name'] != username]
+        if len(others) != 1 or username not in self._chat_ids_by_name:
             raise ValueError(f'Unable to find other username of: {username}')
+        return others[0]
 
     def get_chat_ids(self) -> List[int]:
-        return [self._user1['chat_id'], self._user2['chat_id']]
+        return [u['chat_id'] for u in self._users]
 
     def get_chat_id(self, username) -> int:
-        if username == self._user1['name']:
-            return self._user1['chat_id']
-        elif username == self._user2['name']:
-            return self._user2['chat_id']
-        else:
+        if username not in self._chat_ids_by_name:
             raise ValueError(f'Unable to find other username of: {username}')
+        return self._chat_ids_by_name[username]
 
-    def get_other_chat_id(self, chat_id: int) -> str:
-        if chat_id == self._user1['chat_id']:
-            return self._user2['chat_id']
-        elif chat_id == self._user2['chat_id']:
-            return self._user1['chat_id']
-        else:
+    def get_other_chat_id(self, chat_id: int) -> int:
+        """The chat id of the other user of a wallet of two users"""
+        others = self.get_other_chat_ids(chat_id)
+        if len(others) != 1:
             raise ValueError(f'Unable to find other chat_id of: {chat_id}')
+        return others[0]
+
+    def get_other_chat_ids(self, chat_id: int) -> List[int]:
+        chat_ids = self.get_chat_ids()
+        if chat_id not in chat_ids:
+            raise ValueError(f'Unable to find other chat_id of: {chat_id}')
+        return [other for other in chat_ids if other != chat_id]
 
     def get_currencies(self) -> List[str]:
         return [w['currency'] for w in self._wallets]
 
     def get_wallet_symbol(self, currency: str) -> str:
-        for w in self._wallets:
-            if w['currency'] == currency:
-                return w['symbol']
-        raise ValueError(f'Unknown currency {currency}')
+        if currency not in self._wallets_by_currency:
+            raise ValueError(f'Unknown currency {currency}')
+        return self._wallets_by_currency[currency]['symbol']
+
+    def get_wallet_precision(self, currency: str) -> int:
+        if currency not in self._wallets_by_currency:
+            raise ValueError(f'Unknown currency {currency}')
+        return self._wallets_by_currency[currency].get('precision', DEFAULT_PRECISION)
 
 
 class ConfigurationError(ValueError):
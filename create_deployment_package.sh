@@ -1,20 +1,39 @@
 #!/bin/bash
+set -e
+# The report below is piped to tee, a failure of the import profile must still fail the build
+set -o pipefail
 
 current_dir=$(pwd)
 
-# Create a /tmp/random_dir and copy
+# Modules of the bot that the lambda function imports, the offline tools (get_history.py, migrate.py...) are left out
+modules="main.py payment.py num2persian.py configuration.py database.py export.py money.py ledger_cache.py persistence.py registry.py settlement.py sort_keys.py runtime.py webhook_reply.py metrics.py archive.py compaction.py ledger_frame.py update_log.py"
+
+# Create a /tmp/random_dir and install the runtime dependencies in it. boto3 is provided by the lambda runtime, and
+# pydantic is only used by get_history.py, hence requirements-lambda.txt only lists what main.lambda_handler needs
 tmp_dir=$(mktemp -d)
 echo "$tmp_dir"
-cp -r main.py payment.py num2persian.py configuration.py database.py requirements.txt "$tmp_dir"
+build_dir="$tmp_dir/package"
+python3.10 -m pip install --quiet --target "$build_dir" -r requirements-lambda.txt
+cp $modules "$build_dir"
+
+# Strip what the function never loads: tests, package metadata, executables and the bytecode of the build machine
+cd "$build_dir"
+find . -depth -type d \( -name tests -o -name test -o -name "*.dist-info" -o -name __pycache__ \) -exec rm -rf {} +
+rm -rf bin
+
+# Precompile for the runtime. The timestamps of the sources change when the archive is extracted, the unchecked
+# hash-based .pyc files are used anyway, so the cold starts do not compile the modules again
+python3.10 -m compileall -q --invalidation-mode unchecked-hash .
 
-cd "$tmp_dir"
-python3.10 -m venv venv
-source ./venv/bin/activate
-pip install -r requirements.txt
-deactivate
-cd venv/lib/python3.10/site-packages
-zip -r ../../../../my_deployment_package.zip .
-cd ../../../../
-zip my_deployment_package.zip main.py payment.py num2persian.py configuration.py database.py
+rm -f "$current_dir/my_deployment_package.zip"
+zip -q -r "$current_dir/my_deployment_package.zip" .
 
-cp my_deployment_package.zip "$current_dir"
+# Report the size of the package, and the cold import time of the function from the extracted package
+cd "$current_dir"
+extracted_dir="$tmp_dir/extracted"
+unzip -q my_deployment_package.zip -d "$extracted_dir"
+{
+  echo "Archive size: $(stat -c %s my_deployment_package.zip) bytes"
+  echo "Files: $(unzip -Z1 my_deployment_package.zip | grep -vc '/$')"
+  python3.10 import_profile.py --path "$extracted_dir" --no-site --top 5 "import main"
+} | tee deployment_package_report.txt
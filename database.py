@@ -1,94 +1,900 @@
-from dataclasses import dataclass
+import heapq
+import itertools
+import os
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from functools import cached_property
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
-from configuration import Configuration
+import money
+from archive import ARCHIVE_URL, ArchiveStore, decode_segment, encode_segment, open_store
+from configuration import DEFAULT_PRECISION, Configuration
+from ledger_cache import LedgerCache, LedgerEntry
+from ledger_frame import LedgerFrame
+from metrics import tracer
 from payment import Payment, PersistedPayment
+from settlement import net_balances
+from sort_keys import (
+    KeyClock, add_months, compact_key, date, end_of, expand_key, import_key, is_second_key, month
+)
+
+# Partition that keeps the balance aggregate of every wallet, the sort key of each item is the wallet name
+BALANCE_PARTITION = '#balance'
+
+# Partition that keeps the checkpoint of every wallet: the totals and the count of its archived payments, the
+# timestamp of the newest one, and the keys of the archive segments
+CHECKPOINT_PARTITION = '#checkpoint'
+
+# Index of the payments by payer: its partition key is the payer of the payment, prefixed like the partitions of the
+# table, and its sort key is the key of the payment
+PAYER_INDEX = 'payer-timestamp-index'
+PAYER_PARTITION = 'payer_partition'
+
+# Partition that keeps the monthly stats of every wallet, the sort key of each item is the wallet and the month, e.g.
+# 'Dollar#2024-01'. The item has the sum of the amounts and the number of the payments of every payer of the month.
+STATS_PARTITION = '#stats'
+STATS_SEPARATOR = '#'
+STATS_TOTAL_PREFIX = 'total:'
+STATS_COUNT_PREFIX = 'count:'
+
+# Maximum number of payments of an archive segment
+SEGMENT_ROWS = 10000
+
+# Separates the name of the group from the name of the partition, in the table shared by the groups
+GROUP_SEPARATOR = '/'
+
+# Number of attempts to write a payment when the balance aggregate is concurrently modified
+MAX_WRITE_ATTEMPTS = 5
+
+# Maximum number of payments kept by the ledger cache of a container, and the newest ones read to start caching a wallet
+CACHE_MAX_ROWS = 2000
+CACHE_SEED_ROWS = 50
+
+# Separates the key from the index of the wallet in the cursors of get_last_payments
+CURSOR_SEPARATOR = '.'
+
+# Number of payments of the frames yielded by iter_frames
+FRAME_ROWS = 10000
+
+# Maximum number of items of a DynamoDB batch write, and the attempts and initial backoff to write its unprocessed items
+MAX_BATCH_SIZE = 25
+MAX_BATCH_ATTEMPTS = 8
+BATCH_BACKOFF_SECONDS = 0.05
 
 
 @dataclass(frozen=True)
 class Balance:
+    # The member who paid the most and the one who paid the least, and the difference of what they paid
     creditor: str
     debtor: str
-    amount: str
+    # In minor units of the wallet, see money.to_major to format it
+    amount: int
+    # What every member is owed (or owes if negative) in minor units, see settlement.settle. With more than two members
+    # it is what they paid minus their equal share of the payments, with two it is +amount and -amount
+    nets: Dict[str, int] = field(default_factory=dict, compare=False)
+
+
+@dataclass(frozen=True)
+class MonthStats:
+    # The month, e.g. '2024-01'
+    month: str
+    # What every payer paid in the month in minor units of the wallet, and the number of their payments
+    totals: Dict[str, int]
+    counts: Dict[str, int]
+
+
+class PaymentExistsError(ValueError):
+    pass
+
+
+class PrecisionMismatchError(ValueError):
+    pass
 
 
 class Database:
 
-    def __init__(self, configuration: Configuration):
+    def __init__(self, configuration: Configuration, cache_max_rows: int = CACHE_MAX_ROWS,
+                 archive_store: Optional[ArchiveStore] = None, cache: Optional[LedgerCache] = None):
         self._configuration = configuration
-        dynamodb = boto3.resource("dynamodb")
-        self._table = dynamodb.Table(
-            f"table-sw-{'-'.join(configuration.get_usernames()).lower()}-payments"
-        )
+        # The databases of the groups of a container share its cache, the wallets are cached by their partitions
+        self._cache = cache if cache is not None else LedgerCache(cache_max_rows)
+        self._archive_store = archive_store
+        self._keys = KeyClock()
+        # Precision of the wallets removed from the configuration that still have payments, see _stored_wallets
+        self._removed_wallets: Dict[str, int] = {}
 
-    def add_payment(self, payment: Payment, timestamp: Optional[str] = None):
-        self._table.put_item(
-            Item={
-                "wallet": payment.wallet,
-                "timestamp": (
-                    datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
-                    if not timestamp
-                    else timestamp
-                ),
-                "payer": payment.payer,
-                "amount": payment.amount,
-                "note": payment.note,
-            }
+    @property
+    def table_name(self) -> str:
+        return self._configuration.get_table_name()
+
+    @cached_property
+    def _table(self):
+        # The DynamoDB resource is created on the first request, it is not needed to build the database
+        table = boto3.resource("dynamodb").Table(self.table_name)
+        tracer.trace_client(table.meta.client)
+        return table
+
+    @cached_property
+    def _archive(self) -> ArchiveStore:
+        # Only the full history and the compaction read or write the archive
+        if self._archive_store:
+            return self._archive_store
+        if ARCHIVE_URL not in os.environ:
+            raise RuntimeError(f"The archive of the payments is not configured, set {ARCHIVE_URL}")
+        return open_store(os.environ[ARCHIVE_URL])
+
+    @tracer.traced("Database.add_payment")
+    def add_payment(self, payment: Payment, timestamp: Optional[str] = None) -> Balance:
+        """
+        Writes the payment and returns the balance of its wallet right after it, without reading the wallet again.
+        The monthly stats of the wallet are updated by the same transaction.
+
+        The payment is written at a new key of sort_keys.KeyClock, unless `timestamp` gives its key, in which case
+        PaymentExistsError is raised if a payment of the wallet already has it.
+        """
+        item = self._payment_item(payment, timestamp)
+        # The payment and the balance aggregate of its wallet are written in one transaction. The aggregate is
+        # guarded by its version, so a concurrent write of the other user makes this one retry on the new version.
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            aggregate = self._get_balance_aggregate(payment.wallet)
+            totals = dict(aggregate["totals"])
+            totals[payment.payer] = totals.get(payment.payer, 0) + item["amount"]
+            try:
+                self._table.meta.client.transact_write_items(
+                    TransactItems=[
+                        {"Put": self._put_request(item, "attribute_not_exists(#ts)", {"#ts": "timestamp"})},
+                        {"Put": self._put_request(
+                            self._balance_item(payment.wallet, totals, aggregate["count"] + 1,
+                                               aggregate["version"] + 1),
+                            "#v = :v", {"#v": "version"}, {":v": aggregate["version"]},
+                        )},
+                        {"Update": self._stats_update(payment.wallet, item)},
+                    ]
+                )
+                self._update_cache(payment.wallet, aggregate["version"], item, totals)
+                return self._balance(totals)
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "TransactionCanceledException":
+                    raise
+                reasons = [r.get("Code") for r in e.response.get("CancellationReasons", [])]
+                if reasons and reasons[0] == "ConditionalCheckFailed":
+                    if not timestamp:
+                        # Another container wrote a payment with the same key, in the same microsecond
+                        item["timestamp"] = self._keys.next()
+                        continue
+                    raise PaymentExistsError(
+                        f'A payment already exists in wallet {payment.wallet} at {item["timestamp"]}'
+                    ) from e
+        raise RuntimeError(f"Unable to update the balance of wallet {payment.wallet} due to concurrent writes")
+
+    @tracer.traced("Database.add_payments")
+    def add_payments(self, payments: List[Tuple[Payment, str]]):
+        """
+        Writes up to 25 payments with a single batch write, retrying the unprocessed ones with exponential backoff.
+
+        Unlike add_payment, existing payments at the same timestamps are overwritten and neither the balance
+        aggregates nor the monthly stats are updated, hence rebuild_balance and rebuild_stats must be called for the
+        wallets once the bulk writes are done.
+        """
+        if len(payments) > MAX_BATCH_SIZE:
+            raise ValueError(f"At most {MAX_BATCH_SIZE} payments can be written in a batch, not {len(payments)}")
+        self._batch_write(
+            [{"PutRequest": {"Item": self._payment_item(payment, timestamp)}} for payment, timestamp in payments]
         )
 
-    def get_payments(self, wallet: str = None) -> List[PersistedPayment]:
-        payments: List[PersistedPayment] = []
+    @tracer.traced("Database.get_payments")
+    def get_payments(
+        self, wallet: str = None, archived: bool = False, since: Optional[str] = None, until: Optional[str] = None,
+        payer: Optional[str] = None,
+    ) -> List[PersistedPayment]:
+        return list(self.iter_payments(wallet, archived=archived, since=since, until=until, payer=payer))
+
+    def iter_payments(
+        self, wallet: str = None, page_size: Optional[int] = None, projection: Optional[List[str]] = None,
+        archived: bool = False, since: Optional[str] = None, until: Optional[str] = None, payer: Optional[str] = None,
+    ) -> Iterator[PersistedPayment]:
+        """
+        Lazily yields the payments of the wallet, or of all the wallets, in the order of their timestamps.
+
+        Every wallet is read page by page, and the wallets are merged as their pages arrive, so that at most one
+        page per wallet is held in memory. `projection` limits the read attributes to the given ones (the keys
+        are always read), the attributes left out are None in the yielded payments. The payments moved to the
+        archive by compact are only yielded if `archived` is set, the segments of a wallet are merged.
+
+        `since` and `until` limit the payments to the keys between them, both included, e.g. '2024-03' and
+        '2024-03-15' for the first half of March: they are conditions of the queries, the payments out of them are
+        not read. The payments of `payer` are read from the payer index, in a single query for all the wallets.
+        """
+        for item in self._iter_merged_items(wallet, page_size, projection, archived, since, until, payer):
+            yield self._to_payment(item)
+
+    @tracer.traced("Database.get_frame")
+    def get_frame(self, wallet: str = None, archived: bool = False, notes: bool = True) -> LedgerFrame:
+        """Returns the payments of the wallet, or of all the wallets, as one LedgerFrame"""
+        return next(self.iter_frames(wallet, None, archived, notes))
+
+    def iter_frames(
+        self, wallet: str = None, rows: Optional[int] = FRAME_ROWS, archived: bool = False, notes: bool = True,
+        since: Optional[str] = None, until: Optional[str] = None,
+    ) -> Iterator[LedgerFrame]:
+        """
+        Lazily yields the payments of iter_payments as LedgerFrames of at most `rows` payments (all of them if None),
+        filled from the items of the pages without a payment object per item. The notes are not read unless `notes`
+        is set, e.g. to sum the amounts.
+        """
+        projection = None if notes else ["payer", "amount"]
+        items = self._iter_merged_items(wallet, None, projection, archived, since, until)
+        while True:
+            frame = self._frame(itertools.islice(items, rows))
+            if frame or rows is None:
+                yield frame
+            if not frame or rows is None or len(frame) < rows:
+                return
+
+    def _iter_merged_items(
+        self, wallet: Optional[str], page_size: Optional[int], projection: Optional[List[str]], archived: bool,
+        since: Optional[str] = None, until: Optional[str] = None, payer: Optional[str] = None,
+    ) -> Iterator[Dict]:
+        if since and until and since > until:
+            raise ValueError(f"The start {since} is after the end {until}")
+        if payer:
+            if archived:
+                raise ValueError("The payer index only has the payments of the table, not the archived ones")
+            return self._iter_items(wallet, page_size, projection, since=since, until=until, payer=payer)
         if wallet:
-            response = self._table.query(
-                KeyConditionExpression=Key("wallet").eq(wallet)
-            )
+            wallets = [wallet]
         else:
-            response = self._table.scan()
+            # The full history has the payments of the wallets removed from the configuration as well
+            wallets = self._stored_wallets() if archived else self._configuration.get_currencies()
+        read = self._iter_all_items if archived else self._iter_items
+        pages = [read(w, page_size, projection, since=since, until=until) for w in wallets]
+        return pages[0] if len(pages) == 1 else heapq.merge(*pages, key=lambda x: x["timestamp"])
+
+    def _stored_wallets(self) -> List[str]:
+        """
+        The configured wallets followed by the wallets removed from the configuration, whose payments are still in
+        the table or the archive. The wallets are listed from their balance aggregates, which keep their precision.
+        """
+        configured = self._configuration.get_currencies()
+        for item in self._iter_items(BALANCE_PARTITION, None, ["precision"]):
+            if item["timestamp"] not in configured:
+                self._removed_wallets[item["timestamp"]] = int(item.get("precision", DEFAULT_PRECISION))
+        return configured + [wallet for wallet in self._removed_wallets if wallet not in configured]
+
+    def _wallet_precision(self, wallet: str) -> int:
+        if wallet in self._removed_wallets:
+            return self._removed_wallets[wallet]
+        return self._configuration.get_wallet_precision(wallet)
+
+    def _wallet_symbol(self, wallet: str) -> str:
+        # The symbol of a removed wallet is not stored, its name stands for it
+        if wallet in self._removed_wallets:
+            return wallet
+        return self._configuration.get_wallet_symbol(wallet)
 
-        sorted_response = sorted(
-            response.get("Items", []),
-            key=lambda x: datetime.strptime(x.get("timestamp"), "%Y-%m-%d %H:%M:%S"),
+    def _iter_items(
+        self, wallet: Optional[str], page_size: Optional[int], projection: Optional[List[str]],
+        after: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+        payer: Optional[str] = None,
+    ) -> Iterator[Dict]:
+        for page in self._iter_pages(wallet, page_size, projection, after, since, until, payer):
+            yield from page
+
+    def _iter_all_items(
+        self, wallet: str, page_size: Optional[int], projection: Optional[List[str]], since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Iterator[Dict]:
+        checkpoint = self._get_checkpoint(wallet)
+        items = self._iter_items(wallet, page_size, projection, since=since, until=until)
+        if not checkpoint or not checkpoint["segments"]:
+            return items
+        # The segments of a compaction follow each other, but payments imported before a later compaction may be
+        # older than the ones of the former segments
+        archived = heapq.merge(
+            *(decode_segment(self._archive.get(key)) for key in checkpoint["segments"]), key=lambda x: x["timestamp"]
         )
-        for item in sorted_response:
-            payments.append(
-                PersistedPayment(
-                    item.get("payer"),
-                    item.get("amount"),
-                    item.get("wallet"),
-                    self._configuration.get_wallet_symbol(item.get("wallet")),
-                    item.get("note"),
-                    item.get("timestamp"),
+        if since or until:
+            # The segments are not indexed, their payments out of the range are skipped as they are read
+            archived = (item for item in archived if (not since or item["timestamp"] >= since)
+                        and (not until or item["timestamp"] <= end_of(until)))
+        if "pending" in checkpoint:
+            # The payments of the pending segment may not be deleted from the table yet
+            pending = {item["timestamp"] for item in decode_segment(self._archive.get(checkpoint["pending"]))}
+            items = (item for item in items if item["timestamp"] not in pending)
+        # Payments imported after the compaction may be older than the archived ones
+        return heapq.merge(archived, items, key=lambda x: x["timestamp"])
+
+    def _iter_pages(
+        self, wallet: Optional[str], page_size: Optional[int], projection: Optional[List[str]],
+        after: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+        payer: Optional[str] = None,
+    ) -> Iterator[List[Dict]]:
+        # The items of a wallet, or of a payer in the index, are returned in the order of their sort key
+        if payer:
+            kwargs = {"IndexName": PAYER_INDEX,
+                      "KeyConditionExpression": Key(PAYER_PARTITION).eq(self._partition(payer))}
+            if wallet:
+                # The payments of the other wallets are read too, but not returned
+                kwargs["FilterExpression"] = Attr("wallet").eq(self._partition(wallet))
+        else:
+            kwargs = {"KeyConditionExpression": Key("wallet").eq(self._partition(wallet))}
+        if after:
+            # Only the payments after the given timestamp, as they were just written they are read consistently
+            kwargs["KeyConditionExpression"] &= Key("timestamp").gt(after)
+            kwargs["ConsistentRead"] = True
+        elif since and until:
+            kwargs["KeyConditionExpression"] &= Key("timestamp").between(since, end_of(until))
+        elif since:
+            kwargs["KeyConditionExpression"] &= Key("timestamp").gte(since)
+        elif until:
+            kwargs["KeyConditionExpression"] &= Key("timestamp").lte(end_of(until))
+        if page_size:
+            kwargs["Limit"] = page_size
+        if projection is not None:
+            # An empty projection only reads the keys, e.g. to find the payments that exist
+            attributes = set(projection) | {"wallet", "timestamp"}
+            names = {f"#a{i}": attribute for i, attribute in enumerate(sorted(attributes))}
+            kwargs["ProjectionExpression"] = ", ".join(names)
+            kwargs["ExpressionAttributeNames"] = names
+        while True:
+            response = self._table.query(**kwargs)
+            yield response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @tracer.traced("Database.get_last_payments")
+    def get_last_payments(
+        self, count: int, cursor: Optional[str] = None, payer: Optional[str] = None
+    ) -> Tuple[List[PersistedPayment], Optional[str]]:
+        """
+        Returns the last `count` payments of all the wallets in the order of their timestamps, and the cursor to
+        pass for the ones before them (None if there are none). Only the payments of `payer` if it is given.
+
+        Every wallet is read with a single reverse query of at most `count` items, so the cost depends on `count`
+        rather than on the size of the history. The payments of a payer are read with a single reverse query of the
+        payer index for all the wallets.
+        """
+        position = self._decode_cursor(cursor) if cursor else None
+        if payer:
+            return self._get_last_payer_payments(count, position, payer)
+        wallets = self._configuration.get_currencies()
+        entries = self._sync(wallets)
+        pages, more = [], False
+        for wallet in wallets:
+            # The cached payments serve the page if they go back far enough, or if they are all the payments
+            entry = entries[wallet]
+            rows = entry.rows if not position else [r for r in entry.rows if (r["timestamp"], wallet) < position]
+            if len(rows) >= count or entry.complete:
+                pages.append(list(reversed(rows[-count:])))
+                more = more or len(rows) > count or not entry.complete
+                continue
+            kwargs = {
+                "KeyConditionExpression": Key("wallet").eq(self._partition(wallet)), "ScanIndexForward": False,
+                "Limit": count,
+            }
+            if position:
+                # Payments are ordered by (timestamp, wallet), the ones at the same second as the cursor are
+                # before it only if their wallet is before the wallet of the cursor.
+                timestamp, last_wallet = position
+                timestamp_key = Key("timestamp")
+                kwargs["KeyConditionExpression"] &= (
+                    timestamp_key.lte(timestamp) if wallet < last_wallet else timestamp_key.lt(timestamp)
                 )
-            )
-        return payments
+            response = self._table.query(**kwargs)
+            pages.append(response.get("Items", []))
+            more = more or "LastEvaluatedKey" in response
+
+        merged = list(heapq.merge(*pages, key=lambda x: (x["timestamp"], x["wallet"]), reverse=True))
+        items = merged[:count]
+        more = more or len(merged) > count
+        next_cursor = self._encode_cursor(items[-1]["timestamp"], self._wallet(items[-1])) if items and more else None
+        return [self._to_payment(item) for item in reversed(items)], next_cursor
+
+    def _get_last_payer_payments(
+        self, count: int, position: Optional[Tuple[str, str]], payer: str
+    ) -> Tuple[List[PersistedPayment], Optional[str]]:
+        kwargs = {
+            "IndexName": PAYER_INDEX, "KeyConditionExpression": Key(PAYER_PARTITION).eq(self._partition(payer)),
+            "ScanIndexForward": False, "Limit": count,
+        }
+        if position:
+            # The cursor is the last shown payment, the query of the index continues right after it
+            timestamp, wallet = position
+            kwargs["ExclusiveStartKey"] = {
+                PAYER_PARTITION: self._partition(payer), "timestamp": timestamp, "wallet": self._partition(wallet)
+            }
+        response = self._table.query(**kwargs)
+        items = response.get("Items", [])
+        next_cursor = self._encode_cursor(items[-1]["timestamp"], self._wallet(items[-1])) \
+            if items and "LastEvaluatedKey" in response else None
+        return [self._to_payment(item) for item in reversed(items)], next_cursor
 
+    @tracer.traced("Database.get_balance")
     def get_balance(self, wallet: str) -> Balance:
-        user1, balance1 = self._configuration.get_usernames()[0], 0
-        for payment in self.get_payments(wallet):
-            balance1 = (
-                balance1 + float(payment.amount)
-                if payment.payer == user1
-                else balance1 - float(payment.amount)
-            )
-        if balance1 == 0:
-            return Balance(
-                creditor=user1,
-                debtor=self._configuration.get_other_username(user1),
-                amount="0",
-            )
-        elif balance1 > 0:
-            return Balance(
-                creditor=user1,
-                debtor=self._configuration.get_other_username(user1),
-                amount=str(round(balance1, 2)).rstrip("0").rstrip("."),
+        return self._balance(self._sync([wallet])[wallet].totals)
+
+    @tracer.traced("Database.rebuild_balance")
+    def rebuild_balance(self, wallet: str) -> Dict:
+        """
+        Recomputes the balance aggregate of the wallet from its payments, e.g. when it is missing or stale.
+        """
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            current = self._get_balance_item(wallet)
+            # The archived payments are summed up by the checkpoint, only the payments in the table are read
+            checkpoint = self._get_checkpoint(wallet)
+            if checkpoint and "pending" in checkpoint:
+                self._delete_segment(wallet, list(decode_segment(self._archive.get(checkpoint["pending"]))))
+            totals: Dict[str, int] = {
+                payer: int(amount) for payer, amount in checkpoint["totals"].items()
+            } if checkpoint else {}
+            count = int(checkpoint["count"]) if checkpoint else 0
+            for page in self._iter_pages(wallet, None, ["payer", "amount"]):
+                # Every page is reduced at once, as columns of payer ids and integer amounts
+                for payer, amount in self._frame(page).totals().get(wallet, {}).items():
+                    totals[payer] = totals.get(payer, 0) + amount
+                count += len(page)
+            aggregate = self._balance_item(wallet, totals, count, current["version"] + 1 if current else 1)
+            try:
+                if current:
+                    self._table.put_item(Item=aggregate, ConditionExpression="#v = :v",
+                                         ExpressionAttributeNames={"#v": "version"},
+                                         ExpressionAttributeValues={":v": current["version"]})
+                else:
+                    self._table.put_item(Item=aggregate, ConditionExpression="attribute_not_exists(#v)",
+                                         ExpressionAttributeNames={"#v": "version"})
+                return aggregate
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+        raise RuntimeError(f"Unable to rebuild the balance of wallet {wallet} due to concurrent writes")
+
+    @tracer.traced("Database.get_stats")
+    def get_stats(self, wallet: str, months: int, until: Optional[str] = None) -> List[MonthStats]:
+        """
+        Returns the stats of the wallet in the `months` months up to `until`, e.g. '2024-12', or the current month.
+        The months without payments are left out.
+
+        The stats are read with a single query of at most `months` items, whatever the number of payments.
+        """
+        until = until or datetime.now().strftime("%Y-%m")
+        response = self._table.query(
+            KeyConditionExpression=Key("wallet").eq(self._partition(STATS_PARTITION)) & Key("timestamp").between(
+                self._stats_key(wallet, add_months(until, 1 - months)), self._stats_key(wallet, until)
+            ),
+            ConsistentRead=True,
+        )
+        return [self._to_month_stats(item) for item in response.get("Items", [])]
+
+    @tracer.traced("Database.rebuild_stats")
+    def rebuild_stats(self, wallet: str = None) -> int:
+        """
+        Recomputes the monthly stats of the wallet, or of all the wallets, from all their payments including the
+        archived ones, e.g. for the payments written before the stats or by add_payments. Returns the number of
+        months with payments.
+
+        The payments written by add_payment while the stats are rebuilt may be counted twice or not at all, the
+        rebuild is meant to be run when the wallet is not used, like the migrations.
+        """
+        if not wallet:
+            return sum(self.rebuild_stats(w) for w in self._configuration.get_currencies())
+        months: Dict[str, Dict[str, List[int]]] = {}
+        for frame in self.iter_frames(wallet, archived=True, notes=False):
+            for key_month, rollups in frame.monthly_totals().get(wallet, {}).items():
+                for payer, (total, count) in rollups.items():
+                    rollup = months.setdefault(key_month, {}).setdefault(payer, [0, 0])
+                    rollup[0] += total
+                    rollup[1] += count
+        stale = self._table.query(
+            KeyConditionExpression=Key("wallet").eq(self._partition(STATS_PARTITION))
+            & Key("timestamp").begins_with(f"{wallet}{STATS_SEPARATOR}"),
+            ProjectionExpression="#w, #ts", ExpressionAttributeNames={"#w": "wallet", "#ts": "timestamp"},
+        ).get("Items", [])
+        requests = [{"DeleteRequest": {"Key": item}} for item in stale
+                    if item["timestamp"].rsplit(STATS_SEPARATOR, 1)[1] not in months]
+        for key_month, rollups in months.items():
+            item = {"wallet": self._partition(STATS_PARTITION), "timestamp": self._stats_key(wallet, key_month)}
+            for payer, (total, count) in rollups.items():
+                item[f"{STATS_TOTAL_PREFIX}{payer}"] = total
+                item[f"{STATS_COUNT_PREFIX}{payer}"] = count
+            requests.append({"PutRequest": {"Item": item}})
+        self._batch_write(requests)
+        return len(months)
+
+    @tracer.traced("Database.compact")
+    def compact(self, wallet: str, before: str, segment_rows: int = SEGMENT_ROWS) -> int:
+        """
+        Moves the payments of the wallet before the timestamp to archive segments of at most `segment_rows`
+        payments, and adds them to the checkpoint of the wallet. Returns the number of archived payments.
+
+        Every segment is written to the archive, then to the checkpoint as pending, and only then deleted from the
+        table. The payments of a pending segment, e.g. because the compaction was interrupted, are deleted by the
+        next compaction before it archives any other payment.
+        """
+        checkpoint = self._get_checkpoint(wallet)
+        if checkpoint and "pending" in checkpoint:
+            self._delete_segment(wallet, list(decode_segment(self._archive.get(checkpoint["pending"]))))
+        archived = 0
+        while True:
+            response = self._table.query(
+                KeyConditionExpression=Key("wallet").eq(self._partition(wallet)) & Key("timestamp").lt(before),
+                Limit=segment_rows, ConsistentRead=True,
             )
+            items = response.get("Items", [])
+            if not items:
+                return archived
+            segments = list(checkpoint["segments"]) if checkpoint else []
+            key = f"{self.table_name}/{self._partition(wallet)}/{len(segments):06d}.ndjson.gz"
+            self._archive.put(key, encode_segment(items))
+            totals = {payer: int(amount) for payer, amount in checkpoint["totals"].items()} if checkpoint else {}
+            for payer, amount in self._frame(items).totals().get(wallet, {}).items():
+                totals[payer] = totals.get(payer, 0) + amount
+            checkpoint = self._put_checkpoint(wallet, checkpoint, {
+                "totals": totals,
+                "count": (int(checkpoint["count"]) if checkpoint else 0) + len(items),
+                "until": max(items[-1]["timestamp"], checkpoint["until"] if checkpoint else ""),
+                "segments": segments + [key],
+                "pending": key,
+            })
+            self._delete_segment(wallet, items)
+            archived += len(items)
+
+    @tracer.traced("Database.migrate_keys")
+    def migrate_keys(self) -> int:
+        """
+        Moves the payments whose keys are only the second, e.g. '2024-01-01 10:00:00', to the keys of sort_keys, the
+        ones an import of the same history would write. Returns the number of moved payments.
+
+        Every page of payments is moved with batch writes of the new items and deletions of the old ones. A
+        migration that was interrupted moves the rest when it is run again, the new items are only overwritten.
+        """
+        moved = 0
+        for wallet in self._configuration.get_currencies():
+            for page in self._iter_pages(wallet, None, None):
+                items = [item for item in page if is_second_key(item["timestamp"])]
+                requests = []
+                for item in items:
+                    requests.append({"PutRequest": {"Item": {**item, "timestamp": import_key(item["timestamp"], 0)}}})
+                    requests.append({"DeleteRequest": {"Key": {"wallet": item["wallet"],
+                                                               "timestamp": item["timestamp"]}}})
+                self._batch_write(requests)
+                moved += len(items)
+        return moved
+
+    @tracer.traced("Database.migrate_payers")
+    def migrate_payers(self) -> int:
+        """
+        Adds the payer partition to the payments written before the payer index, so that the index has them too.
+        Returns the number of updated payments.
+        """
+        updated = 0
+        for wallet in self._configuration.get_currencies():
+            for page in self._iter_pages(wallet, None, None):
+                items = [item for item in page if PAYER_PARTITION not in item]
+                self._batch_write([
+                    {"PutRequest": {"Item": {**item, PAYER_PARTITION: self._partition(item["payer"])}}}
+                    for item in items
+                ])
+                updated += len(items)
+        return updated
+
+    @tracer.traced("Database.migrate_amounts")
+    def migrate_amounts(self) -> int:
+        """
+        Converts the amounts that are stored as decimal strings, e.g. '12.50', to integer minor units, and
+        rebuilds the balances of the wallets. Returns the number of converted payments.
+        """
+        converted = 0
+        for wallet in self._configuration.get_currencies():
+            precision = self._configuration.get_wallet_precision(wallet)
+            for item in self._iter_items(wallet, None, ["amount"]):
+                if not isinstance(item.get("amount"), str):
+                    continue
+                try:
+                    self._table.update_item(
+                        Key={"wallet": item["wallet"], "timestamp": item["timestamp"]},
+                        UpdateExpression="SET #a = :minor",
+                        ConditionExpression="#a = :amount",
+                        ExpressionAttributeNames={"#a": "amount"},
+                        ExpressionAttributeValues={
+                            ":minor": money.to_minor(item["amount"], precision), ":amount": item["amount"]
+                        },
+                    )
+                    converted += 1
+                except ClientError as e:
+                    # The payment was converted concurrently
+                    if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                        raise
+            self.rebuild_balance(wallet)
+        return converted
+
+    def _payment_item(self, payment: Payment, timestamp: Optional[str] = None) -> Dict:
+        return {
+            "wallet": self._partition(payment.wallet),
+            "timestamp": timestamp or self._keys.next(),
+            "payer": payment.payer,
+            PAYER_PARTITION: self._partition(payment.payer),
+            "amount": money.to_minor(payment.amount, self._configuration.get_wallet_precision(payment.wallet)),
+            "note": payment.note,
+        }
+
+    def _stats_update(self, wallet: str, item: Dict) -> Dict:
+        # Adds the payment to the stats of its month, the item of the month is created by its first payment
+        return {
+            "TableName": self._table.name,
+            "Key": {"wallet": self._partition(STATS_PARTITION),
+                    "timestamp": self._stats_key(wallet, month(item["timestamp"]))},
+            "UpdateExpression": "ADD #t :amount, #c :one",
+            "ExpressionAttributeNames": {"#t": f"{STATS_TOTAL_PREFIX}{item['payer']}",
+                                         "#c": f"{STATS_COUNT_PREFIX}{item['payer']}"},
+            "ExpressionAttributeValues": {":amount": item["amount"], ":one": 1},
+        }
+
+    @staticmethod
+    def _stats_key(wallet: str, key_month: str) -> str:
+        return f"{wallet}{STATS_SEPARATOR}{key_month}"
+
+    @staticmethod
+    def _to_month_stats(item: Dict) -> MonthStats:
+        totals, counts = {}, {}
+        for attribute, value in item.items():
+            if attribute.startswith(STATS_TOTAL_PREFIX):
+                totals[attribute[len(STATS_TOTAL_PREFIX):]] = int(value)
+            elif attribute.startswith(STATS_COUNT_PREFIX):
+                counts[attribute[len(STATS_COUNT_PREFIX):]] = int(value)
+        return MonthStats(month=item["timestamp"].rsplit(STATS_SEPARATOR, 1)[1], totals=totals, counts=counts)
+
+    def _get_checkpoint(self, wallet: str) -> Optional[Dict]:
+        response = self._table.get_item(
+            Key={"wallet": self._partition(CHECKPOINT_PARTITION), "timestamp": wallet}, ConsistentRead=True
+        )
+        return response.get("Item")
+
+    def _put_checkpoint(self, wallet: str, current: Optional[Dict], attributes: Dict) -> Dict:
+        # Guarded by its version, like the balance aggregate, so that two compactions cannot both archive a segment
+        version = int(current["version"]) if current else 0
+        checkpoint = {
+            "wallet": self._partition(CHECKPOINT_PARTITION), "timestamp": wallet, **attributes, "version": version + 1
+        }
+        if current:
+            self._table.put_item(Item=checkpoint, ConditionExpression="#v = :v",
+                                 ExpressionAttributeNames={"#v": "version"}, ExpressionAttributeValues={":v": version})
+        else:
+            self._table.put_item(Item=checkpoint, ConditionExpression="attribute_not_exists(#v)",
+                                 ExpressionAttributeNames={"#v": "version"})
+        return checkpoint
+
+    def _delete_segment(self, wallet: str, items: List[Dict]):
+        self._batch_write(
+            [{"DeleteRequest": {"Key": {"wallet": item["wallet"], "timestamp": item["timestamp"]}}} for item in items]
+        )
+        self._table.update_item(
+            Key={"wallet": self._partition(CHECKPOINT_PARTITION), "timestamp": wallet},
+            UpdateExpression="REMOVE #p", ExpressionAttributeNames={"#p": "pending"},
+        )
+
+    def _batch_write(self, requests: List[Dict]):
+        # Batches of at most 25 requests, retrying the unprocessed ones with exponential backoff
+        for start in range(0, len(requests), MAX_BATCH_SIZE):
+            batch = {self._table.name: requests[start:start + MAX_BATCH_SIZE]}
+            for attempt in range(MAX_BATCH_ATTEMPTS):
+                if not batch:
+                    break
+                if attempt:
+                    time.sleep(BATCH_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                batch = self._table.meta.client.batch_write_item(RequestItems=batch).get("UnprocessedItems")
+            if batch:
+                raise RuntimeError(f"Unable to write {len(batch[self._table.name])} items after "
+                                   f"{MAX_BATCH_ATTEMPTS} attempts")
+
+    def _frame(self, items: Iterable[Dict]) -> LedgerFrame:
+        frame = LedgerFrame()
+        wallets: Dict[str, Tuple[int, int]] = {}
+        for item in items:
+            if item["wallet"] not in wallets:
+                wallet = self._wallet(item)
+                precision = self._wallet_precision(wallet)
+                wallets[item["wallet"]] = (frame.wallet_id(wallet, self._wallet_symbol(wallet), precision), precision)
+            wallet_id, precision = wallets[item["wallet"]]
+            frame.append(item["timestamp"], item["payer"], self._minor_amount(item["amount"], precision), wallet_id,
+                         item.get("note"))
+        return frame
+
+    def _to_payment(self, item: Dict) -> PersistedPayment:
+        wallet = self._wallet(item)
+        amount = item.get("amount")
+        if amount is not None and not isinstance(amount, str):
+            amount = money.to_major(int(amount), self._wallet_precision(wallet))
+        return PersistedPayment(
+            item.get("payer"),
+            amount,
+            wallet,
+            self._wallet_symbol(wallet),
+            item.get("note"),
+            date(item["timestamp"]),
+            item["timestamp"],
+        )
+
+    def _partition(self, name: str) -> str:
+        # In a multi-tenant deployment the partitions of every group are prefixed by the name of the group
+        group = self._configuration.get_group()
+        return f"{group}{GROUP_SEPARATOR}{name}" if group else name
+
+    def _wallet(self, item: Dict) -> str:
+        wallet = item["wallet"]
+        return wallet.split(GROUP_SEPARATOR, 1)[1] if self._configuration.get_group() else wallet
+
+    def _encode_cursor(self, timestamp: str, wallet: str) -> str:
+        # The cursors are the data of Telegram buttons, which is limited to 64 bytes: the key without its separators
+        # and the index of the wallet, e.g. '20240101100000123456~3f9a.0'
+        return f"{compact_key(timestamp)}{CURSOR_SEPARATOR}{self._configuration.get_currencies().index(wallet)}"
+
+    def _decode_cursor(self, cursor: str) -> Tuple[str, str]:
+        try:
+            key, wallet = cursor.split(CURSOR_SEPARATOR)
+            return expand_key(key), self._configuration.get_currencies()[int(wallet)]
+        except (ValueError, IndexError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+    def _sync(self, wallets: List[str]) -> Dict[str, LedgerEntry]:
+        """
+        Brings the cached ledgers of the wallets up to date with their balance aggregates, which are read at once.
+
+        A wallet whose aggregate has the cached version is a hit. Otherwise only the payments after the last seen
+        timestamp are read, unless fewer than the new ones in the aggregate show up, e.g. because an import wrote
+        older ones, in which case the wallet is cached again from its newest payments.
+        """
+        aggregates = self._get_balance_items(wallets)
+        entries = {}
+        for wallet in wallets:
+            aggregate = aggregates.get(wallet)
+            if not aggregate or "precision" not in aggregate:
+                aggregate = self.rebuild_balance(wallet)
+            self._check_precision(wallet, aggregate)
+            totals = {payer: int(amount) for payer, amount in aggregate["totals"].items()}
+            entry = self._cache.get(self._partition(wallet))
+            if entry and entry.version == aggregate["version"]:
+                self._cache.hits += 1
+            elif entry and self._sync_delta(wallet, entry, aggregate):
+                self._cache.deltas += 1
+                entry.version, entry.totals = aggregate["version"], totals
+            else:
+                self._cache.misses += 1
+                entry = self._seed(wallet, aggregate, totals)
+            entries[wallet] = entry
+        return entries
+
+    def _sync_delta(self, wallet: str, entry: LedgerEntry, aggregate: Dict) -> bool:
+        # A wallet cached while it was empty has no key to read after, DynamoDB refuses an empty key in a condition
+        if not entry.last_seen:
+            return False
+        rows = list(self._iter_items(wallet, None, None, after=entry.last_seen))
+        # Payments written after the aggregate was read may show up as well, they are in the next version
+        if entry.count + len(rows) < aggregate["count"]:
+            return False
+        # The cached payments were migrated to new keys, which sort after their old keys
+        if rows and is_second_key(entry.last_seen) and rows[0]["timestamp"] == import_key(entry.last_seen, 0):
+            return False
+        entry.count += len(rows)
+        if rows:
+            entry.last_seen = rows[-1]["timestamp"]
+            self._cache.append(self._partition(wallet), rows)
+        return True
+
+    def _seed(self, wallet: str, aggregate: Dict, totals: Dict[str, int]) -> LedgerEntry:
+        response = self._table.query(
+            KeyConditionExpression=Key("wallet").eq(self._partition(wallet)), ScanIndexForward=False,
+            Limit=CACHE_SEED_ROWS,
+            ConsistentRead=True,
+        )
+        rows = list(reversed(response.get("Items", [])))
+        complete = "LastEvaluatedKey" not in response
+        entry = LedgerEntry(
+            version=aggregate["version"],
+            count=int(aggregate["count"]),
+            totals=totals,
+            rows=rows,
+            complete=complete,
+            last_seen=rows[-1]["timestamp"] if rows else "",
+        )
+        self._cache.put(self._partition(wallet), entry)
+        return entry
+
+    def _update_cache(self, wallet: str, version: int, item: Dict, totals: Dict[str, int]):
+        # The payment is applied to the cached ledger if it was in sync with the aggregate the payment was based on
+        entry = self._cache.get(self._partition(wallet))
+        if not entry:
+            return
+        if entry.version == version and item["timestamp"] > entry.last_seen:
+            entry.version, entry.count, entry.totals = version + 1, entry.count + 1, dict(totals)
+            entry.last_seen = item["timestamp"]
+            self._cache.append(self._partition(wallet), [item])
+        else:
+            self._cache.invalidate(self._partition(wallet))
+
+    def _balance(self, totals: Dict[str, int]) -> Balance:
+        members = self._configuration.get_usernames()
+        totals = {member: int(amount) for member, amount in totals.items()}
+        # The first member is the creditor when they all paid the same, like the first of two users
+        creditor = max(members, key=lambda member: totals.get(member, 0))
+        debtor = min(reversed(members), key=lambda member: totals.get(member, 0))
+        amount = int(totals.get(creditor, 0) - totals.get(debtor, 0))
+        if len(members) > 2:
+            # The payments of the whole history are shared equally, including the ones before a member joined
+            nets = net_balances(totals, members)
         else:
-            return Balance(
-                creditor=self._configuration.get_other_username(user1),
-                debtor=user1,
-                amount=str(round(-balance1, 2)).rstrip("0").rstrip("."),
+            # Two members lend to and borrow from each other, the debtor owes the creditor the whole difference
+            nets = {creditor: amount, debtor: -amount}
+        return Balance(creditor=creditor, debtor=debtor, amount=amount, nets=nets)
+
+    @staticmethod
+    def _minor_amount(amount, precision: int) -> int:
+        # Amounts that are not migrated yet are still decimal strings
+        return money.to_minor(amount, precision) if isinstance(amount, str) else int(amount)
+
+    def _get_balance_aggregate(self, wallet: str) -> Dict:
+        # Aggregates without precision were built from decimal amounts, before the amounts were in minor units
+        aggregate = self._get_balance_item(wallet)
+        if not aggregate or "precision" not in aggregate:
+            aggregate = self.rebuild_balance(wallet)
+        self._check_precision(wallet, aggregate)
+        return aggregate
+
+    def _check_precision(self, wallet: str, aggregate: Dict):
+        # The payments, the checkpoint and the stats of the wallet are in minor units of the precision of the
+        # aggregate, rebuilding it would read them in the new units, hence a change of precision is refused
+        precision = self._configuration.get_wallet_precision(wallet)
+        if int(aggregate["precision"]) != precision:
+            raise PrecisionMismatchError(
+                f"The payments of wallet {wallet} are stored with precision {aggregate['precision']}, not the "
+                f"configured {precision}, restore its precision in the configuration"
             )
+
+    def _get_balance_item(self, wallet: str) -> Optional[Dict]:
+        response = self._table.get_item(
+            Key={"wallet": self._partition(BALANCE_PARTITION), "timestamp": wallet}, ConsistentRead=True
+        )
+        return response.get("Item")
+
+    def _get_balance_items(self, wallets: List[str]) -> Dict[str, Dict]:
+        requests = {self._table.name: {
+            "Keys": [{"wallet": self._partition(BALANCE_PARTITION), "timestamp": wallet} for wallet in wallets],
+            "ConsistentRead": True,
+        }}
+        items = {}
+        while requests:
+            response = self._table.meta.client.batch_get_item(RequestItems=requests)
+            for item in response["Responses"].get(self._table.name, []):
+                items[item["timestamp"]] = item
+            requests = response.get("UnprocessedKeys")
+        return items
+
+    def _balance_item(self, wallet: str, totals: Dict[str, int], count: int, version: int) -> Dict:
+        return {
+            "wallet": self._partition(BALANCE_PARTITION),
+            "timestamp": wallet,
+            "totals": totals,
+            "precision": self._configuration.get_wallet_precision(wallet),
+            "count": count,
+            "version": version,
+        }
+
+    def _put_request(self, item: Dict, condition: str, names: Dict[str, str], values: Optional[Dict] = None) -> Dict:
+        # The client of the table resource (de)serializes the attribute values, like the table itself
+        request = {
+            "TableName": self._table.name,
+            "Item": item,
+            "ConditionExpression": condition,
+            "ExpressionAttributeNames": names,
+        }
+        if values:
+            request["ExpressionAttributeValues"] = values
+        return request
@@ -0,0 +1,59 @@
+import csv
+import gzip
+import io
+import json
+from typing import Dict, Iterable
+
+from ledger_frame import LedgerFrame
+from payment import PersistedPayment
+
+# Supported formats of the exported history
+FORMATS = ['json', 'ndjson', 'csv']
+
+FIELDS = ['payer', 'amount', 'wallet', 'note', 'datetime']
+
+
+def export_payments(payments: Iterable[PersistedPayment], fmt: str = 'json', compress: bool = False) -> io.BytesIO:
+    """
+    Writes the payments one by one into an in-memory file, optionally gzip-compressed, without holding them in a
+    list or in a string. The `json` format is the document of `PersistedPayment.jsonify_all`, with one payment per
+    line, `ndjson` is one JSON payment per line, and `csv` has a header row.
+    """
+    return export_records((payment.record() for payment in payments), fmt, compress)
+
+
+def export_frames(frames: Iterable[LedgerFrame], fmt: str = 'json', compress: bool = False) -> io.BytesIO:
+    """Writes the payments of the frames like export_payments, without a payment object per payment"""
+    return export_records((record for frame in frames for record in frame.records()), fmt, compress)
+
+
+def export_records(records: Iterable[Dict[str, str]], fmt: str = 'json', compress: bool = False) -> io.BytesIO:
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt}, it must be one of {FORMATS}')
+    buffer = io.BytesIO()
+    stream = gzip.GzipFile(fileobj=buffer, mode='wb') if compress else buffer
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'json':
+        text.write('{"payments": [')
+        for i, record in enumerate(records):
+            text.write(f'{"," if i else ""}\n    {json.dumps(record)}')
+        text.write('\n]}\n')
+    elif fmt == 'ndjson':
+        for record in records:
+            text.write(f'{json.dumps(record)}\n')
+    else:
+        writer = csv.DictWriter(text, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    text.flush()
+    # Detach the text layer, so that closing it does not close the buffer
+    text.detach()
+    if compress:
+        # Closing the gzip file writes its trailer, but leaves the buffer open
+        stream.close()
+    buffer.seek(0)
+    return buffer
+
+
+def filename(fmt: str, compress: bool) -> str:
+    return f'history.{fmt}{".gz" if compress else ""}'
@@ -1,12 +1,18 @@
 from configuration import Configuration
-from database import Database
+from database import MAX_BATCH_SIZE, Database
 from payment import Payment
+from sort_keys import import_key
 
 from pydantic import BaseModel, ValidationError, field_validator
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime as date
+import argparse
+import hashlib
 import json
-import sys
+import os
+import threading
+import time
 
 
 class Record(BaseModel):
@@ -51,7 +57,7 @@ def validate_records(records: List[Dict[str, str]]) -> None:
             raise ValidationError(f"Invalid dictionary {record}: {e}")
 
 
-def past_records(input_json: str) -> None:
+def past_records(input_json: str, bulk: bool = False, workers: int = 4, checkpoint: Optional[str] = None) -> None:
     config = Configuration()
     database = Database(config)
 
@@ -64,12 +70,17 @@ def past_records(input_json: str) -> None:
 
     validate_records(past_records_json)
 
+    payments = []
+    # Payments of a wallet in the same second get successive keys, instead of overwriting each other
+    occurrences: Dict[Tuple[str, str], int] = {}
     for record in past_records_json:
         payer = record["payer"]
         amount = record["amount"]
         wallet = record["wallet"]
         note = record["note"]
-        timestamp = record["datetime"]
+        occurrence = occurrences.get((wallet, record["datetime"]), 0)
+        occurrences[(wallet, record["datetime"])] = occurrence + 1
+        timestamp = import_key(record["datetime"], occurrence)
         wallet_symbol = config.get_wallet_symbol(wallet)
 
         payment = Payment(
@@ -79,12 +90,88 @@ def past_records(input_json: str) -> None:
             note=note,
             wallet_symbol=wallet_symbol,
         )
-
-        database.add_payment(payment=payment, timestamp=timestamp)
+        payments.append((payment, timestamp))
+
+    if bulk:
+        if checkpoint is None:
+            checkpoint = f".import-{hashlib.sha1(input_json.encode()).hexdigest()[:12]}.checkpoint"
+        bulk_import(database, payments, workers, checkpoint)
+    else:
+        for payment, timestamp in payments:
+            database.add_payment(payment=payment, timestamp=timestamp)
+
+
+def bulk_import(database: Database, payments: List[Tuple[Payment, str]], workers: int, checkpoint: str) -> int:
+    """
+    Imports the payments in batches of 25 with a pool of parallel writers, and returns the number of written ones.
+
+    Payments whose (wallet, key) already exists, in the database or earlier in the input, are skipped. Every
+    written batch is recorded in the checkpoint file, so that an interrupted import resumes with the batches that
+    were not written yet. The balances of the wallets are rebuilt once all the batches are written.
+    """
+    started = time.monotonic()
+    wallets = {payment.wallet for payment, _ in payments}
+    existing = {
+        (wallet, p.key) for wallet in wallets for p in database.iter_payments(wallet, projection=[], archived=True)
+    }
+    unique, seen = [], set()
+    for payment, timestamp in payments:
+        if (payment.wallet, timestamp) not in seen:
+            seen.add((payment.wallet, timestamp))
+            unique.append((payment, timestamp))
+    batches = [unique[i:i + MAX_BATCH_SIZE] for i in range(0, len(unique), MAX_BATCH_SIZE)]
+
+    done = set()
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            done = {int(line) for line in f if line.strip()}
+        print(f"Resuming the import from {checkpoint}: {len(done)} of {len(batches)} batches were already written")
+
+    lock = threading.Lock()
+
+    def write(index: int) -> int:
+        batch = [(p, t) for p, t in batches[index] if (p.wallet, t) not in existing]
+        if batch:
+            database.add_payments(batch)
+        with lock, open(checkpoint, "a") as f:
+            f.write(f"{index}\n")
+        return len(batch)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        written = sum(executor.map(write, [i for i in range(len(batches)) if i not in done]))
+
+    for wallet in wallets:
+        database.rebuild_balance(wallet)
+        database.rebuild_stats(wallet)
+    os.remove(checkpoint)
+
+    elapsed = time.monotonic() - started
+    print(f"Imported {written} of {len(payments)} payments in {elapsed:.1f}s "
+          f"({written / elapsed if elapsed else 0:.0f} payments/s)")
+    return written
+
+
+def parse_users(users: str, wallets: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Returns the users separated by commas, e.g. 'Julia,Jack,Carl', and the wallets. The former arguments of two
+    users, e.g. 'Julia Jack Dollar', are still accepted: a single user is followed by the second one.
+    """
+    if "," in users:
+        return users.split(","), wallets
+    return [users, wallets[0]], wallets[1:]
 
 
 if __name__ == "__main__":
-    history_json = sys.argv[1]
-    users = [sys.argv[2], sys.argv[3]]
-    wallets = [sys.argv[4], sys.argv[5], sys.argv[6]]
-    past_records(history_json)
+    parser = argparse.ArgumentParser(description="Imports the payments of a history into the database")
+    parser.add_argument("history_json", help="content of the history in json format")
+    parser.add_argument("users", help="names of the users separated by commas, e.g. Julia,Jack,Carl, or the first of "
+                                      "two users separated by a space")
+    parser.add_argument("wallets", nargs="+", help="currencies of the wallets")
+    parser.add_argument("--bulk", action="store_true", help="write the payments in parallel batches")
+    parser.add_argument("--workers", type=int, default=4, help="number of parallel writers of the bulk import")
+    parser.add_argument("--checkpoint", help="progress file of the bulk import, to resume it when interrupted")
+    args = parser.parse_args()
+    users, wallets = parse_users(args.users, args.wallets)
+    if not wallets:
+        parser.error("the following arguments are required: wallets")
+    past_records(args.history_json, args.bulk, args.workers, args.checkpoint)
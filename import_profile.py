@@ -0,0 +1,61 @@
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Directory of the modules of the bot
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# What an invocation imports: the module of the lambda function, then the modules it imports on first use
+DEFAULT_STATEMENTS = [
+    "import main",
+    "import main, database, persistence",
+    "import main, database, persistence, export, num2persian",
+]
+
+
+def import_times(statement: str, path: str = BOT_DIR, site: bool = True) -> Tuple[int, Dict[str, int]]:
+    """
+    Runs the statement in a fresh interpreter with -X importtime from the directory `path`, and returns its total
+    import time and the import time of every top level package, in microseconds. The time of a package is the sum of
+    the own times of its modules, so the packages it imports are accounted to themselves.
+
+    Without `site`, the installed packages are not importable, e.g. to only import from a deployment package.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + ([] if site else ["-S"]) + ["-c", statement],
+        cwd=path, capture_output=True, text=True, check=True,
+    )
+    packages: Dict[str, int] = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+        total += int(own)
+    return total, packages
+
+
+def report(statements: List[str], top: int, path: str, site: bool) -> str:
+    lines = []
+    for statement in statements:
+        total, packages = import_times(statement, path, site)
+        lines.append(f"{statement}: {total / 1000:.1f} ms")
+        for package, time in sorted(packages.items(), key=lambda p: -p[1])[:top]:
+            lines.append(f"  {package:<30} {time / 1000:8.1f} ms {100 * time / total:5.1f}%")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reports the import time of the packages used by the bot")
+    parser.add_argument("statements", nargs="*", default=DEFAULT_STATEMENTS,
+                        help="import statements to profile, each in a fresh interpreter")
+    parser.add_argument("--top", type=int, default=10, help="number of packages to show per statement")
+    parser.add_argument("--path", default=BOT_DIR,
+                        help="directory to import from, e.g. the extracted deployment package")
+    parser.add_argument("--no-site", action="store_true", help="do not import the installed packages")
+    args = parser.parse_args()
+    print(report(args.statements, args.top, args.path, not args.no_site))
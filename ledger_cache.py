@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass
+class LedgerEntry:
+    # Version and number of payments of the balance aggregate the entry is in sync with
+    version: int
+    count: int
+    totals: Dict[str, int]
+    # The newest payment items of the wallet in the order of their timestamps, all of them if complete
+    rows: List[Dict]
+    complete: bool
+    # Highest timestamp seen in the wallet, the next sync only reads the payments after it
+    last_seen: str
+
+
+class LedgerCache:
+    """
+    Keeps the newest payments and the totals of the recently used wallets for the lifetime of the container.
+
+    The number of cached payments is bounded by `max_rows`: the least recently used wallets are evicted first, and
+    the oldest payments of a wallet are dropped when it alone exceeds the bound.
+    """
+
+    def __init__(self, max_rows: int):
+        self.max_rows = max_rows
+        self._entries: OrderedDict[str, LedgerEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.deltas = 0
+        self.evictions = 0
+
+    def get(self, wallet: str) -> Optional[LedgerEntry]:
+        entry = self._entries.get(wallet)
+        if entry:
+            self._entries.move_to_end(wallet)
+        return entry
+
+    def put(self, wallet: str, entry: LedgerEntry):
+        self._entries[wallet] = entry
+        self._entries.move_to_end(wallet)
+        self._evict()
+
+    def append(self, wallet: str, rows: List[Dict]):
+        self._entries[wallet].rows.extend(rows)
+        self._evict()
+
+    def invalidate(self, wallet: Optional[str] = None):
+        if wallet:
+            self._entries.pop(wallet, None)
+        else:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "deltas": self.deltas,
+            "evictions": self.evictions,
+            "wallets": len(self._entries),
+            "rows": sum(len(entry.rows) for entry in self._entries.values()),
+        }
+
+    def _evict(self):
+        rows = sum(len(entry.rows) for entry in self._entries.values())
+        while rows > self.max_rows:
+            self.evictions += 1
+            if len(self._entries) > 1:
+                _, entry = self._entries.popitem(last=False)
+                rows -= len(entry.rows)
+            else:
+                entry = next(iter(self._entries.values()))
+                del entry.rows[:rows - self.max_rows]
+                entry.complete = False
+                rows = self.max_rows
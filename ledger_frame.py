@@ -0,0 +1,94 @@
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import money
+from sort_keys import date, month
+
+
+class LedgerFrame:
+    """
+    Payments as parallel columns rather than one object per payment: their keys and notes, the ids of their payers
+    and wallets, and their amounts in minor units. The payers and the wallets are interned by the frame, so that a
+    payment takes 14 bytes in the arrays, plus the references to its key and note.
+
+    The amounts are 64-bit integers, i.e. at most about 9.2e18 minor units per payment.
+    """
+
+    __slots__ = ('keys', 'notes', 'payer_ids', 'wallet_ids', 'amounts', 'payers', 'wallets', 'symbols', 'precisions',
+                 '_payer_ids', '_wallet_ids')
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.notes: List[Optional[str]] = []
+        self.payer_ids = array('I')
+        self.wallet_ids = array('H')
+        self.amounts = array('q')
+        # The interned payers and wallets, by their ids
+        self.payers: List[str] = []
+        self.wallets: List[str] = []
+        self.symbols: List[str] = []
+        self.precisions: List[int] = []
+        self._payer_ids: Dict[str, int] = {}
+        self._wallet_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def wallet_id(self, wallet: str, symbol: str, precision: int) -> int:
+        if wallet not in self._wallet_ids:
+            self._wallet_ids[wallet] = len(self.wallets)
+            self.wallets.append(wallet)
+            self.symbols.append(symbol)
+            self.precisions.append(precision)
+        return self._wallet_ids[wallet]
+
+    def payer_id(self, payer: str) -> int:
+        if payer not in self._payer_ids:
+            self._payer_ids[payer] = len(self.payers)
+            self.payers.append(payer)
+        return self._payer_ids[payer]
+
+    def append(self, key: str, payer: str, amount: int, wallet_id: int, note: Optional[str]):
+        self.keys.append(key)
+        self.notes.append(note)
+        self.payer_ids.append(self.payer_id(payer))
+        self.wallet_ids.append(wallet_id)
+        self.amounts.append(amount)
+
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        """Sums the amounts of every payer in every wallet, e.g. {'Dollar': {'Julia': 1250, 'Jack': 300}}"""
+        sums = [[0] * len(self.payers) for _ in self.wallets]
+        for wallet_id, payer_id, amount in zip(self.wallet_ids, self.payer_ids, self.amounts):
+            sums[wallet_id][payer_id] += amount
+        return {
+            wallet: {payer: total for payer, total in zip(self.payers, sums[wallet_id]) if total}
+            for wallet_id, wallet in enumerate(self.wallets)
+        }
+
+    def monthly_totals(self) -> Dict[str, Dict[str, Dict[str, List[int]]]]:
+        """
+        Sums the amounts and counts the payments of every payer in every wallet per month of their keys, e.g.
+        {'Dollar': {'2024-01': {'Julia': [1250, 2]}}}
+        """
+        months: Dict[Tuple[int, str, int], List[int]] = {}
+        for key, wallet_id, payer_id, amount in zip(self.keys, self.wallet_ids, self.payer_ids, self.amounts):
+            rollup = months.setdefault((wallet_id, month(key), payer_id), [0, 0])
+            rollup[0] += amount
+            rollup[1] += 1
+        result: Dict[str, Dict[str, Dict[str, List[int]]]] = {}
+        for (wallet_id, key_month, payer_id), rollup in months.items():
+            result.setdefault(self.wallets[wallet_id], {}).setdefault(key_month, {})[self.payers[payer_id]] = rollup
+        return result
+
+    def records(self) -> Iterator[Dict[str, str]]:
+        """Yields the payments as the records of PersistedPayment.record, e.g. for export, one at a time"""
+        for key, note, payer_id, wallet_id, amount in zip(
+            self.keys, self.notes, self.payer_ids, self.wallet_ids, self.amounts
+        ):
+            yield {
+                'payer': self.payers[payer_id],
+                'amount': f'{money.to_major(amount, self.precisions[wallet_id])} {self.symbols[wallet_id]}',
+                'wallet': self.wallets[wallet_id],
+                'note': note,
+                'datetime': date(key),
+            }
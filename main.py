@@ -1,11 +1,17 @@
 import asyncio
 import json
 import logging
-from datetime import datetime
+import re
+import time
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import (
+    InlineKeyboardButton, InlineKeyboardMarkup, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+)
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
@@ -13,35 +19,131 @@ from telegram.ext import (
     MessageHandler
 )
 
-import num2persian
+import money
 from configuration import Configuration
-from database import Database
-from payment import Payment, PersistedPayment
-
-# Create and initialize the configuration
-config = Configuration()
-
-# Create and initialize the database
-database = Database(config)
-
-# Build the application
-application = Application.builder().token(config.get_token()).build()
+from metrics import tracer
+from payment import Payment
+from registry import Registry
+from runtime import Runtime
+from webhook_reply import WebhookReplyRequest
+
+if TYPE_CHECKING:
+    from database import Balance, Database
+    from ledger_cache import LedgerCache
+    from persistence import DynamoDBPersistence
+    from update_log import UpdateLog
 
 # State of the conversations
 WALLET, PAYER, NOTE, AMOUNT, CONFIRM = range(5)
 WALLET_BALANCE = 5
 
+# Maximum number of payments shown by the /last command, so that they fit in one message
+MAX_LAST_PAYMENTS = 20
+
+# Maximum number of bytes of the data of an inline button of Telegram
+MAX_CALLBACK_DATA = 64
+
+# Bounds of the /history command: a year, a month or a day, e.g. 2024, 2024-03 or 2024-03-15
+DATE_PATTERN = re.compile(r'^[0-9]{4}(-[0-9]{2}){0,2}$')
+
+# Number of months shown by the /stats command by default, and at most
+DEFAULT_STATS_MONTHS = 12
+MAX_STATS_MONTHS = 36
+
+# Commands of the bot, the metrics of the other texts are grouped as they are sent by anyone
+COMMANDS = ['start', 'update', 'status', 'settle', 'stats', 'last5', 'last', 'history', 'cancel', 'skip']
+
+# Number of buttons per row of the keyboard of the users, a row of hundreds of names would not fit the screen
+KEYBOARD_COLUMNS = 3
+
+# The registry of the groups, their databases and the ledger cache they share, the persistence, the log of the
+# processed updates and the application of the container. They are created on their first use by the getters below,
+# so that importing this module (the cold start) does not pay for them, and the modules that only some commands need
+# (boto3 and the database, export, num2persian) are imported on demand.
+registry: Optional[Registry] = None
+databases: Dict[Optional[str], 'Database'] = {}
+ledger_cache: Optional['LedgerCache'] = None
+persistence: Optional['DynamoDBPersistence'] = None
+update_log: Optional['UpdateLog'] = None
+application: Optional[Application] = None
+webhook_request: Optional[WebhookReplyRequest] = None
+
+# Event loop of the container, and the one the application was initialized on
+runtime = Runtime()
+initialized_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Group of the users of the update being processed, the tasks and the threads started for the update inherit it
+current_group: ContextVar[Optional[str]] = ContextVar('current_group', default=None)
+
+
+def get_registry() -> Registry:
+    global registry
+    if registry is None:
+        with tracer.span('config'):
+            registry = Registry()
+    return registry
+
+
+def get_config() -> Configuration:
+    return get_registry().get_configuration(current_group.get())
+
+
+def get_database() -> 'Database':
+    global ledger_cache
+    group = current_group.get()
+    if group not in databases:
+        from database import CACHE_MAX_ROWS, Database
+        from ledger_cache import LedgerCache
+        # One bound on the cached payments of the container, whatever the number of its groups
+        if ledger_cache is None:
+            ledger_cache = LedgerCache(CACHE_MAX_ROWS)
+        databases[group] = Database(get_registry().get_configuration(group), cache=ledger_cache)
+    return databases[group]
+
+
+def get_persistence() -> 'DynamoDBPersistence':
+    # Keep the conversations and their data in the database, the next update of a chat may reach another container
+    global persistence
+    if persistence is None:
+        from persistence import DynamoDBPersistence
+        persistence = DynamoDBPersistence(get_registry().get_table_name())
+    return persistence
+
+
+def get_update_log() -> 'UpdateLog':
+    # The updates of all the groups are recorded in the table of the registry, their ids are unique per bot
+    global update_log
+    if update_log is None:
+        from update_log import UpdateLog
+        update_log = UpdateLog(get_registry().get_table_name())
+    return update_log
+
+
+def get_application() -> Application:
+    # Build the application and register the handlers once per container, the warm invocations reuse them
+    global application, webhook_request
+    if application is None:
+        webhook_request = WebhookReplyRequest()
+        application = Application.builder().token(get_registry().get_token()).persistence(get_persistence()) \
+            .request(webhook_request).build()
+        register_handlers(application)
+    return application
+
 
 # ------------------ start command --------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logging.info("User %s issued /start command", update.message.from_user.first_name)
     await update.message.reply_text(
-        'Hi 👋, this is a simple bot to manage your shared expenses with another person. These are the available '
+        'Hi 👋, this is a simple bot to manage your shared expenses with other people. These are the available '
         'commands:\n'
         '/update - update a wallet\n'
         '/status - show the status of a wallet\n'
+        '/settle [wallet] - show the transfers that settle the wallets\n'
+        '/stats [wallet] [months] - show what everyone paid per month\n'
         '/last5 - show the last 5 payments\n'
-        '/history - get the full history as a file\n'
+        '/last N [payer] - show the last N payments, of everyone or of a payer\n'
+        '/history [json|ndjson|csv] [wallet] [gz] [from] [to] - get the history as a file, from and to are dates '
+        'like 2024-03-15, or months like 2024-03\n'
         '/cancel - cancel the current operation'
     )
     return ConversationHandler.END
@@ -50,7 +152,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 # ------------------- update conversation functions -------------------
 async def update_choose_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logging.info("User %s issued /update command", update.message.from_user.first_name)
-    reply_keyboard = [config.get_currencies()]
+    reply_keyboard = [get_config().get_currencies()]
     await update.message.reply_text(
         'Which wallet do you want to change?',
         reply_markup=ReplyKeyboardMarkup(
@@ -62,7 +164,8 @@ async def update_choose_wallet(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def update_choose_payer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.chat_data['wallet'] = update.message.text
-    reply_keyboard = [config.get_usernames()]
+    usernames = get_config().get_usernames()
+    reply_keyboard = [usernames[i:i + KEYBOARD_COLUMNS] for i in range(0, len(usernames), KEYBOARD_COLUMNS)]
     await update.message.reply_text(
         text='Whose balance to increase?',
         reply_markup=ReplyKeyboardMarkup(
@@ -82,6 +185,12 @@ async def update_enter_amount(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 
 async def update_enter_note(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    precision = get_config().get_wallet_precision(context.chat_data['wallet'])
+    try:
+        money.to_minor(update.message.text, precision)
+    except ValueError:
+        await update.message.reply_text(text=f'The amount can have at most {precision} decimal digits, try again.')
+        return AMOUNT
     context.chat_data['amount'] = update.message.text
     await update.message.reply_text(
         text='Ok.\nDo you have a note for this payment? If not, enter /skip .',
@@ -95,7 +204,7 @@ async def update_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     context.chat_data['note'] = '-' if note_input == '/skip' else note_input
 
     cd = context.chat_data
-    payment = Payment(cd['payer'], cd['amount'], cd['wallet'], config.get_wallet_symbol(cd['wallet']), cd['note'])
+    payment = Payment(cd['payer'], cd['amount'], cd['wallet'], get_config().get_wallet_symbol(cd['wallet']), cd['note'])
     cd['payment'] = payment
     reply_keyboard = [['Yes', 'No']]
     await update.message.reply_text(
@@ -110,21 +219,23 @@ async def update_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         payment = context.chat_data['payment']
         logging.info('User %s finalized /update command. Parameters: %s', update.message.from_user.first_name,
                      payment.jsonify())
-        database.add_payment(payment)
-        await update.message.reply_text(
-            get_formatted_balance(payment.wallet),
-            reply_markup=ReplyKeyboardRemove(),
-        )
-
-        # Inform the other user about the payment
-        other = config.get_other_chat_id(update.message.chat_id)
+        # The payment is written off the event loop, and the write already gives the new balance of the wallet
+        started = time.perf_counter()
+        balance = await asyncio.to_thread(get_database().add_payment, payment)
+        written = time.perf_counter()
+        formatted_balance = format_balance(payment.wallet, balance)
+
+        # Reply and inform the other users about the payment at the same time
+        others = get_config().get_other_chat_ids(update.message.chat_id)
         msg = f'{payment.format()}\n' \
               f'New status:\n' \
-              f'{get_formatted_balance(payment.wallet)}'
-        await application.bot.send_message(
-            chat_id=other,
-            text=msg
+              f'{formatted_balance}'
+        await asyncio.gather(
+            update.message.reply_text(formatted_balance, reply_markup=ReplyKeyboardRemove()),
+            *(context.bot.send_message(chat_id=other, text=msg) for other in others),
         )
+        logging.info('Timings of /update: write %.1f ms, replies %.1f ms',
+                     (written - started) * 1000, (time.perf_counter() - written) * 1000)
     else:
         await update.message.reply_text(
             'Ok, the process is canceled.',
@@ -136,7 +247,7 @@ async def update_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 # ------------------ status conversation --------------------
 async def status_choose_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logging.info("User %s issued /status command", update.message.from_user.first_name)
-    reply_keyboard = [config.get_currencies()]
+    reply_keyboard = [get_config().get_currencies()]
     await update.message.reply_text(
         'Which wallet do you want to see?',
         reply_markup=ReplyKeyboardMarkup(
@@ -149,22 +260,73 @@ async def status_choose_wallet(update: Update, context: ContextTypes.DEFAULT_TYP
 async def status_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     wallet = update.message.text
     await update.message.reply_text(
-        get_formatted_balance(wallet),
+        await asyncio.to_thread(get_formatted_balance, wallet),
         reply_markup=ReplyKeyboardRemove(),
     )
     return ConversationHandler.END
 
 
+# ------------------ settle command --------------------
+async def settle_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    logging.info("User %s issued /settle command", update.message.from_user.first_name)
+    currencies = get_config().get_currencies()
+    if len(context.args) > 1 or context.args and context.args[0] not in currencies:
+        await update.message.reply_text(text=f'Usage: /settle [{"|".join(currencies)}]')
+        return ConversationHandler.END
+    await update.message.reply_text(await asyncio.to_thread(get_formatted_settlement, context.args or currencies))
+    return ConversationHandler.END
+
+
+# ------------------ stats command --------------------
+async def stats_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    logging.info("User %s issued /stats command", update.message.from_user.first_name)
+    currencies = get_config().get_currencies()
+    wallets, months = currencies, DEFAULT_STATS_MONTHS
+    for arg in context.args:
+        if arg in currencies:
+            wallets = [arg]
+        elif arg.isdigit() and 0 < int(arg) <= MAX_STATS_MONTHS:
+            months = int(arg)
+        else:
+            await update.message.reply_text(
+                text=f'Usage: /stats [{"|".join(currencies)}] [months], where months is between 1 and '
+                     f'{MAX_STATS_MONTHS}'
+            )
+            return ConversationHandler.END
+    await update.message.reply_text(await asyncio.to_thread(get_formatted_stats, wallets, months))
+    return ConversationHandler.END
+
+
 # ------------------ history command --------------------
 async def history_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logging.info("User %s issued /history command", update.message.from_user.first_name)
-    history_json = f'/tmp/{datetime.now()}.json'
-    with open(history_json, 'w') as f:
-        f.write(PersistedPayment.jsonify_all(database.get_payments()))
-    await update.message.reply_document(
-        document=history_json,
-        filename='history.json'
+    import export
+    fmt, wallet, compress, dates = 'json', None, False, []
+    for arg in context.args:
+        if arg in export.FORMATS:
+            fmt = arg
+        elif arg in get_config().get_currencies():
+            wallet = arg
+        elif arg == 'gz':
+            compress = True
+        elif DATE_PATTERN.match(arg) and len(dates) < 2:
+            dates.append(arg)
+        else:
+            dates = None
+            break
+    if dates is None or len(dates) == 2 and dates[0] > dates[1]:
+        await update.message.reply_text(
+            text=f'Usage: /history [{"|".join(export.FORMATS)}] [{"|".join(get_config().get_currencies())}] [gz] '
+                 f'[from] [to], e.g. /history 2024-03-01 2024-03-31'
+        )
+        return ConversationHandler.END
+    # The dates are the bounds of the keys of the payments, the payments out of them are not read
+    since, until = (dates + [None, None])[:2]
+    # The frames are read lazily, hence by the export, off the event loop like the other reads of the database
+    document = await asyncio.to_thread(
+        export.export_frames, get_database().iter_frames(wallet, archived=True, since=since, until=until), fmt, compress
     )
+    await update.message.reply_document(document=document, filename=export.filename(fmt, compress))
     return ConversationHandler.END
 
 
@@ -178,81 +340,295 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-# ------------------ last 5 command --------------------
-async def last_5_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("User %s issued /last5 command", update.message.from_user.first_name)
-    payments = database.get_payments()[-5:]
-    if payments:
-        msg = ''
-        for payment in payments:
-            msg += f'{payment.format()}\n'
-    else:
-        msg = 'No payments registered'
-    await update.message.reply_text(text=msg)
+# ------------------ last command --------------------
+async def last_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    logging.info("User %s issued /last command", update.message.from_user.first_name)
+    members = get_config().get_usernames()
+    count, payer, args = 5, None, list(context.args)
+    if args and args[0].isdigit() and 0 < int(args[0]) <= MAX_LAST_PAYMENTS:
+        count = int(args.pop(0))
+    if args and args[0] in members:
+        payer = args.pop(0)
+    if args:
+        await update.message.reply_text(
+            text=f'Usage: /last N [{"|".join(members)}], where N is between 1 and {MAX_LAST_PAYMENTS}'
+        )
+        return ConversationHandler.END
+    text, reply_markup = await asyncio.to_thread(get_formatted_last_payments, count, payer=payer)
+    await update.message.reply_text(text=text, reply_markup=reply_markup)
     return ConversationHandler.END
 
 
+async def older_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if query.from_user.id not in get_config().get_chat_ids():
+        return
+    await query.answer()
+    # The payer is passed by their index among the members, see get_formatted_last_payments
+    _, count, cursor, *member = query.data.split(' ')
+    payer = get_config().get_usernames()[int(member[0])] if member else None
+    text, reply_markup = await asyncio.to_thread(get_formatted_last_payments, int(count), cursor, payer)
+    await query.edit_message_text(text=text, reply_markup=reply_markup)
+
+
 def lambda_handler(event, context):
-    return asyncio.get_event_loop().run_until_complete(main(event, context))
+    return runtime.run(main(event, context))
 
 
 # --------------------- Utility methods -----------------------
 def get_formatted_balance(wallet: str) -> str:
-    balance = database.get_balance(wallet)
+    return format_balance(wallet, get_database().get_balance(wallet))
+
+
+def get_formatted_settlement(wallets: List[str]) -> str:
+    import settlement
+    lines = []
+    for wallet in wallets:
+        # The transfers are computed from the totals of the members in the balance aggregate, not from the payments
+        # Two members lend to and borrow from each other, like /status shows, hence their transfer is the whole
+        # difference, see Database._balance
+        transfers = settlement.settle(get_database().get_balance(wallet).nets)
+        symbol = get_config().get_wallet_symbol(wallet)
+        precision = get_config().get_wallet_precision(wallet)
+        lines.append(f'{wallet}:' if transfers else f'{wallet}: settled')
+        lines.extend(f'{t.payer} → {t.payee}: {money.to_major(t.amount, precision)} {symbol}' for t in transfers)
+    return '\n'.join(lines)
+
+
+def get_formatted_stats(wallets: List[str], months: int) -> str:
+    members = get_config().get_usernames()
+    lines = []
+    for wallet in wallets:
+        # The stats are the monthly rollups of the wallet, they are not computed from the payments
+        stats = get_database().get_stats(wallet, months)
+        symbol = get_config().get_wallet_symbol(wallet)
+        precision = get_config().get_wallet_precision(wallet)
+        lines.append(f'{wallet}:' if stats else f'{wallet}: no payments in the last {months} months')
+        for month in stats:
+            # The members in the order of the configuration, then the former ones
+            payers = sorted(month.totals, key=lambda p: members.index(p) if p in members else len(members))
+            paid = ', '.join(f'{payer} {money.to_major(month.totals[payer], precision)} {symbol} '
+                             f'({month.counts.get(payer, 0)})' for payer in payers)
+            lines.append(f'{month.month}: {paid}')
+    return '\n'.join(lines)
+
+
+def format_balance(wallet: str, balance: 'Balance') -> str:
+    if balance and len(balance.nets) > 2:
+        # The balances of more than two members are what each of them paid above or below their share
+        symbol = get_config().get_wallet_symbol(wallet)
+        precision = get_config().get_wallet_precision(wallet)
+        return '\n'.join(f'{member}: {"+" if net > 0 else ""}{money.to_major(net, precision)} {symbol}'
+                         for member, net in balance.nets.items())
     if balance:
-        if balance.amount != '0':
-            symbol = config.get_wallet_symbol(wallet)
+        if balance.amount != 0:
+            symbol = get_config().get_wallet_symbol(wallet)
+            precision = get_config().get_wallet_precision(wallet)
+            amount = money.to_major(balance.amount, precision)
             if wallet == 'Toman':
-                return (f'{balance.creditor}: {balance.amount} {symbol}'
-                        f'\n{num2persian.to_persian(str(int(float(balance.amount))))}'
+                import num2persian
+                return (f'{balance.creditor}: {amount} {symbol}'
+                        f'\n{num2persian.to_persian(amount)}'
                         f'\n{balance.debtor}: 0 {symbol}')
-            return f'{balance.creditor}: {balance.amount} {symbol}\n{balance.debtor}: 0 {symbol}'
+            return f'{balance.creditor}: {amount} {symbol}\n{balance.debtor}: 0 {symbol}'
     return '0'
 
 
-async def main(event, context):
-    # Skip if event body is not there
-    event_body = event.get("body")
-    if not event_body:
-        return {
-            'statusCode': 500,
-            'body': 'event body not available'
-        }
+def get_formatted_last_payments(count: int, cursor: Optional[str] = None,
+                                payer: Optional[str] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    payments, older_cursor = get_database().get_last_payments(count, cursor, payer)
+    if not payments:
+        return 'No payments registered', None
+    text = ''.join(f'{payment.format()}\n' for payment in payments)
+    if not older_cursor:
+        return text, None
+    # The button brings the payments before the shown ones, it carries the cursor of the database to continue from
+    # The data of a button is limited to 64 bytes, the cursor and the payer only carry indexes and digits
+    data = f'last {count} {older_cursor}'
+    if payer:
+        data += f' {get_config().get_usernames().index(payer)}'
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        # Telegram would refuse the whole reply, the payments are shown without the button
+        logging.error('The data of the Older button is too long: %s', data)
+        return text, None
+    button = InlineKeyboardButton('Older', callback_data=data)
+    return text, InlineKeyboardMarkup([[button]])
+
+
+def duplicate_response(update_id: int) -> Dict:
+    logging.info('Update %s was already processed', update_id)
+    return {
+        'statusCode': 200,
+        'body': 'Duplicate'
+    }
+
+
+def complete_update(update_id: int) -> None:
+    try:
+        get_update_log().complete(update_id)
+    except Exception as ex:
+        # The update is processed, a failure here must not make Telegram deliver it again. Its claim still skips the
+        # deliveries of the update until its lease expires.
+        logging.error("Unable to record the update %s: %s", update_id, str(ex))
+
+
+def command_name(update: Optional[Update]) -> str:
+    # Name of the update in the metrics, the answers in the conversations are all 'message'
+    if update is None:
+        return 'unknown'
+    if update.callback_query:
+        return f'callback:{(update.callback_query.data or "").split(" ")[0]}'
+    if update.message and update.message.text:
+        command = update.message.text.split(' ')[0].split('@')[0]
+        if not command.startswith('/'):
+            return 'message'
+        return command if command[1:] in COMMANDS else 'other'
+    return 'other'
+
+
+class GroupFilter(filters.MessageFilter):
+    """Matches the texts that are among the given values of the configuration of the group of the update"""
+
+    def __init__(self, values: Callable[[Configuration], List[str]]):
+        super().__init__(name=f'GroupFilter({values.__name__})')
+        self._values = values
+
+    def filter(self, message: Message) -> bool:
+        return message.text in self._values(get_config())
+
+
+def register_handlers(app: Application) -> None:
+    # The users of all the groups are known once per container, their currencies and usernames depend on the update
+    users_filter = filters.User(get_registry().get_chat_ids())
+    currencies_filter = GroupFilter(Configuration.get_currencies)
+    usernames_filter = GroupFilter(Configuration.get_usernames)
+    amount_filter = filters.Regex(r'^[0-9]+(\.[0-9]+)?$') & ~filters.COMMAND
 
     # Add command handler for the start command
-    application.add_handler(CommandHandler('start', start, filters.User(config.get_chat_ids())))
+    app.add_handler(CommandHandler('start', start, users_filter))
+
+    # Add command handlers to get the last 5 or N payments (regardless of the wallets), and the ones before them
+    app.add_handler(CommandHandler('last5', last_payments, users_filter))
+    app.add_handler(CommandHandler('last', last_payments, users_filter))
+    app.add_handler(CallbackQueryHandler(older_payments, pattern='^last '))
 
-    # Add command handler to get the last 5 payments (regardless of the wallets)
-    application.add_handler(CommandHandler('last5', last_5_payments, filters.User(config.get_chat_ids())))
+    # Add command handler to get the transfers that settle the wallets
+    app.add_handler(CommandHandler('settle', settle_wallets, users_filter))
+
+    # Add command handler to get what everyone paid per month
+    app.add_handler(CommandHandler('stats', stats_wallets, users_filter))
 
     # Add command handler to get the full history of the payments
-    application.add_handler(CommandHandler('history', history_payments, filters.User(config.get_chat_ids())))
+    app.add_handler(CommandHandler('history', history_payments, users_filter))
 
     # Add conversation handler for updating a wallet
-    application.add_handler(ConversationHandler(
-        entry_points=[CommandHandler('update', update_choose_wallet, filters.User(config.get_chat_ids()))],
+    app.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('update', update_choose_wallet, users_filter)],
         states={
-            WALLET: [MessageHandler(filters.Regex(f'^({"|".join(config.get_currencies())})$'), update_choose_payer)],
-            PAYER: [MessageHandler(filters.Regex(f'^({"|".join(config.get_usernames())})$'), update_enter_amount)],
-            AMOUNT: [MessageHandler(filters.Regex('^[0-9]+(.[0-9]{2})?$') & ~filters.COMMAND, update_enter_note)],
+            WALLET: [MessageHandler(currencies_filter, update_choose_payer)],
+            PAYER: [MessageHandler(usernames_filter, update_enter_amount)],
+            AMOUNT: [MessageHandler(amount_filter, update_enter_note)],
             NOTE: [MessageHandler(filters.TEXT & ~filters.COMMAND, update_confirm),
                    CommandHandler('skip', update_confirm)],
             CONFIRM: [MessageHandler(filters.Regex('^(Yes|No)$'), update_end)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
+        name='update',
+        persistent=True,
     ))
 
-    application.add_handler(ConversationHandler(
-        entry_points=[CommandHandler('status', status_choose_wallet, filters.User(config.get_chat_ids()))],
+    app.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('status', status_choose_wallet, users_filter)],
         states={
-            WALLET_BALANCE: [MessageHandler(filters.Regex(f'^({"|".join(config.get_currencies())})$'), status_end)],
+            WALLET_BALANCE: [MessageHandler(currencies_filter, status_end)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
+        name='status',
+        persistent=True,
     ))
 
+
+async def initialize() -> None:
+    # Initialize the application only on the first invocation of the container
+    global application, webhook_request, initialized_loop
+    loop = asyncio.get_running_loop()
+    if initialized_loop is not loop:
+        # The connections of the bot belong to the loop they were opened on, the application is built again when the
+        # runtime had to replace a closed loop
+        if initialized_loop is not None:
+            application, webhook_request = None, None
+        await get_application().initialize()
+        initialized_loop = loop
+
+
+async def main(event, context):
+    # Skip if event body is not there
+    event_body = event.get("body")
+    if not event_body:
+        return {
+            'statusCode': 500,
+            'body': 'event body not available'
+        }
+
+    cold = initialized_loop is None
+    update, duplicate = None, False
     try:
-        await application.initialize()
-        await application.process_update(Update.de_json(json.loads(event["body"]), application.bot))
+        with tracer.span('invocation'):
+            body = json.loads(event_body)
+            # Telegram delivers an update again when the webhook failed or was slow. The updates processed by the
+            # container are skipped before anything else, the others once they are claimed in the update log.
+            if get_update_log().is_processed(body['update_id']):
+                duplicate = True
+                return duplicate_response(body['update_id'])
+            with tracer.span('initialize'):
+                await initialize()
+            app = get_application()
+            with tracer.span('de_json'):
+                update = Update.de_json(body, app.bot)
+            # Only the chats of the users have conversations, the updates of the others are not read from the database
+            # and are not recorded, they change nothing
+            claimed = update.effective_chat and get_registry().is_user(update.effective_chat.id)
+            if claimed:
+                with tracer.span('claim'):
+                    if not get_update_log().claim(update.update_id):
+                        duplicate = True
+                        return duplicate_response(update.update_id)
+                current_group.set(get_registry().get_group(update.effective_chat.id))
+            processed = False
+            try:
+                if claimed:
+                    conversations = [h for h in app.handlers[0] if isinstance(h, ConversationHandler)]
+                    await get_persistence().refresh_conversations(update.effective_chat.id, conversations)
+                # The first reply to the update is the response of the webhook, it saves a request to Telegram
+                webhook_request.start_capture()
+                processed = True
+                try:
+                    with tracer.span('process_update'):
+                        await app.process_update(update)
+                finally:
+                    reply = webhook_request.stop_capture()
+                # Write what the update changed with one request per chat
+                with tracer.span('update_persistence'):
+                    await app.update_persistence()
+                    await get_persistence().flush()
+            except Exception:
+                if claimed and processed:
+                    # The handlers catch their own errors, hence they already ran, e.g. wrote the confirmed payment,
+                    # and the failure is the write of the persistence: the next deliveries must not run them again
+                    complete_update(update.update_id)
+                elif claimed:
+                    # Nothing was done, the next delivery of the update processes it again
+                    get_update_log().release(update.update_id)
+                raise
+            if claimed:
+                complete_update(update.update_id)
+        logging.info('Bot API connections: %s', webhook_request.stats())
+        if reply:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps(reply)
+            }
         return {
             'statusCode': 200,
             'body': 'Success'
@@ -263,3 +639,5 @@ async def main(event, context):
             'statusCode': 500,
             'body': f'Failure: {str(ex)}'
         }
+    finally:
+        tracer.emit('duplicate' if duplicate else command_name(update), cold)
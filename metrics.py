@@ -0,0 +1,82 @@
+import functools
+import json
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, TypeVar
+
+T = TypeVar('T')
+
+# CloudWatch namespace of the metrics of the bot
+NAMESPACE = 'SharedWallet'
+
+
+class Tracer:
+    """
+    Sums the durations of the spans of an invocation by their names, and writes them as one log line in the CloudWatch
+    embedded metric format. CloudWatch turns the line into metrics per command, without any call to CloudWatch.
+
+    The spans of the requests sent concurrently overlap, hence their sum can be longer than the invocation.
+    """
+
+    def __init__(self):
+        self._durations: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, started)
+
+    def traced(self, name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """Decorates a function to trace each of its calls as a span"""
+        def decorator(function: Callable[..., T]) -> Callable[..., T]:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs) -> T:
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def trace_client(self, client) -> None:
+        """Traces every call of the boto3 client as a span named after its service and operation, e.g. dynamodb.Query"""
+        client.meta.events.register('before-call', self._before_call)
+        client.meta.events.register('after-call', self._after_call)
+
+    def emit(self, command: str, cold: bool) -> Dict:
+        """Writes the spans since the previous emit to the standard output, the lambda runtime sends it to CloudWatch"""
+        durations, self._durations = self._durations, {}
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['Command'], ['Command', 'Start']],
+                    'Metrics': [{'Name': name, 'Unit': 'Milliseconds'} for name in durations],
+                }],
+            },
+            'Command': command,
+            'Start': 'cold' if cold else 'warm',
+            **{name: round(duration, 3) for name, duration in durations.items()},
+        }
+        # The records must be single lines of JSON, the prefixes of the logging module would make them plain logs
+        sys.stdout.write(json.dumps(record) + '\n')
+        sys.stdout.flush()
+        return record
+
+    def _add(self, name: str, started: float) -> None:
+        self._durations[name] = self._durations.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    def _before_call(context: Dict, **kwargs) -> None:
+        context['trace_started'] = time.perf_counter()
+
+    def _after_call(self, model, context: Dict, **kwargs) -> None:
+        if 'trace_started' in context:
+            self._add(f'{model.service_model.endpoint_prefix}.{model.name}', context.pop('trace_started'))
+
+
+# Spans of the invocation in progress
+tracer = Tracer()
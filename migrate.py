@@ -0,0 +1,47 @@
+from configuration import Configuration
+from database import Database
+import sys
+
+
+def main(args):
+    """
+    This function migrates the payments of the database, which is configured by the JSON_CONFIG environment variable,
+    to the current format of the items.
+
+    Example of usage: python migrate.py amounts, python migrate.py keys, python migrate.py payers,
+    python migrate.py stats
+    """
+    if len(args) != 1 or args[0] not in MIGRATIONS:
+        print(f"Usage: migrate.py <{'|'.join(MIGRATIONS)}>")
+        sys.exit(1)
+    print(MIGRATIONS[args[0]](Database(Configuration())))
+
+
+def migrate_amounts(database: Database) -> str:
+    return f"Converted {database.migrate_amounts()} amounts to minor units"
+
+
+def migrate_keys(database: Database) -> str:
+    return f"Moved {database.migrate_keys()} payments to keys with microseconds"
+
+
+def migrate_payers(database: Database) -> str:
+    return f"Added {database.migrate_payers()} payments to the payer index"
+
+
+def migrate_stats(database: Database) -> str:
+    # Backfills the monthly stats of the payments written before them
+    months = database.rebuild_stats()
+    return f"Rebuilt the stats of {months} months"
+
+
+MIGRATIONS = {
+    "amounts": migrate_amounts,
+    "keys": migrate_keys,
+    "payers": migrate_payers,
+    "stats": migrate_stats,
+}
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,26 @@
+from decimal import Decimal, InvalidOperation
+
+
+def to_minor(amount: str, precision: int) -> int:
+    """
+    Converts an amount to an integer number of minor units, e.g. '12.50' to 1250 for a precision of 2 digits.
+    """
+    try:
+        value = Decimal(amount)
+    except InvalidOperation as e:
+        raise ValueError(f'Invalid amount: {amount}') from e
+    if not value.is_finite():
+        raise ValueError(f'Invalid amount: {amount}')
+    minor = value.scaleb(precision)
+    if minor != minor.to_integral_value():
+        raise ValueError(f'Amount {amount} has more than {precision} decimal digits')
+    return int(minor)
+
+
+def to_major(minor: int, precision: int) -> str:
+    """
+    Formats an integer number of minor units as an amount without trailing zeros, e.g. 1250 as '12.5'.
+    """
+    whole, fraction = divmod(abs(minor), 10 ** precision)
+    digits = str(fraction).zfill(precision).rstrip('0') if precision else ''
+    return f'{"-" if minor < 0 else ""}{whole}{f".{digits}" if digits else ""}'
@@ -1,24 +1,45 @@
 from __future__ import annotations
 
 import json
-from typing import List
-
-import num2persian
+from typing import Dict, List, Optional
 
 
 class Payment:
+    """
+    An immutable payment. Its attributes are slots, so that the instances have no __dict__ and read histories of
+    thousands of payments take less memory, see ledger_frame.LedgerFrame for the ones that need no objects at all.
+    """
+
+    __slots__ = ('payer', 'amount', 'wallet', 'wallet_symbol', 'note')
+
     def __init__(self, payer: str, amount: str, wallet: str, wallet_symbol: str, note: str):
-        self.payer = payer
-        self.amount = amount
-        self.wallet = wallet
-        self.wallet_symbol = wallet_symbol
-        self.note = note
+        self._set(payer=payer, amount=amount, wallet=wallet, wallet_symbol=wallet_symbol, note=note)
+
+    def _set(self, **attributes):
+        for name, value in attributes.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __getstate__(self) -> Dict:
+        return {name: getattr(self, name) for cls in type(self).__mro__ for name in getattr(cls, '__slots__', ())}
+
+    def __setstate__(self, state: Dict):
+        # The confirmation of /update keeps the payment in chat_data, which persistence pickles. The immutable
+        # attributes are set without __setattr__, and the payments pickled before the slots have the same state
+        self._set(**state)
 
     def format(self) -> str:
         result = f'Payer: {self.payer}\n' \
                  f'Amount: {self.amount} {self.wallet_symbol}\n'
         # TODO: workaround for having Persian amount of payment
         if self.wallet == 'Toman':
+            # Only the Toman payments need it, the module is not imported by the cold start
+            import num2persian
             try:
                 persian_amount = num2persian.to_persian(self.amount)
                 result += f'Amount: {persian_amount}\n'
@@ -36,20 +57,25 @@ class Payment:
 
 
 class PersistedPayment(Payment):
-    def __init__(self, payer: str, amount: str, wallet: str, wallet_symbol: str, note: str, date):
+
+    __slots__ = ('date', 'key')
+
+    def __init__(self, payer: str, amount: str, wallet: str, wallet_symbol: str, note: str, date,
+                 key: Optional[str] = None):
         super().__init__(payer, amount, wallet, wallet_symbol, note)
-        self.date = date
+        # Sort key of the payment in its wallet, see sort_keys
+        self._set(date=date, key=key or date)
 
     def format(self) -> str:
         return f'{super().format()}Date: {self.date}\n'
 
+    def record(self) -> Dict[str, str]:
+        return {'payer': self.payer, 'amount': f'{self.amount} {self.wallet_symbol}', 'wallet': self.wallet,
+                'note': self.note, 'datetime': self.date}
+
     @staticmethod
     def jsonify_all(payments: List[PersistedPayment]) -> str:
-        result = {'payments': []}
-        for payment in payments:
-            result['payments'].append({'payer': payment.payer, 'amount': f'{payment.amount} {payment.wallet_symbol}',
-                                       'wallet': payment.wallet, 'note': payment.note, 'datetime': payment.date})
-        return json.dumps(result, indent=4)
+        return json.dumps({'payments': [payment.record() for payment in payments]}, indent=4)
 
     def __repr__(self):
         return f'PersistedPayment ({self.payer!r}, {self.amount!r}, {self.wallet!r}, {self.wallet_symbol!r}, {self.note!r}, {self.date!r})'
\ No newline at end of file
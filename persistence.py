@@ -0,0 +1,166 @@
+import pickle
+from functools import cached_property
+from typing import Dict, Iterable, Optional, Tuple
+
+import boto3
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+from telegram.ext._utils.types import ConversationDict, ConversationKey
+
+from metrics import tracer
+
+# Partition that keeps one item per chat, the sort key of each item is the chat id
+CHAT_PARTITION = '#chat'
+
+# Prefixes of the attributes of a chat item: the pickled values of chat_data, and the states of the conversations
+CHAT_DATA_PREFIX = 'chat_data:'
+CONVERSATION_PREFIX = 'conversation:'
+
+
+class DynamoDBPersistence(BasePersistence):
+    """
+    Persists the chat_data and the conversation states of every chat in one item of the payments table, so that a
+    conversation continues in whichever container receives its next update.
+
+    The item of a chat is read lazily, at most once per update, and flush writes only the attributes that changed
+    with a single update of the item. flush must be called at the end of every update, it also forgets the read
+    items so that the next update reads them again.
+    """
+
+    def __init__(self, table_name: str):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=False, callback_data=False)
+        )
+        self._table_name = table_name
+        # Attributes of the chat items as they are stored, and the attributes to write (None to remove them)
+        self._loaded: Dict[int, Dict[str, object]] = {}
+        self._dirty: Dict[int, Dict[str, Optional[object]]] = {}
+
+    @cached_property
+    def _table(self):
+        # The DynamoDB resource is created on the first request, it is not needed to build the application
+        table = boto3.resource('dynamodb').Table(self._table_name)
+        tracer.trace_client(table.meta.client)
+        return table
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        # The chats are read lazily by refresh_chat_data
+        return {}
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        chat_data.clear()
+        chat_data.update({
+            attribute[len(CHAT_DATA_PREFIX):]: pickle.loads(value)
+            for attribute, value in self._load(chat_id).items() if attribute.startswith(CHAT_DATA_PREFIX)
+        })
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        stored = {a: v for a, v in self._load(chat_id).items() if a.startswith(CHAT_DATA_PREFIX)}
+        values = {f'{CHAT_DATA_PREFIX}{key}': pickle.dumps(value) for key, value in data.items()}
+        for attribute, value in values.items():
+            if stored.get(attribute) != value:
+                self._dirty.setdefault(chat_id, {})[attribute] = value
+        for attribute in stored.keys() - values.keys():
+            self._dirty.setdefault(chat_id, {})[attribute] = None
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self.update_chat_data(chat_id, {})
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        # The conversations of a chat are read lazily by refresh_conversations
+        return {}
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        chat_id = key[0]
+        attribute = self._conversation_attribute(name, key)
+        if self._load(chat_id).get(attribute) != new_state:
+            self._dirty.setdefault(chat_id, {})[attribute] = new_state
+
+    async def refresh_conversations(self, chat_id: int, handlers: Iterable[ConversationHandler]) -> None:
+        """
+        Sets the states of the conversations of the chat in the handlers to the stored ones.
+
+        python-telegram-bot only reads the conversations from the persistence when the application is initialized,
+        but another container may have moved the conversations of the chat on since then.
+        """
+        stored = self._load(chat_id)
+        for handler in handlers:
+            # The states are set without tracking them as written, as they are not changed by this update
+            states = handler._conversations.data  # pylint: disable=protected-access
+            for key in [key for key in states if key[0] == chat_id]:
+                del states[key]
+            for attribute, state in stored.items():
+                name, key = self._parse_conversation_attribute(attribute)
+                if name == handler.name:
+                    states[key] = int(state)
+
+    async def flush(self) -> None:
+        for chat_id, changes in self._dirty.items():
+            names, values, updates, removals = {}, {}, [], []
+            for i, (attribute, value) in enumerate(changes.items()):
+                names[f'#a{i}'] = attribute
+                if value is None:
+                    removals.append(f'#a{i}')
+                else:
+                    values[f':v{i}'] = value
+                    updates.append(f'#a{i} = :v{i}')
+            expression = ' '.join(
+                f'{action} {", ".join(parts)}' for action, parts in (('SET', updates), ('REMOVE', removals)) if parts
+            )
+            kwargs = {'ExpressionAttributeValues': values} if values else {}
+            self._table.update_item(
+                Key={'wallet': CHAT_PARTITION, 'timestamp': str(chat_id)},
+                UpdateExpression=expression,
+                ExpressionAttributeNames=names,
+                **kwargs,
+            )
+        self._dirty.clear()
+        self._loaded.clear()
+
+    def _load(self, chat_id: int) -> Dict[str, object]:
+        if chat_id not in self._loaded:
+            item = self._table.get_item(Key={'wallet': CHAT_PARTITION, 'timestamp': str(chat_id)}).get('Item', {})
+            self._loaded[chat_id] = {
+                attribute: value.value if attribute.startswith(CHAT_DATA_PREFIX) else value
+                for attribute, value in item.items() if attribute not in ('wallet', 'timestamp')
+            }
+        return self._loaded[chat_id]
+
+    @staticmethod
+    def _conversation_attribute(name: str, key: ConversationKey) -> str:
+        return f'{CONVERSATION_PREFIX}{name}:{",".join(str(k) for k in key)}'
+
+    @staticmethod
+    def _parse_conversation_attribute(attribute: str) -> Tuple[Optional[str], Optional[Tuple[int, ...]]]:
+        if not attribute.startswith(CONVERSATION_PREFIX):
+            return None, None
+        name, key = attribute[len(CONVERSATION_PREFIX):].rsplit(':', 1)
+        return name, tuple(int(k) for k in key.split(','))
+
+    # The data below is not stored, see store_data
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: object) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
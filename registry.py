@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+
+from configuration import Configuration, ConfigurationError
+
+# Table of the payments of all the groups of a multi-tenant deployment, unless configured otherwise
+SHARED_TABLE = 'table-sw-shared-payments'
+
+# Names of the groups prefix their partitions in the shared table, see database.GROUP_SEPARATOR
+GROUP_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class Registry:
+    """
+    Configurations of the groups of users served by the bot, and the index of the groups by the chat ids.
+
+    JSON_CONFIG is either the configuration of a single group, or the bot token and a list of groups, each with a
+    name and the wallets and the users of a single group. The configuration of a group is built on the first update
+    of its users, and kept for the next ones of the container.
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        if data is None:
+            data = json.loads(os.environ["JSON_CONFIG"])
+            logging.info(f'ENV VARIABLE JSON_CONFIG: {data}')
+        self._token = data['bot_token']
+        self._multi_tenant = 'groups' in data
+        self._groups: Dict[Optional[str], Dict] = {}
+        if self._multi_tenant:
+            self._table_name = data.get('table', SHARED_TABLE)
+            for group in data['groups']:
+                name = group.get('name')
+                if type(name) != str or not GROUP_NAME.match(name):
+                    raise ConfigurationError(
+                        'Configuration error: names of the groups must be letters, digits, "-" or "_".')
+                if name in self._groups:
+                    raise ConfigurationError(f'Configuration error: group {name} is configured more than once.')
+                self._groups[name] = {**group, 'bot_token': self._token, 'group': name, 'table': self._table_name}
+        else:
+            self._groups[None] = data
+
+        self._groups_by_chat_id: Dict[int, Optional[str]] = {}
+        for name, group in self._groups.items():
+            for user in group.get('users', []):
+                chat_id = user.get('chat_id')
+                if chat_id in self._groups_by_chat_id:
+                    raise ConfigurationError(f'Configuration error: chat_id {chat_id} is in more than one group.')
+                self._groups_by_chat_id[chat_id] = name
+        self._configurations: Dict[Optional[str], Configuration] = {}
+
+    def get_token(self) -> str:
+        return self._token
+
+    def is_multi_tenant(self) -> bool:
+        return self._multi_tenant
+
+    def get_groups(self) -> List[Optional[str]]:
+        return list(self._groups)
+
+    def get_chat_ids(self) -> List[int]:
+        """Chat ids of the users of all the groups"""
+        return list(self._groups_by_chat_id)
+
+    def is_user(self, chat_id: int) -> bool:
+        return chat_id in self._groups_by_chat_id
+
+    def get_group(self, chat_id: int) -> Optional[str]:
+        if chat_id not in self._groups_by_chat_id:
+            raise ValueError(f'Unable to find the group of chat_id: {chat_id}')
+        return self._groups_by_chat_id[chat_id]
+
+    def get_configuration(self, group: Optional[str] = None) -> Configuration:
+        if group not in self._configurations:
+            if group not in self._groups:
+                raise ValueError(f'Unknown group {group}')
+            self._configurations[group] = Configuration(self._groups[group])
+        return self._configurations[group]
+
+    def get_table_name(self) -> str:
+        if self._multi_tenant:
+            return self._table_name
+        return self.get_configuration().get_table_name()
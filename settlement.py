@@ -0,0 +1,53 @@
+import heapq
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+@dataclass(frozen=True)
+class Transfer:
+    payer: str
+    payee: str
+    # In minor units of the wallet
+    amount: int
+
+
+def net_balances(totals: Dict[str, int], members: List[str]) -> Dict[str, int]:
+    """
+    Returns what every member paid minus their equal share of all the payments, in minor units. The minor units that
+    cannot be split equally are owed by the first members, so that the balances always sum up to zero.
+    """
+    share, remainder = divmod(sum(totals.get(member, 0) for member in members), len(members))
+    return {member: totals.get(member, 0) - share - (1 if i < remainder else 0) for i, member in enumerate(members)}
+
+
+def settle(balances: Dict[str, int]) -> List[Transfer]:
+    """
+    Returns transfers that bring the net balances of the members to zero, e.g. {'A': 5, 'B': -3, 'C': -2} is settled
+    by B paying 3 and C paying 2 to A.
+
+    The largest debt is repeatedly paid to the largest credit, with a heap of the creditors and one of the debtors.
+    Every transfer settles at least one of the two members, hence there are at most N - 1 transfers for N members,
+    in O(N log N). Finding the fewest transfers is NP-hard, this greedy netting is close to it in practice.
+    """
+    if sum(balances.values()) != 0:
+        raise ValueError(f'The balances do not sum up to zero: {balances}')
+    # The heaps are ordered by the largest amount, then by the name to make the transfers deterministic
+    creditors = [(-amount, member) for member, amount in balances.items() if amount > 0]
+    debtors = [(amount, member) for member, amount in balances.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    transfers = []
+    while creditors and debtors:
+        credit, payee = creditors[0]
+        debt, payer = debtors[0]
+        amount = min(-credit, -debt)
+        transfers.append(Transfer(payer, payee, amount))
+        if amount == -credit:
+            heapq.heappop(creditors)
+        else:
+            heapq.heapreplace(creditors, (credit + amount, payee))
+        if amount == -debt:
+            heapq.heappop(debtors)
+        else:
+            heapq.heapreplace(debtors, (debt + amount, payer))
+    return transfers
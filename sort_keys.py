@@ -0,0 +1,91 @@
+import secrets
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+# Sort keys of the payments: their time to the microsecond and a suffix of 4 hexadecimal digits that breaks the ties,
+# e.g. '2024-01-01 10:00:00.123456~3f9a'. They sort in the order of the payments, like the keys of the second
+# written before them, e.g. '2024-01-01 10:00:00', which sort before the new keys of the same second.
+KEY_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+SEPARATOR = '~'
+END = '\uffff'
+
+# Length of the keys of the second, i.e. of the dates shown to the users, and of their month, e.g. '2024-01'
+SECOND_LENGTH = 19
+MONTH_LENGTH = 7
+
+
+class KeyClock:
+    """
+    Generates strictly increasing keys in a container. The suffix is random per container, so that two containers
+    writing in the same microsecond do not collide, but for a chance of 1 in 65536 that the conditional write of the
+    payment catches.
+    """
+
+    def __init__(self, suffix: Optional[str] = None):
+        self._suffix = suffix or secrets.token_hex(2)
+        self._last: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def next(self, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now()
+        with self._lock:
+            if self._last and now <= self._last:
+                now = self._last + timedelta(microseconds=1)
+            self._last = now
+        return f'{now.strftime(KEY_FORMAT)}{SEPARATOR}{self._suffix}'
+
+
+def import_key(timestamp: str, occurrence: int) -> str:
+    """
+    Key of an imported payment of the ISO timestamp, e.g. '2024-01-01 10:00:00', and the number of payments of its
+    wallet before it at the same time. The same history is always imported with the same keys.
+    """
+    time = datetime.fromisoformat(timestamp)
+    return f'{time.strftime(KEY_FORMAT)}{SEPARATOR}{occurrence:04x}'
+
+
+def is_second_key(key: str) -> bool:
+    """Whether the key is of a payment written before the keys had microseconds"""
+    return len(key) == SECOND_LENGTH
+
+
+def date(key: str) -> str:
+    return key[:SECOND_LENGTH]
+
+
+def end_of(prefix: str) -> str:
+    """
+    Upper bound of the keys that start with the prefix, e.g. a day or a month, the characters of the keys all sort
+    before the last character of the bound
+    """
+    return f'{prefix}{END}'
+
+
+def month(key: str) -> str:
+    return key[:MONTH_LENGTH]
+
+
+def add_months(key_month: str, months: int) -> str:
+    """Month `months` after the month, or before it if negative, e.g. add_months('2024-01', -1) == '2023-12'"""
+    year, number = key_month.split('-')
+    index = int(year) * 12 + int(number) - 1 + months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def compact_key(key: str) -> str:
+    """
+    The key without its separators, e.g. '20240101100000123456~3f9a' for '2024-01-01 10:00:00.123456~3f9a', for the
+    places where its length matters, e.g. the data of a button of Telegram
+    """
+    time, separator, suffix = key.partition(SEPARATOR)
+    return ''.join(c for c in time if c.isdigit()) + separator + suffix
+
+
+def expand_key(compact: str) -> str:
+    """The key of compact_key, ValueError is raised if `compact` is not one"""
+    digits, separator, suffix = compact.partition(SEPARATOR)
+    if not digits.isdigit() or len(digits) not in (14, 20) or bool(separator) != (len(digits) == 20):
+        raise ValueError(f'Invalid compact key: {compact}')
+    key = f'{digits[0:4]}-{digits[4:6]}-{digits[6:8]} {digits[8:10]}:{digits[10:12]}:{digits[12:14]}'
+    return f'{key}.{digits[14:]}{separator}{suffix}' if separator else key
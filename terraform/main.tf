@@ -17,7 +17,8 @@ provider "aws" {
 }
 
 locals {
-  usernames = lower("${var.username1}-${var.username2}")
+  # A multi-tenant deployment is named after var.deployment, e.g. "shared" for the table-sw-shared-payments table
+  usernames = var.deployment != "" ? lower(var.deployment) : lower("${var.username1}-${var.username2}")
 }
 
 resource "aws_dynamodb_table" "table-sw-users" {
@@ -35,6 +36,26 @@ resource "aws_dynamodb_table" "table-sw-users" {
     name = "timestamp"
     type = "S"
   }
+
+  attribute {
+    name = "payer_partition"
+    type = "S"
+  }
+
+  # The payments of every payer across the wallets, in the order of their keys. Only the payments have a
+  # payer_partition, the items of the balances, the chats, the checkpoints and the stats are not in the index
+  global_secondary_index {
+    name            = "payer-timestamp-index"
+    hash_key        = "payer_partition"
+    range_key       = "timestamp"
+    projection_type = "ALL"
+  }
+
+  # The items of the updates processed by the webhook are deleted a day after they are received, see update_log.py
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
 }
 
 resource "aws_iam_role" "lambda_role" {
@@ -77,7 +98,9 @@ resource "aws_iam_policy" "iam_policy_for_lambda" {
     {
       "Action" : [
         "dynamodb:GetItem",
+        "dynamodb:BatchGetItem",
         "dynamodb:PutItem",
+        "dynamodb:BatchWriteItem",
         "dynamodb:UpdateItem",
         "dynamodb:DeleteItem",
         "dynamodb:Query",
@@ -85,6 +108,14 @@ resource "aws_iam_policy" "iam_policy_for_lambda" {
       ],
       "Resource": "arn:aws:dynamodb:eu-central-1:*:table/table-sw-${local.usernames}*",
       "Effect": "Allow"
+    },
+    {
+      "Action" : [
+        "s3:GetObject",
+        "s3:PutObject"
+      ],
+      "Resource": "${aws_s3_bucket.archive-sw.arn}/*",
+      "Effect": "Allow"
     }
   ]
 }
@@ -108,10 +139,55 @@ resource "aws_lambda_function" "fn-shared-wallet" {
   environment {
     variables = {
       JSON_CONFIG = var.json_config
+      ARCHIVE_URL = "s3://${aws_s3_bucket.archive-sw.bucket}"
     }
   }
 }
 
+# Archive segments of the payments moved out of the table by the compaction. The bucket is never empty once the
+# compaction ran, the destroy workflow deletes the segments with it
+resource "aws_s3_bucket" "archive-sw" {
+  bucket        = "s3-sw-${local.usernames}-archive"
+  force_destroy = true
+}
+
+# The compaction runs daily from the same package, it archives the payments older than 90 days
+resource "aws_lambda_function" "fn-shared-wallet-compaction" {
+  filename         = "${path.module}/../my_deployment_package.zip"
+  source_code_hash = filebase64sha256("${path.module}/../my_deployment_package.zip")
+  function_name    = "fn-sw-${local.usernames}-compaction"
+  role             = aws_iam_role.lambda_role.arn
+  handler          = "compaction.lambda_handler"
+  runtime          = "python3.10"
+  timeout          = 900
+  depends_on       = [aws_iam_role_policy_attachment.attach_iam_policy_to_iam_role]
+
+  environment {
+    variables = {
+      JSON_CONFIG = var.json_config
+      ARCHIVE_URL = "s3://${aws_s3_bucket.archive-sw.bucket}"
+    }
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "compaction-sw" {
+  name                = "compaction-sw-${local.usernames}"
+  schedule_expression = "rate(1 day)"
+}
+
+resource "aws_cloudwatch_event_target" "compaction-sw" {
+  rule = aws_cloudwatch_event_rule.compaction-sw.name
+  arn  = aws_lambda_function.fn-shared-wallet-compaction.arn
+}
+
+resource "aws_lambda_permission" "permission-compaction-sw" {
+  statement_id  = "AllowEventBridgeInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.fn-shared-wallet-compaction.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.compaction-sw.arn
+}
+
 resource "aws_apigatewayv2_api" "api-gateway-sw" {
   name          = "api-sw-${local.usernames}"
   protocol_type = "HTTP"
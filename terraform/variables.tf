@@ -4,9 +4,18 @@ variable "json_config" {
 }
 
 variable "username1" {
-  type = string
+  type    = string
+  default = ""
 }
 
 variable "username2" {
-  type = string
+  type    = string
+  default = ""
+}
+
+# Name of a multi-tenant deployment, or of a group of more than two users, which is named after it instead of the two
+# users above. Its JSON_CONFIG sets the "table" table-sw-<deployment>-payments
+variable "deployment" {
+  type    = string
+  default = ""
 }
\ No newline at end of file
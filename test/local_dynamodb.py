@@ -0,0 +1,39 @@
+import os
+
+import boto3
+
+# moto intercepts every call of boto3, these only keep botocore from looking for real credentials
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+CFG_JSON = '{"bot_token": "123456:my_bot_token",' \
+           '"wallets": [{"currency": "Dollar", "symbol": "$"}, {"currency": "Toman", "symbol": "T"}],' \
+           '"users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}]}'
+
+TABLE_NAME = 'table-sw-julia-jack-payments'
+
+
+def create_table(name: str = TABLE_NAME):
+    """Creates the payments table as it is defined in terraform/main.tf. Must be called inside moto's mock_aws"""
+    return boto3.resource('dynamodb').create_table(
+        TableName=name,
+        BillingMode='PAY_PER_REQUEST',
+        KeySchema=[
+            {'AttributeName': 'wallet', 'KeyType': 'HASH'},
+            {'AttributeName': 'timestamp', 'KeyType': 'RANGE'},
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'wallet', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'payer_partition', 'AttributeType': 'S'},
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'payer-timestamp-index',
+            'KeySchema': [
+                {'AttributeName': 'payer_partition', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+        }],
+    )
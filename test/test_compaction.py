@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from moto import mock_aws
+
+from test.local_dynamodb import CFG_JSON, create_table
+from archive import DirectoryStore, decode_segment
+from compaction import compact
+from database import Database
+from payment import Payment
+from registry import Registry
+
+
+class TestCompaction(unittest.TestCase):
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        create_table()
+
+    # --------------compact()--------------
+    def test_compact(self):
+        # Should archive the payments older than the given days in every wallet
+        registry = Registry(json.loads(CFG_JSON))
+        database = Database(registry.get_configuration())
+        database.add_payment(Payment('Julia', '1', 'Dollar', '$', '-'), '2024-01-01 10:00:00')
+        database.add_payment(Payment('Jack', '2', 'Toman', 'T', '-'), '2024-01-01 10:00:00')
+        database.add_payment(Payment('Jack', '3', 'Toman', 'T', '-'), '2024-05-30 10:00:00')
+        archived = compact(registry, 90, DirectoryStore(self.directory), now=datetime(2024, 6, 1))
+        self.assertEqual({'Dollar': 1, 'Toman': 1}, archived)
+        segment = os.path.join(self.directory, 'table-sw-julia-jack-payments', 'Toman', '000000.ndjson.gz')
+        with open(segment, 'rb') as f:
+            self.assertEqual([{'wallet': 'Toman', 'timestamp': '2024-01-01 10:00:00', 'payer': 'Jack',
+                               'payer_partition': 'Jack', 'amount': 200, 'note': '-'}], list(decode_segment(f.read())))
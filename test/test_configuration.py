@@ -1,3 +1,4 @@
+import json
 import os
 import unittest
 from json import JSONDecodeError
@@ -45,13 +46,13 @@ class TestConfiguration(unittest.TestCase):
         self.assertEqual('Configuration error: the wallet must have unique currency names.', str(cm.exception))
 
     def test_init5(self):
-        # Should fail because number of configured users is not 2
+        # Should fail because less than 2 users are configured
         os.environ["JSON_CONFIG"] = ('{"bot_token": "foo",'
                            '"wallets": [{"currency": "Dollar", "symbol": "$"}],'
                            '"users": [{"name": "Julia", "chat_id": 1234}]}')
         with self.assertRaises(ConfigurationError) as cm:
             Configuration()
-        self.assertEqual('Configuration error: number of configured users must be 2, while it is 1', str(cm.exception))
+        self.assertEqual('Configuration error: number of configured users must be at least 2, while it is 1', str(cm.exception))
 
     def test_init6(self):
         # Should fail because type of username is not str
@@ -76,6 +77,26 @@ class TestConfiguration(unittest.TestCase):
         os.environ["JSON_CONFIG"] = TestConfiguration.VALID_CFG_JSON
         Configuration()
 
+    def test_init9(self):
+        # Should fail because the precision of a wallet is not an int
+        os.environ["JSON_CONFIG"] = ('{"bot_token": "my_bot_token",'
+                           '"wallets": [{"currency": "Dollar", "symbol": "$", "precision": "2"}],'
+                           '"users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}]}')
+        with self.assertRaises(ConfigurationError) as cm:
+            Configuration()
+        self.assertEqual('Configuration error: precision of the wallets must be an int between 0 and 6',
+                         str(cm.exception))
+
+    def test_init10(self):
+        # Should fail because terraform only names the tables of single groups of two users
+        data = json.loads(TestConfiguration.VALID_CFG_JSON)
+        data['users'].append({'name': 'Carl', 'chat_id': 5555})
+        with self.assertRaises(ConfigurationError) as cm:
+            Configuration(data)
+        self.assertIn('must set the "table" of its deployment', str(cm.exception))
+        self.assertEqual('table-sw-family-payments',
+                         Configuration({**data, 'table': 'table-sw-family-payments'}).get_table_name())
+
     # --------------get_token()--------------
     def test_get_token(self):
         os.environ["JSON_CONFIG"] = TestConfiguration.VALID_CFG_JSON
@@ -147,3 +168,18 @@ class TestConfiguration(unittest.TestCase):
         non_existing_currency = 'NonExistingCurrency'
         with self.assertRaises(ValueError, msg=f'Unknown currency {non_existing_currency}'):
             Configuration().get_wallet_symbol(non_existing_currency)
+
+    # --------------get_wallet_precision()--------------
+    def test_get_wallet_precision(self):
+        os.environ["JSON_CONFIG"] = ('{"bot_token": "my_bot_token",'
+                                     '"wallets": [{"currency": "Dollar", "symbol": "$"},'
+                                     '{"currency": "Toman", "symbol": "T", "precision": 0}],'
+                                     '"users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}]}')
+        config = Configuration()
+        self.assertEqual(2, config.get_wallet_precision('Dollar'))
+        self.assertEqual(0, config.get_wallet_precision('Toman'))
+
+    def test_get_wallet_precision2(self):
+        os.environ["JSON_CONFIG"] = TestConfiguration.VALID_CFG_JSON
+        with self.assertRaises(ValueError):
+            Configuration().get_wallet_precision('NonExistingCurrency')
@@ -0,0 +1,594 @@
+import json
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from boto3.dynamodb.conditions import Key
+from moto import mock_aws
+
+from test.local_dynamodb import CFG_JSON, TABLE_NAME, create_table
+from archive import DirectoryStore
+from configuration import Configuration
+from database import (
+    BALANCE_PARTITION, Balance, CACHE_MAX_ROWS, CACHE_SEED_ROWS, STATS_PARTITION, Database, MonthStats,
+    PaymentExistsError, PrecisionMismatchError
+)
+from ledger_cache import LedgerCache
+from payment import Payment
+
+
+class TestDatabase(unittest.TestCase):
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        os.environ["JSON_CONFIG"] = CFG_JSON
+        self.config = Configuration()
+        self.table = create_table()
+        self.database = Database(self.config)
+
+    def add(self, payer: str, amount: str, timestamp: str, wallet: str = 'Dollar', database: Database = None):
+        payment = Payment(payer, amount, wallet, self.config.get_wallet_symbol(wallet), '-')
+        (database or self.database).add_payment(payment, timestamp)
+
+    def count_queries(self, database: Database) -> list:
+        # Records the number of items read by every query of the database
+        scanned = []
+        query = database._table.query
+
+        def counting_query(**kwargs):
+            response = query(**kwargs)
+            scanned.append(response['ScannedCount'])
+            return response
+
+        database._table.query = counting_query
+        return scanned
+
+    # --------------add_payment()--------------
+    def test_add_payment(self):
+        # Should maintain the balance aggregate along with the payments
+        self.add('Julia', '10.50', '2024-01-01 10:00:00')
+        self.add('Jack', '3', '2024-01-01 11:00:00')
+        self.add('Julia', '20', '2024-01-01 12:00:00', wallet='Toman')
+        item = self.table.get_item(Key={'wallet': BALANCE_PARTITION, 'timestamp': 'Dollar'})['Item']
+        self.assertEqual({'Julia': 1050, 'Jack': 300}, item['totals'])
+        self.assertEqual(2, item['precision'])
+        self.assertEqual(2, item['count'])
+        self.assertEqual(3, len(self.database.get_payments()))
+
+    def test_add_payment2(self):
+        # Should fail because a payment already exists at the same time in the same wallet
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        with self.assertRaises(PaymentExistsError):
+            self.add('Jack', '5', '2024-01-01 10:00:00')
+        self.assertEqual(1000, self.database.rebuild_balance('Dollar')['totals']['Julia'])
+
+    def test_add_payment3(self):
+        # Should retry on the new version when the other user writes the aggregate concurrently
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        other = Database(self.config)
+        read_balance_item = self.database._get_balance_item
+        interleaved = []
+
+        def read_then_interleave(wallet):
+            item = read_balance_item(wallet)
+            if not interleaved:
+                interleaved.append(True)
+                self.add('Jack', '4', '2024-01-01 10:00:01', database=other)
+            return item
+
+        self.database._get_balance_item = read_then_interleave
+        self.add('Julia', '1', '2024-01-01 10:00:02')
+        self.database._get_balance_item = read_balance_item
+        self.assertEqual(700, self.database.get_balance('Dollar').amount)
+        self.assertEqual(3, self.database._get_balance_item('Dollar')['count'])
+
+    def test_add_payment4(self):
+        # Should return the balance of the wallet after the payment, the same as a following get_balance
+        self.add('Jack', '4', '2024-01-01 10:00:00')
+        balance = self.database.add_payment(Payment('Julia', '10', 'Dollar', '$', '-'), '2024-01-01 11:00:00')
+        self.assertEqual(Balance(creditor='Julia', debtor='Jack', amount=600), balance)
+        self.assertEqual(balance, Database(self.config).get_balance('Dollar'))
+
+    # --------------get_balance()--------------
+    def test_get_balance(self):
+        self.assertEqual(0, self.database.get_balance('Dollar').amount)
+        self.add('Julia', '10.25', '2024-01-01 10:00:00')
+        self.add('Jack', '20', '2024-01-01 11:00:00')
+        balance = self.database.get_balance('Dollar')
+        self.assertEqual(('Jack', 'Julia', 975), (balance.creditor, balance.debtor, balance.amount))
+        # Two members lend to and borrow from each other, the nets are the difference rather than equal shares
+        self.assertEqual({'Jack': 975, 'Julia': -975}, balance.nets)
+
+    def test_get_balance2(self):
+        # Should rebuild the aggregate when it is missing, e.g. for payments written before it existed
+        self.table.put_item(Item={'wallet': 'Dollar', 'timestamp': '2024-01-01 10:00:00', 'payer': 'Julia',
+                                  'amount': 1250, 'note': '-'})
+        balance = self.database.get_balance('Dollar')
+        self.assertEqual(('Julia', 'Jack', 1250), (balance.creditor, balance.debtor, balance.amount))
+        self.assertIsNotNone(self.database._get_balance_item('Dollar'))
+
+    def test_get_balance3(self):
+        # Should give the net balance of every member of a wallet shared by more than two
+        data = json.loads(CFG_JSON)
+        data['users'].append({'name': 'Carl', 'chat_id': 5555})
+        config = Configuration({**data, 'table': TABLE_NAME})
+        database = Database(config)
+        self.add('Jack', '30', '2024-01-01 10:00:00', database=database)
+        self.add('Carl', '0.01', '2024-01-01 11:00:00', database=database)
+        balance = database.get_balance('Dollar')
+        self.assertEqual(('Jack', 'Julia', 3000), (balance.creditor, balance.debtor, balance.amount))
+        self.assertEqual({'Julia': -1001, 'Jack': 2000, 'Carl': -999}, balance.nets)
+
+    def test_get_balance4(self):
+        # Should refuse the payments stored with another precision than the configured one of the wallet
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        data = json.loads(CFG_JSON)
+        data['wallets'][0]['precision'] = 3
+        database = Database(Configuration(data))
+        with self.assertRaises(PrecisionMismatchError):
+            database.get_balance('Dollar')
+        with self.assertRaises(PrecisionMismatchError):
+            database.get_last_payments(10)
+        with self.assertRaises(PrecisionMismatchError):
+            self.add('Julia', '10', '2024-01-01 11:00:00', database=database)
+        self.assertEqual(1000, self.database.get_balance('Dollar').amount)
+
+    # --------------rebuild_balance()--------------
+    def test_rebuild_balance(self):
+        # Should repair a stale aggregate from the payments
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        self.table.put_item(Item={'wallet': 'Dollar', 'timestamp': '2024-01-01 11:00:00', 'payer': 'Julia',
+                                  'amount': 500, 'note': '-'})
+        self.assertEqual(1000, self.database.get_balance('Dollar').amount)
+        self.database.rebuild_balance('Dollar')
+        self.assertEqual(1500, self.database.get_balance('Dollar').amount)
+
+    def test_rebuild_balance2(self):
+        # Should rebuild the aggregates that were built from decimal amounts
+        self.table.put_item(Item={'wallet': 'Dollar', 'timestamp': '2024-01-01 10:00:00', 'payer': 'Julia',
+                                  'amount': '10.5', 'note': '-'})
+        self.table.put_item(Item={'wallet': BALANCE_PARTITION, 'timestamp': 'Dollar',
+                                  'totals': {'Julia': Decimal('10.5')}, 'count': 1, 'version': 1})
+        self.assertEqual(1050, self.database.get_balance('Dollar').amount)
+
+    # --------------migrate_amounts()--------------
+    def test_migrate_amounts(self):
+        # Should convert the decimal string amounts to minor units, and leave the converted ones
+        self.add('Jack', '1.5', '2024-01-01 09:00:00')
+        for i, amount in enumerate(['12.50', '3', '0.07']):
+            self.table.put_item(Item={'wallet': 'Dollar', 'timestamp': f'2024-01-01 10:00:0{i}', 'payer': 'Julia',
+                                      'amount': amount, 'note': '-'})
+        self.assertEqual(['1.5', '12.50', '3', '0.07'], [p.amount for p in self.database.get_payments()])
+        self.assertEqual(3, self.database.migrate_amounts())
+        amounts = [item['amount'] for item in self.table.query(
+            KeyConditionExpression=Key('wallet').eq('Dollar'))['Items']]
+        self.assertEqual([150, 1250, 300, 7], amounts)
+        self.assertEqual(['1.5', '12.5', '3', '0.07'], [p.amount for p in self.database.get_payments()])
+        self.assertEqual(1407, self.database.get_balance('Dollar').amount)
+        self.assertEqual(0, self.database.migrate_amounts())
+
+    def test_add_payment5(self):
+        # Should retry with a new key when another container wrote a payment at the same key
+        keys = ['2024-01-01 10:00:00.000001~3f9a', '2024-01-01 10:00:00.000001~3f9a',
+                '2024-01-01 10:00:00.000002~3f9a', '2024-01-01 10:00:00.000003~3f9a']
+        with mock.patch.object(self.database._keys, 'next', side_effect=keys):
+            for amount in ['1', '2', '3']:
+                self.database.add_payment(Payment('Julia', amount, 'Dollar', '$', '-'))
+        payments = self.database.get_payments('Dollar')
+        self.assertEqual([('1', keys[0]), ('2', keys[2]), ('3', keys[3])], [(p.amount, p.key) for p in payments])
+        self.assertEqual({'2024-01-01 10:00:00'}, {p.date for p in payments})
+        self.assertEqual(600, self.database.get_balance('Dollar').amount)
+
+    # --------------add_payments()--------------
+    def test_add_payments(self):
+        # Should retry the items that DynamoDB left unprocessed
+        payments = [(Payment('Julia', str(i), 'Dollar', '$', '-'), f'2024-01-01 10:00:{i:02}') for i in range(25)]
+        client = self.database._table.meta.client
+        batch_write_item = client.batch_write_item
+        calls = []
+
+        def throttled_batch_write_item(RequestItems):
+            calls.append(len(RequestItems[TABLE_NAME]))
+            if len(calls) == 1:
+                # Only the first ten items are processed
+                batch_write_item(RequestItems={TABLE_NAME: RequestItems[TABLE_NAME][:10]})
+                return {'UnprocessedItems': {TABLE_NAME: RequestItems[TABLE_NAME][10:]}}
+            return batch_write_item(RequestItems=RequestItems)
+
+        with mock.patch.object(client, 'batch_write_item', side_effect=throttled_batch_write_item):
+            self.database.add_payments(payments)
+        self.assertEqual([25, 15], calls)
+        self.assertEqual(25, len(self.database.get_payments('Dollar')))
+
+    def test_add_payments2(self):
+        # Should fail because a batch write has at most 25 items
+        payments = [(Payment('Julia', '1', 'Dollar', '$', '-'), f'2024-01-01 10:00:{i:02}') for i in range(26)]
+        with self.assertRaises(ValueError):
+            self.database.add_payments(payments)
+
+    # --------------get_payments()--------------
+    def test_get_payments(self):
+        # Should merge the wallets in the order of the timestamps
+        self.add('Julia', '1', '2024-01-03 10:00:00')
+        self.add('Jack', '2', '2024-01-01 10:00:00', wallet='Toman')
+        self.add('Julia', '3', '2024-01-02 10:00:00')
+        payments = self.database.get_payments()
+        self.assertEqual(['2', '3', '1'], [p.amount for p in payments])
+        self.assertEqual(['Toman', 'Dollar', 'Dollar'], [p.wallet for p in payments])
+        self.assertEqual(['3', '1'], [p.amount for p in self.database.get_payments('Dollar')])
+
+    # --------------iter_payments()--------------
+    def test_iter_payments(self):
+        # Should follow the pages of the wallets without losing any payment
+        for i in range(25):
+            self.add('Julia', str(i), f'2024-01-01 10:00:{i:02}', wallet='Dollar' if i % 3 else 'Toman')
+        payments = list(self.database.iter_payments(page_size=4))
+        self.assertEqual([str(i) for i in range(25)], [p.amount for p in payments])
+
+    def test_iter_payments2(self):
+        # Should only read the first page of every wallet to yield the first payment
+        for i in range(10):
+            self.add('Jack', str(i), f'2024-01-01 10:00:{i:02}', wallet='Dollar' if i % 2 else 'Toman')
+        queries = []
+        query = self.database._table.query
+
+        def counting_query(**kwargs):
+            queries.append(kwargs)
+            return query(**kwargs)
+
+        self.database._table.query = counting_query
+        payment = next(self.database.iter_payments(page_size=2))
+        self.assertEqual('0', payment.amount)
+        self.assertEqual(2, len(queries))
+
+    def test_iter_payments3(self):
+        # Should only read the projected attributes and the keys
+        self.add('Julia', '1', '2024-01-01 10:00:00', wallet='Toman')
+        payment = next(self.database.iter_payments('Toman', projection=['amount']))
+        self.assertEqual(('1', 'Toman', '2024-01-01 10:00:00'), (payment.amount, payment.wallet, payment.date))
+        self.assertIsNone(payment.payer)
+        self.assertIsNone(payment.note)
+        # Only the keys
+        payment = next(self.database.iter_payments('Toman', projection=[], archived=True))
+        self.assertEqual(('Toman', '2024-01-01 10:00:00', None), (payment.wallet, payment.key, payment.amount))
+
+    def test_get_payments2(self):
+        # Should only read the payments between the bounds, both included
+        for day in range(1, 6):
+            self.add('Julia', str(day), f'2024-03-0{day} 10:00:00', wallet='Dollar' if day % 2 else 'Toman')
+        scanned = self.count_queries(self.database)
+        payments = self.database.get_payments(since='2024-03-02', until='2024-03-04')
+        self.assertEqual(['2', '3', '4'], [p.amount for p in payments])
+        self.assertEqual(3, sum(scanned))
+        self.assertEqual(['4', '5'], [p.amount for p in self.database.get_payments(since='2024-03-04')])
+        self.assertEqual(['1', '3'], [p.amount for p in self.database.get_payments('Dollar', until='2024-03-04')])
+        with self.assertRaises(ValueError):
+            self.database.get_payments(since='2024-04', until='2024-03')
+
+    def test_get_payments3(self):
+        # Should only read the payments of the payer from the payer index
+        self.add('Julia', '1', '2024-03-01 10:00:00')
+        self.add('Jack', '2', '2024-03-02 10:00:00', wallet='Toman')
+        self.add('Jack', '3', '2024-03-03 10:00:00')
+        self.add('Jack', '4', '2024-04-01 10:00:00')
+        scanned = self.count_queries(self.database)
+        self.assertEqual(['2', '3', '4'], [p.amount for p in self.database.get_payments(payer='Jack')])
+        self.assertEqual([3], scanned)
+        self.assertEqual(['3'], [p.amount for p in self.database.get_payments('Dollar', until='2024-03', payer='Jack')])
+        with self.assertRaises(ValueError):
+            self.database.get_payments(payer='Jack', archived=True)
+
+    def test_get_payments4(self):
+        # Should skip the archived payments out of the bounds
+        database = self.archived_database()
+        self.compact(database)
+        payments = database.get_payments(archived=True, since='2024-01-02', until='2024-03-01')
+        self.assertEqual(['2', '3', '4', '5', '10'], [p.amount for p in payments])
+
+    def test_get_payments5(self):
+        # Should keep the payments of a wallet removed from the configuration in the full history
+        self.add('Jack', '1', '2024-01-01 10:00:00')
+        self.add('Julia', '2.5', '2024-01-02 10:00:00', wallet='Toman')
+        data = json.loads(CFG_JSON)
+        data['wallets'] = [w for w in data['wallets'] if w['currency'] != 'Toman']
+        database = Database(Configuration(data))
+        payments = database.get_payments(archived=True)
+        self.assertEqual([('1', 'Dollar', '$'), ('2.5', 'Toman', 'Toman')],
+                         [(p.amount, p.wallet, p.wallet_symbol) for p in payments])
+        self.assertEqual(['1'], [p.amount for p in database.get_payments()])
+
+    # --------------migrate_payers()--------------
+    def test_migrate_payers(self):
+        # Should add the payments written before the payer index to the index
+        self.add('Jack', '1', '2024-01-01 10:00:00')
+        self.table.update_item(Key={'wallet': 'Dollar', 'timestamp': '2024-01-01 10:00:00'},
+                               UpdateExpression='REMOVE payer_partition')
+        self.assertEqual([], self.database.get_payments(payer='Jack'))
+        self.assertEqual(1, self.database.migrate_payers())
+        self.assertEqual(['1'], [p.amount for p in self.database.get_payments(payer='Jack')])
+        self.assertEqual(0, self.database.migrate_payers())
+
+    # --------------iter_frames()--------------
+    def test_iter_frames(self):
+        # Should fill frames of at most `rows` payments in the order of the timestamps
+        for i in range(5):
+            self.add('Julia' if i % 2 else 'Jack', f'{i}.5', f'2024-01-01 10:00:{i:02}',
+                     wallet='Dollar' if i % 2 else 'Toman')
+        frames = list(self.database.iter_frames(rows=2, notes=False))
+        self.assertEqual([2, 2, 1], [len(frame) for frame in frames])
+        self.assertEqual(['Toman', 'Dollar'], frames[0].wallets)
+        self.assertEqual([None, None], frames[0].notes)
+        frame = self.database.get_frame()
+        self.assertEqual({'Dollar': {'Julia': 500}, 'Toman': {'Jack': 750}}, frame.totals())
+        self.assertEqual(self.database.get_payments()[1].record(), list(frame.records())[1])
+
+    def test_iter_frames2(self):
+        # Should yield no frame without payments, and an empty one to get_frame
+        self.assertEqual([], list(self.database.iter_frames()))
+        self.assertEqual(0, len(self.database.get_frame()))
+
+    # --------------get_last_payments()--------------
+    def test_get_last_payments(self):
+        self.assertEqual(([], None), self.database.get_last_payments(5))
+
+    def test_get_last_payments2(self):
+        # Should page back through all the wallets, including the payments at the same second in different wallets
+        timestamps = ['2024-01-01 10:00:00', '2024-01-01 10:00:01', '2024-01-01 10:00:01', '2024-01-01 10:00:02',
+                      '2024-01-01 10:00:03', '2024-01-01 10:00:03', '2024-01-01 10:00:04']
+        for i, timestamp in enumerate(timestamps):
+            self.add('Julia', str(i), timestamp, wallet='Toman' if i in (1, 4) else 'Dollar')
+        pages, cursor = [], None
+        while True:
+            payments, cursor = self.database.get_last_payments(2, cursor)
+            pages.append([p.amount for p in payments])
+            if not cursor:
+                break
+        self.assertEqual([['4', '6'], ['3', '5'], ['2', '1'], ['0']], pages)
+
+    def test_get_last_payments3(self):
+        # Should not return a cursor when the last page is exactly full
+        for i in range(4):
+            self.add('Jack', str(i), f'2024-01-01 10:00:0{i}', wallet='Dollar' if i % 2 else 'Toman')
+        payments, cursor = self.database.get_last_payments(4)
+        self.assertEqual(['0', '1', '2', '3'], [p.amount for p in payments])
+        self.assertIsNone(cursor)
+
+    def test_get_last_payments4(self):
+        # Should read a bounded number of items, whatever the size of the history, and none once cached
+        for i in range(CACHE_SEED_ROWS + 10):
+            self.add('Jack', str(i), f'2024-01-01 10:{i // 60:02}:{i % 60:02}')
+        scanned = self.count_queries(self.database)
+        payments, cursor = self.database.get_last_payments(5)
+        self.assertEqual(str(CACHE_SEED_ROWS + 9), payments[-1].amount)
+        self.assertLessEqual(max(scanned), CACHE_SEED_ROWS)
+
+        scanned.clear()
+        self.database.get_last_payments(5)
+        self.assertEqual([], scanned)
+
+        # The payments before the cached ones are read with one query of N items
+        while len(payments) == 5 and payments[0].amount != '10':
+            payments, cursor = self.database.get_last_payments(5, cursor)
+        self.assertEqual([], scanned)
+        payments, cursor = self.database.get_last_payments(5, cursor)
+        self.assertEqual(['5', '6', '7', '8', '9'], [p.amount for p in payments])
+        self.assertEqual([5], scanned)
+
+    def test_get_last_payments5(self):
+        # Should fail because the cursor is not one of the database
+        with self.assertRaises(ValueError):
+            self.database.get_last_payments(5, 'not a cursor')
+
+    def test_get_last_payments6(self):
+        # Should page back through the payments of the payer with one query of the payer index per page
+        for i in range(5):
+            self.add('Jack' if i % 2 else 'Julia', str(i), f'2024-01-01 10:00:0{i}',
+                     wallet='Dollar' if i < 3 else 'Toman')
+        scanned = self.count_queries(self.database)
+        payments, cursor = self.database.get_last_payments(1, payer='Jack')
+        self.assertEqual(['3'], [p.amount for p in payments])
+        payments, cursor = self.database.get_last_payments(1, cursor, payer='Jack')
+        self.assertEqual(['1'], [p.amount for p in payments])
+        self.assertEqual([1, 1], scanned)
+
+    # --------------cache_stats()--------------
+    def test_cache_stats(self):
+        # Should only read the payments written by the other container since the last sync
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        self.assertEqual(1000, self.database.get_balance('Dollar').amount)
+        self.assertEqual(1000, self.database.get_balance('Dollar').amount)
+        other = Database(self.config)
+        self.add('Jack', '4', '2024-01-01 10:00:01', database=other)
+        self.add('Jack', '1', '2024-01-01 10:00:02', database=other)
+        scanned = self.count_queries(self.database)
+        self.assertEqual(500, self.database.get_balance('Dollar').amount)
+        self.assertEqual([2], scanned)
+        self.assertEqual({'hits': 1, 'misses': 1, 'deltas': 1, 'evictions': 0, 'wallets': 1, 'rows': 3},
+                         self.database.cache_stats())
+
+    def test_cache_stats2(self):
+        # Should apply the payments written by the container itself without reading them back
+        self.database.get_balance('Dollar')
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        self.add('Julia', '5', '2024-01-01 10:00:01')
+        scanned = self.count_queries(self.database)
+        self.assertEqual(['10', '5'], [p.amount for p in self.database.get_last_payments(5)[0]])
+        self.assertEqual(1500, self.database.get_balance('Dollar').amount)
+        # Only the empty Toman wallet is read, to build its balance and to cache it
+        self.assertEqual([0, 0], scanned)
+        self.assertEqual(0, self.database.cache_stats()['deltas'])
+
+    def test_cache_stats3(self):
+        # Should cache the wallet again when a payment before the last seen one was written, e.g. by an import
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        self.database.get_last_payments(5)
+        other = Database(self.config)
+        self.add('Jack', '1', '2023-01-01 10:00:00', database=other)
+        self.assertEqual(['1', '10'], [p.amount for p in self.database.get_last_payments(5)[0]])
+        self.assertEqual(3, self.database.cache_stats()['misses'])
+
+    def test_cache_stats4(self):
+        # Should keep the number of cached payments under the bound
+        database = Database(self.config, cache_max_rows=3)
+        for i in range(5):
+            self.add('Julia', '1', f'2024-01-01 10:00:0{i}', wallet='Toman')
+        self.add('Julia', '1', '2024-01-01 10:00:00')
+        self.assertEqual(['1'] * 3, [p.amount for p in database.get_last_payments(3)[0]])
+        self.assertEqual(500, database.get_balance('Toman').amount)
+        stats = database.cache_stats()
+        self.assertLessEqual(stats['rows'], 3)
+        self.assertGreater(stats['evictions'], 0)
+
+    def test_cache_stats5(self):
+        # Should cache a wallet again when it was cached while it was empty, there is no payment to read after
+        self.assertEqual(0, self.database.get_balance('Dollar').amount)
+        other = Database(self.config)
+        self.add('Jack', '4', '2024-01-01 10:00:00', database=other)
+        with mock.patch.object(self.database, '_iter_pages', wraps=self.database._iter_pages) as iter_pages:
+            self.assertEqual(400, self.database.get_balance('Dollar').amount)
+            self.assertEqual(['4'], [p.amount for p in self.database.get_last_payments(5)[0]])
+        # The payments after the last seen one are not read
+        self.assertEqual([], [call for call in iter_pages.call_args_list if call.args[3:4] == ('',)])
+        self.assertEqual({'hits': 1, 'misses': 3, 'deltas': 0, 'evictions': 0, 'wallets': 2, 'rows': 1},
+                         self.database.cache_stats())
+
+    # --------------migrate_keys()--------------
+    def test_migrate_keys(self):
+        # Should move the payments to the keys with microseconds, without duplicating them in a warm cache
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        self.add('Jack', '2', '2024-01-01 10:00:01')
+        self.database.get_last_payments(5)
+        self.assertEqual(2, Database(self.config).migrate_keys())
+        items = self.table.query(KeyConditionExpression=Key('wallet').eq('Dollar'))['Items']
+        self.assertEqual(['2024-01-01 10:00:00.000000~0000', '2024-01-01 10:00:01.000000~0000'],
+                         [item['timestamp'] for item in items])
+        self.database.add_payment(Payment('Jack', '1', 'Dollar', '$', '-'))
+        payments = self.database.get_last_payments(5)[0]
+        self.assertEqual(['10', '2', '1'], [p.amount for p in payments])
+        self.assertEqual('2024-01-01 10:00:00', payments[0].date)
+        self.assertEqual(0, Database(self.config).migrate_keys())
+
+    # --------------compact()--------------
+    def compact(self, database: Database = None) -> int:
+        # Julia pays 1 to 5 $ on the first five days of 2024, and Jack 10 $ on the 1st of March
+        for day in range(1, 6):
+            self.add('Julia', str(day), f'2024-01-0{day} 10:00:00')
+        self.add('Jack', '10', '2024-03-01 10:00:00')
+        return (database or self.database).compact('Dollar', '2024-02-01 00:00:00', segment_rows=2)
+
+    def archived_database(self) -> Database:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return Database(self.config, archive_store=DirectoryStore(directory.name))
+
+    def test_compact(self):
+        # Should move the old payments to segments and keep their totals in the checkpoint
+        database = self.archived_database()
+        self.assertEqual(5, self.compact(database))
+        hot = self.table.query(KeyConditionExpression=Key('wallet').eq('Dollar'))['Items']
+        self.assertEqual(['2024-03-01 10:00:00'], [item['timestamp'] for item in hot])
+        checkpoint = database._get_checkpoint('Dollar')
+        self.assertEqual(({'Julia': 1500}, 5, '2024-01-05 10:00:00', 3),
+                         (checkpoint['totals'], checkpoint['count'], checkpoint['until'], len(checkpoint['segments'])))
+        self.assertNotIn('pending', checkpoint)
+        # The balance combines the checkpoint and the payments in the table
+        self.assertEqual(Balance('Julia', 'Jack', 500), database.get_balance('Dollar'))
+        aggregate = database.rebuild_balance('Dollar')
+        self.assertEqual(({'Julia': 1500, 'Jack': 1000}, 6), (aggregate['totals'], aggregate['count']))
+        self.assertEqual(['10'], [p.amount for p in database.get_payments()])
+        self.assertEqual(['1', '2', '3', '4', '5', '10'], [p.amount for p in database.get_payments(archived=True)])
+        # Nothing is left to archive
+        self.assertEqual(0, database.compact('Dollar', '2024-02-01 00:00:00'))
+
+    def test_compact2(self):
+        # Should finish the deletion of a segment when the compaction was interrupted
+        database = self.archived_database()
+        with mock.patch.object(database, '_batch_write', side_effect=RuntimeError('interrupted')):
+            with self.assertRaises(RuntimeError):
+                self.compact(database)
+        self.assertEqual('2024-01-02 10:00:00', database._get_checkpoint('Dollar')['until'])
+        self.assertEqual(['1', '2', '3', '4', '5', '10'], [p.amount for p in database.get_payments(archived=True)])
+        self.assertEqual(3, database.compact('Dollar', '2024-02-01 00:00:00', segment_rows=2))
+        self.assertEqual(['10'], [p.amount for p in database.get_payments()])
+        self.assertEqual(['1', '2', '3', '4', '5', '10'], [p.amount for p in database.get_payments(archived=True)])
+
+    def test_compact3(self):
+        # Should fail because no archive is configured
+        with mock.patch.dict(os.environ), self.assertRaises(RuntimeError):
+            os.environ.pop('ARCHIVE_URL', None)
+            self.compact()
+
+    def test_compact4(self):
+        # Should yield the payments of the segments in order when older payments were imported after a compaction
+        database = self.archived_database()
+        self.compact(database)
+        self.add('Jack', '0.5', '2023-12-31 10:00:00', database=database)
+        self.add('Jack', '2.5', '2024-01-02 12:00:00', database=database)
+        self.assertEqual(2, database.compact('Dollar', '2024-02-01 00:00:00', segment_rows=2))
+        self.assertEqual(4, len(database._get_checkpoint('Dollar')['segments']))
+        self.assertEqual(['0.5', '1', '2', '2.5', '3', '4', '5', '10'],
+                         [p.amount for p in database.get_payments(archived=True)])
+        payments = database.get_payments(archived=True, since='2024-01-02', until='2024-01-03')
+        self.assertEqual(['2', '2.5', '3'], [p.amount for p in payments])
+
+    # --------------get_stats()--------------
+    def test_get_stats(self):
+        # Should keep the monthly stats up to date with the written payments
+        self.add('Julia', '10', '2023-12-31 10:00:00')
+        self.add('Julia', '2.5', '2024-01-01 10:00:00')
+        self.add('Jack', '3', '2024-01-05 10:00:00')
+        self.add('Julia', '1', '2024-01-06 10:00:00')
+        self.add('Jack', '7', '2024-03-01 10:00:00')
+        self.add('Jack', '4', '2024-01-01 10:00:00', wallet='Toman')
+        self.assertEqual([MonthStats('2024-01', {'Julia': 350, 'Jack': 300}, {'Julia': 2, 'Jack': 1}),
+                          MonthStats('2024-03', {'Jack': 700}, {'Jack': 1})],
+                         self.database.get_stats('Dollar', 3, '2024-03'))
+        self.assertEqual(['2023-12'], [stats.month for stats in self.database.get_stats('Dollar', 1, '2023-12')])
+        self.assertEqual([], self.database.get_stats('Dollar', 12, '2023-11'))
+
+    def test_get_stats2(self):
+        # Should read the months with a single query
+        self.add('Julia', '10', '2024-01-01 10:00:00')
+        scanned = self.count_queries(self.database)
+        self.assertEqual(1, len(self.database.get_stats('Dollar', 12, '2024-12')))
+        self.assertEqual(1, len(scanned))
+
+    # --------------rebuild_stats()--------------
+    def test_rebuild_stats(self):
+        # Should backfill the stats of the bulk written and the archived payments, and remove the stale months
+        database = self.archived_database()
+        self.compact(database)
+        database.add_payments([(Payment('Jack', '1', 'Dollar', '$', '-'), '2024-02-01 10:00:00')])
+        self.table.put_item(Item={'wallet': STATS_PARTITION, 'timestamp': 'Dollar#2023-05', 'total:Jack': 1,
+                                  'count:Jack': 1})
+        self.assertEqual(3, database.rebuild_stats())
+        self.assertEqual([MonthStats('2024-01', {'Julia': 1500}, {'Julia': 5}),
+                          MonthStats('2024-02', {'Jack': 100}, {'Jack': 1}),
+                          MonthStats('2024-03', {'Jack': 1000}, {'Jack': 1})],
+                         database.get_stats('Dollar', 12, '2024-12'))
+        self.assertEqual([], database.get_stats('Dollar', 12, '2023-12'))
+
+    # --------------groups--------------
+    def test_groups(self):
+        # Should keep the payments and the balances of the groups of a shared table apart, in a shared cache too
+        create_table('table-sw-shared-payments')
+        data = json.loads(CFG_JSON)
+        cache = LedgerCache(CACHE_MAX_ROWS)
+        family = Database(Configuration({**data, 'group': 'family', 'table': 'table-sw-shared-payments'}), cache=cache)
+        flat = Database(Configuration({**data, 'group': 'flat', 'table': 'table-sw-shared-payments'}), cache=cache)
+        self.add('Julia', '10', '2024-01-01 10:00:00', database=family)
+        self.add('Jack', '3', '2024-01-01 10:00:00', database=flat)
+        self.add('Jack', '4', '2024-01-01 10:00:01', database=flat, wallet='Toman')
+        self.assertEqual(Balance('Julia', 'Jack', 1000), family.get_balance('Dollar'))
+        self.assertEqual(Balance('Jack', 'Julia', 300), flat.get_balance('Dollar'))
+        payments, cursor = flat.get_last_payments(1)
+        self.assertEqual(['Toman'], [p.wallet for p in payments])
+        self.assertEqual(['Dollar'], [p.wallet for p in flat.get_last_payments(1, cursor)[0]])
+        self.assertEqual(['10'], [p.amount for p in family.get_payments()])
+        self.assertEqual(Balance('Julia', 'Jack', 1000), family.get_balance('Dollar'))
+        self.assertEqual(3, cache.stats()['wallets'])
+        self.assertEqual(0, self.table.scan()['Count'])
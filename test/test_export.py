@@ -0,0 +1,56 @@
+import csv
+import gzip
+import io
+import json
+import unittest
+
+import export
+from ledger_frame import LedgerFrame
+from payment import PersistedPayment
+
+
+class TestExport(unittest.TestCase):
+
+    PAYMENTS = [PersistedPayment('Julia', '10.5', 'Dollar', '$', 'Lunch, "cheap"', '2024-01-01 10:00:00'),
+                PersistedPayment('Jack', '2000', 'Toman', 'T', '-', '2024-01-02 10:00:00')]
+
+    # --------------export_payments()--------------
+    def test_export_payments(self):
+        # Should write the same document as jsonify_all
+        document = export.export_payments(iter(TestExport.PAYMENTS))
+        self.assertEqual(json.loads(PersistedPayment.jsonify_all(TestExport.PAYMENTS)), json.load(document))
+
+    def test_export_payments2(self):
+        document = export.export_payments(iter(TestExport.PAYMENTS), 'ndjson')
+        lines = document.read().decode().splitlines()
+        self.assertEqual([p.record() for p in TestExport.PAYMENTS], [json.loads(line) for line in lines])
+
+    def test_export_payments3(self):
+        document = export.export_payments(iter(TestExport.PAYMENTS), 'csv', compress=True)
+        rows = list(csv.DictReader(io.TextIOWrapper(gzip.GzipFile(fileobj=document), encoding='utf-8', newline='')))
+        self.assertEqual([p.record() for p in TestExport.PAYMENTS], rows)
+
+    def test_export_payments4(self):
+        # Should write a valid document even without any payment
+        self.assertEqual({'payments': []}, json.load(export.export_payments(iter([]))))
+        self.assertEqual('payer,amount,wallet,note,datetime', export.export_payments([], 'csv').read().decode().strip())
+
+    # --------------export_frames()--------------
+    def test_export_frames(self):
+        # Should write the same document as the payments
+        frame = LedgerFrame()
+        dollar, toman = frame.wallet_id('Dollar', '$', 2), frame.wallet_id('Toman', 'T', 0)
+        frame.append('2024-01-01 10:00:00', 'Julia', 1050, dollar, 'Lunch, "cheap"')
+        frame.append('2024-01-02 10:00:00.000000~0000', 'Jack', 2000, toman, '-')
+        document = export.export_frames([frame, LedgerFrame()], 'csv')
+        self.assertEqual(export.export_payments(TestExport.PAYMENTS, 'csv').read(), document.read())
+
+    def test_export_payments5(self):
+        # Should fail because the format is not supported
+        with self.assertRaises(ValueError):
+            export.export_payments([], 'xml')
+
+    # --------------filename()--------------
+    def test_filename(self):
+        self.assertEqual('history.json', export.filename('json', False))
+        self.assertEqual('history.csv.gz', export.filename('csv', True))
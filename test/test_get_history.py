@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from moto import mock_aws
+
+from test.local_dynamodb import CFG_JSON, create_table
+import get_history
+from configuration import Configuration
+from database import Database
+
+
+class TestGetHistory(unittest.TestCase):
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        os.environ["JSON_CONFIG"] = CFG_JSON
+        get_history.users = ['Julia', 'Jack']
+        get_history.wallets = ['Dollar', 'Toman']
+        create_table()
+        self.database = Database(Configuration())
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'import.checkpoint')
+
+    @staticmethod
+    def history(count: int) -> str:
+        return json.dumps({'payments': [
+            {'payer': 'Julia' if i % 3 else 'Jack', 'amount': '2', 'wallet': 'Dollar' if i % 2 else 'Toman',
+             'note': '-', 'datetime': f'2024-01-01 10:{i // 60:02}:{i % 60:02}'} for i in range(count)
+        ]})
+
+    # --------------past_records()--------------
+    def test_past_records(self):
+        # Should import all the payments in batches and rebuild the balances
+        get_history.past_records(self.history(120), bulk=True, workers=3, checkpoint=self.checkpoint)
+        self.assertEqual(120, len(self.database.get_payments()))
+        self.assertEqual(4000, self.database.get_balance('Dollar').amount)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_past_records2(self):
+        # Should skip the payments that already exist, so that importing twice changes nothing
+        get_history.past_records(self.history(30), bulk=True, checkpoint=self.checkpoint)
+        written = []
+        with mock.patch.object(Database, 'add_payments', autospec=True,
+                                        side_effect=lambda _, batch: written.extend(batch)):
+            get_history.past_records(self.history(40), bulk=True, checkpoint=self.checkpoint)
+        self.assertEqual(10, len(written))
+
+    def test_past_records3(self):
+        # Should resume with the batches that are not in the checkpoint
+        with open(self.checkpoint, 'w') as f:
+            f.write('0\n2\n')
+        get_history.past_records(self.history(80), bulk=True, checkpoint=self.checkpoint)
+        self.assertEqual(80 - 2 * 25, len(self.database.get_payments()))
+
+    def test_past_records4(self):
+        # Should keep the payments of a wallet in the same second, also when the history is imported again
+        history = json.dumps({'payments': [
+            {'payer': 'Julia', 'amount': amount, 'wallet': 'Dollar', 'note': '-', 'datetime': '2024-01-01 10:00:00'}
+            for amount in ['1', '2', '3']
+        ]})
+        for _ in range(2):
+            get_history.past_records(history, bulk=True, checkpoint=self.checkpoint)
+        self.assertEqual(['1', '2', '3'], [p.amount for p in self.database.get_payments()])
+
+    # --------------parse_users()--------------
+    def test_parse_users(self):
+        self.assertEqual((['Julia', 'Jack', 'Carl'], ['Dollar']),
+                         get_history.parse_users('Julia,Jack,Carl', ['Dollar']))
+        # The former arguments of two users separated by a space
+        self.assertEqual((['Julia', 'Jack'], ['Dollar', 'Toman']),
+                         get_history.parse_users('Julia', ['Jack', 'Dollar', 'Toman']))
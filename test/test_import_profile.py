@@ -0,0 +1,14 @@
+import unittest
+
+import import_profile
+
+
+class TestImportProfile(unittest.TestCase):
+
+    # --------------import_times()--------------
+    def test_import_times(self):
+        # Should account the time of the modules to their top level packages
+        total, packages = import_profile.import_times('import money, configuration')
+        self.assertIn('money', packages)
+        self.assertIn('configuration', packages)
+        self.assertEqual(total, sum(packages.values()))
@@ -0,0 +1,51 @@
+import unittest
+
+from ledger_cache import LedgerCache, LedgerEntry
+
+
+def entry(rows: int) -> LedgerEntry:
+    items = [{'timestamp': f'2024-01-01 10:00:{i:02}'} for i in range(rows)]
+    return LedgerEntry(version=1, count=rows, totals={}, rows=items, complete=True,
+                       last_seen=items[-1]['timestamp'] if items else '')
+
+
+class TestLedgerCache(unittest.TestCase):
+
+    # --------------put()--------------
+    def test_put(self):
+        # Should evict the least recently used wallet first
+        cache = LedgerCache(max_rows=5)
+        cache.put('Dollar', entry(2))
+        cache.put('Toman', entry(2))
+        cache.get('Dollar')
+        cache.put('Euro', entry(2))
+        self.assertIsNone(cache.get('Toman'))
+        self.assertIsNotNone(cache.get('Dollar'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_put2(self):
+        # Should drop the oldest rows of a wallet that alone exceeds the bound
+        cache = LedgerCache(max_rows=3)
+        cache.put('Dollar', entry(5))
+        cached = cache.get('Dollar')
+        self.assertEqual(['2024-01-01 10:00:02', '2024-01-01 10:00:03', '2024-01-01 10:00:04'],
+                         [row['timestamp'] for row in cached.rows])
+        self.assertFalse(cached.complete)
+
+    # --------------append()--------------
+    def test_append(self):
+        cache = LedgerCache(max_rows=3)
+        cache.put('Dollar', entry(3))
+        cache.append('Dollar', [{'timestamp': '2024-01-01 11:00:00'}])
+        self.assertEqual(3, cache.stats()['rows'])
+        self.assertEqual('2024-01-01 11:00:00', cache.get('Dollar').rows[-1]['timestamp'])
+
+    # --------------invalidate()--------------
+    def test_invalidate(self):
+        cache = LedgerCache(max_rows=10)
+        cache.put('Dollar', entry(1))
+        cache.put('Toman', entry(1))
+        cache.invalidate('Dollar')
+        self.assertIsNone(cache.get('Dollar'))
+        cache.invalidate()
+        self.assertEqual(0, cache.stats()['wallets'])
@@ -0,0 +1,43 @@
+import unittest
+
+from ledger_frame import LedgerFrame
+
+
+class TestLedgerFrame(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = LedgerFrame()
+        dollar = self.frame.wallet_id('Dollar', '$', 2)
+        toman = self.frame.wallet_id('Toman', 'T', 0)
+        self.frame.append('2024-01-01 10:00:00.000000~0000', 'Julia', 1050, dollar, 'Lunch')
+        self.frame.append('2024-01-01 10:00:01.000000~0000', 'Jack', 2000, toman, '-')
+        self.frame.append('2024-01-01 10:00:02.000000~0000', 'Julia', 200, dollar, None)
+
+    # --------------wallet_id()--------------
+    def test_wallet_id(self):
+        # Should intern the wallets and the payers
+        self.assertEqual(0, self.frame.wallet_id('Dollar', '$', 2))
+        self.assertEqual(['Dollar', 'Toman'], self.frame.wallets)
+        self.assertEqual(['Julia', 'Jack'], self.frame.payers)
+        self.assertEqual([0, 1, 0], list(self.frame.payer_ids))
+        self.assertEqual(3, len(self.frame))
+
+    # --------------totals()--------------
+    def test_totals(self):
+        self.assertEqual({'Dollar': {'Julia': 1250}, 'Toman': {'Jack': 2000}}, self.frame.totals())
+        self.assertEqual({}, LedgerFrame().totals())
+
+    # --------------records()--------------
+    def test_records(self):
+        self.assertEqual([
+            {'payer': 'Julia', 'amount': '10.5 $', 'wallet': 'Dollar', 'note': 'Lunch',
+             'datetime': '2024-01-01 10:00:00'},
+            {'payer': 'Jack', 'amount': '2000 T', 'wallet': 'Toman', 'note': '-', 'datetime': '2024-01-01 10:00:01'},
+            {'payer': 'Julia', 'amount': '2 $', 'wallet': 'Dollar', 'note': None, 'datetime': '2024-01-01 10:00:02'},
+        ], list(self.frame.records()))
+
+    # --------------monthly_totals()--------------
+    def test_monthly_totals(self):
+        self.frame.append('2024-02-01 10:00:00.000000~0000', 'Julia', 100, 0, None)
+        self.assertEqual({'Dollar': {'2024-01': {'Julia': [1250, 2]}, '2024-02': {'Julia': [100, 1]}},
+                          'Toman': {'2024-01': {'Jack': [2000, 1]}}}, self.frame.monthly_totals())
@@ -0,0 +1,407 @@
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from moto import mock_aws
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+from test.local_dynamodb import CFG_JSON, create_table
+
+os.environ["JSON_CONFIG"] = CFG_JSON
+
+import main  # noqa: E402
+from payment import Payment  # noqa: E402
+from registry import Registry  # noqa: E402
+
+
+def make_event(update_id: int, chat_id: int = 9999, text: str = '/start') -> dict:
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split(' ')[0])}] if text[0] == '/' else []
+    return {'body': json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Eve'},
+            'text': text,
+            'entities': entities,
+        },
+    })}
+
+
+def make_callback_event(update_id: int, data: str, chat_id: int = 1234) -> dict:
+    return {'body': json.dumps({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': '1',
+            'data': data,
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Julia'},
+            'message': {'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': '-'},
+        },
+    })}
+
+
+def reply(response: dict) -> dict:
+    """Returns the Bot API call answered by the webhook in its response"""
+    return json.loads(response['body'])
+
+
+class FakeBotApi:
+    """Stands in for api.telegram.org by answering the requests of the bot without any network call"""
+
+    BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Wallet', 'username': 'wallet_bot'}
+
+    def __init__(self):
+        self.calls = []
+        self.uploads = []
+
+    async def do_request(self, request, url, method, request_data=None, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, parameters))
+        if request_data and request_data.multipart_data:
+            self.uploads.extend(request_data.multipart_data.values())
+        if endpoint == 'getMe':
+            result = FakeBotApi.BOT_USER
+        else:
+            result = {'message_id': len(self.calls), 'date': 0, 'chat': {'id': parameters.get('chat_id', 0),
+                                                                         'type': 'private'}}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    def patch(self):
+        return mock.patch.object(HTTPXRequest, 'do_request', side_effect=self.do_request, autospec=True)
+
+    def endpoints(self):
+        return [endpoint for endpoint, _ in self.calls]
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        # Every invocation writes its metrics to the standard output
+        patcher = mock.patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout = patcher.start()
+        self.addCleanup(patcher.stop)
+        # The tests reuse the ids of the updates, every test starts with an empty log
+        patcher = mock.patch.object(main, 'update_log', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def metrics(self) -> list:
+        return [json.loads(line) for line in self.stdout.getvalue().splitlines()]
+
+    # --------------import--------------
+    def test_import(self):
+        # Should not import boto3 and num2persian nor build the application when the module is imported
+        statement = 'import sys, main; print("boto3" in sys.modules, "num2persian" in sys.modules, ' \
+                    'main.application is None)'
+        result = subprocess.run([sys.executable, '-c', statement], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual('False False True', result.stdout.strip())
+
+    # --------------lambda_handler()--------------
+    def test_lambda_handler(self):
+        # Should fail because the event has no body
+        self.assertEqual(500, main.lambda_handler({}, None)['statusCode'])
+
+    def test_lambda_handler2(self):
+        # Handlers and initialization should not pile up over the warm invocations
+        handlers_before = {group: list(handlers) for group, handlers in main.get_application().handlers.items()}
+        bot_api = FakeBotApi()
+        with bot_api.patch():
+            for update_id in range(1, 3001):
+                # The update comes from an unknown user, so it reaches every handler but none matches
+                self.assertEqual(200, main.lambda_handler(make_event(update_id), None)['statusCode'])
+        self.assertEqual(handlers_before, main.get_application().handlers)
+        self.assertLessEqual(bot_api.endpoints().count('getMe'), 1)
+
+    def test_lambda_handler3(self):
+        # Should build the application again on a new loop when the loop of the container was closed
+        bot_api = FakeBotApi()
+        with bot_api.patch():
+            self.assertEqual(200, main.lambda_handler(make_event(1), None)['statusCode'])
+            application = main.get_application()
+            main.runtime.loop.close()
+            self.assertEqual(200, main.lambda_handler(make_event(2), None)['statusCode'])
+        self.assertIsNot(application, main.get_application())
+        self.assertIs(main.runtime.loop, main.initialized_loop)
+        self.assertEqual(1, len(main.get_application().handlers))
+
+    def test_lambda_handler4(self):
+        # Should write the spans of every invocation as one embedded metric record, by command
+        with mock_aws():
+            create_table()
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                main.lambda_handler(make_event(1, chat_id=1234, text='/status'), None)
+                main.lambda_handler(make_event(2, chat_id=1234, text='Dollar'), None)
+                main.lambda_handler(make_event(3, chat_id=1234, text='/unknown'), None)
+        status, wallet, unknown = self.metrics()
+        self.assertEqual(['/status', 'message', 'other'], [status['Command'], wallet['Command'], unknown['Command']])
+        self.assertEqual('warm', wallet['Start'])
+        for span in ['invocation', 'initialize', 'de_json', 'process_update', 'dynamodb.GetItem',
+                     'Database.get_balance']:
+            self.assertIn(span, wallet)
+        self.assertIn({'Name': 'Database.get_balance', 'Unit': 'Milliseconds'},
+                      wallet['_aws']['CloudWatchMetrics'][0]['Metrics'])
+        self.assertLess(wallet['Database.get_balance'], wallet['invocation'])
+
+    # --------------last_payments()--------------
+    def test_last_payments(self):
+        # Should show the last payments and page back to the older ones with the inline button
+        with mock_aws():
+            create_table()
+            for i in range(3):
+                main.get_database().add_payment(Payment('Julia', str(i), 'Dollar', '$', '-'), f'2024-01-01 10:00:0{i}')
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                message = reply(main.lambda_handler(make_event(1, chat_id=1234, text='/last 2'), None))
+                self.assertEqual('sendMessage', message['method'])
+                self.assertIn('Amount: 2 $', message['text'])
+                self.assertNotIn('Amount: 0 $', message['text'])
+                data = message['reply_markup']['inline_keyboard'][0][0]['callback_data']
+
+                # The callback query is answered by the webhook, and the message is edited with a request
+                self.assertEqual('answerCallbackQuery',
+                                 reply(main.lambda_handler(make_callback_event(2, data), None))['method'])
+                endpoint, message = bot_api.calls[-1]
+                self.assertEqual('editMessageText', endpoint)
+                self.assertIn('Amount: 0 $', message['text'])
+                self.assertNotIn('reply_markup', message)
+
+    def test_last_payments2(self):
+        # Should refuse a number of payments that does not fit in one message
+        with mock_aws():
+            create_table()
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                response = main.lambda_handler(make_event(1, chat_id=1234, text='/last 500'), None)
+            self.assertIn('Usage: /last N', reply(response)['text'])
+            self.assertEqual([], bot_api.calls)
+
+    def test_last_payments3(self):
+        # Should show the last payments of the payer, and page back to their older ones
+        with mock_aws():
+            create_table()
+            for i in range(3):
+                main.get_database().add_payment(Payment('Jack', str(i), 'Toman', 'T', '-'), f'2024-01-01 10:00:0{i}')
+            main.get_database().add_payment(Payment('Julia', '9', 'Dollar', '$', '-'), '2024-01-01 10:00:09')
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                message = reply(main.lambda_handler(make_event(1, chat_id=1234, text='/last 2 Jack'), None))
+                self.assertIn('Amount: 2 T', message['text'])
+                self.assertNotIn('Amount: 9 $', message['text'])
+                data = message['reply_markup']['inline_keyboard'][0][0]['callback_data']
+                self.assertLessEqual(len(data.encode()), 64)
+                main.lambda_handler(make_callback_event(2, data), None)
+                endpoint, message = bot_api.calls[-1]
+                self.assertIn('Amount: 0 T', message['text'])
+                self.assertNotIn('Amount: 9 $', message['text'])
+                response = main.lambda_handler(make_event(3, chat_id=1234, text='/last 2 Carl'), None)
+                self.assertIn('Usage: /last N [Julia|Jack]', reply(response)['text'])
+
+    def test_last_payments4(self):
+        # Should fit the cursor of a wallet with a long name and of a microsecond key in the data of the button
+        data = json.loads(CFG_JSON)
+        data['wallets'].append({'currency': 'Pound Sterling of the United Kingdom', 'symbol': '£'})
+        with mock_aws(), mock.patch.multiple(main, registry=Registry(data), databases={}, ledger_cache=None):
+            create_table()
+            for i in range(3):
+                main.get_database().add_payment(Payment('Jack', str(i), 'Pound Sterling of the United Kingdom', '£',
+                                                         '-'))
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                message = reply(main.lambda_handler(make_event(1, chat_id=1234, text='/last 20 Jack'), None))
+                self.assertNotIn('reply_markup', message)
+                message = reply(main.lambda_handler(make_event(2, chat_id=1234, text='/last 1 Jack'), None))
+                data = message['reply_markup']['inline_keyboard'][0][0]['callback_data']
+                self.assertLessEqual(len(data.encode()), main.MAX_CALLBACK_DATA)
+                main.lambda_handler(make_callback_event(3, data), None)
+                endpoint, message = bot_api.calls[-1]
+                self.assertIn('Amount: 1 £', message['text'])
+                # The payments are shown without the button when its data would not fit
+                with mock.patch.object(main, 'MAX_CALLBACK_DATA', len(data.encode()) - 1):
+                    message = reply(main.lambda_handler(make_event(4, chat_id=1234, text='/last 1 Jack'), None))
+                self.assertIn('Amount: 2 £', message['text'])
+                self.assertNotIn('reply_markup', message)
+
+    # --------------settle_wallets()--------------
+    def test_settle_wallets(self):
+        # Should ask the debtor of two members to pay back the whole difference, like /status shows it
+        with mock_aws(), mock.patch.object(main, 'databases', {}):
+            create_table()
+            main.get_database().add_payment(Payment('Julia', '10', 'Dollar', '$', '-'), '2024-01-01 10:00:00')
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                response = main.lambda_handler(make_event(1, chat_id=4321, text='/settle'), None)
+                self.assertEqual('Dollar:\nJack → Julia: 10 $\nToman: settled', reply(response)['text'])
+                response = main.lambda_handler(make_event(2, chat_id=4321, text='/settle Euro'), None)
+                self.assertEqual('Usage: /settle [Dollar|Toman]', reply(response)['text'])
+
+    # --------------stats_wallets()--------------
+    def test_stats_wallets(self):
+        # Should show what every member paid in the months with payments, from the monthly stats
+        with mock_aws(), mock.patch.object(main, 'databases', {}):
+            create_table()
+            month = datetime.now().strftime('%Y-%m')
+            main.get_database().add_payment(Payment('Jack', '3', 'Dollar', '$', '-'), f'{month}-01 10:00:00')
+            main.get_database().add_payment(Payment('Julia', '10', 'Dollar', '$', '-'), f'{month}-01 11:00:00')
+            main.get_database().add_payment(Payment('Julia', '2.5', 'Dollar', '$', '-'), f'{month}-02 10:00:00')
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                response = main.lambda_handler(make_event(1, chat_id=4321, text='/stats 2'), None)
+                self.assertEqual(f'Dollar:\n{month}: Julia 12.5 $ (2), Jack 3 $ (1)\n'
+                                 f'Toman: no payments in the last 2 months', reply(response)['text'])
+                response = main.lambda_handler(make_event(2, chat_id=4321, text='/stats Dollar 100'), None)
+                self.assertIn('Usage: /stats [Dollar|Toman] [months]', reply(response)['text'])
+
+    # --------------history_payments()--------------
+    def test_history_payments(self):
+        # Should upload the history without writing any file
+        with mock_aws():
+            create_table()
+            main.get_database().add_payment(Payment('Jack', '5', 'Toman', 'T', '-'), '2024-01-01 10:00:00')
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                main.lambda_handler(make_event(1, chat_id=1234, text='/history csv Toman gz'), None)
+            self.assertEqual('sendDocument', bot_api.endpoints()[-1])
+            filename, content, _ = bot_api.uploads[-1]
+            self.assertEqual('history.csv.gz', filename)
+            self.assertIn('Jack,5 T,Toman,-,2024-01-01 10:00:00', gzip.decompress(content).decode())
+
+    def test_history_payments2(self):
+        # Should fail because of an unknown argument
+        with mock_aws():
+            create_table()
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                response = main.lambda_handler(make_event(1, chat_id=1234, text='/history xml'), None)
+            self.assertIn('Usage: /history', reply(response)['text'])
+
+    def test_history_payments3(self):
+        # Should only upload the payments between the dates, both included
+        with mock_aws():
+            create_table()
+            for day in ['2024-02-29', '2024-03-01', '2024-03-31', '2024-04-01']:
+                main.get_database().add_payment(Payment('Jack', '5', 'Toman', 'T', day), f'{day} 10:00:00')
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                main.lambda_handler(make_event(1, chat_id=1234, text='/history ndjson 2024-03-01 2024-03-31'), None)
+                _, content, _ = bot_api.uploads[-1]
+                self.assertEqual(['2024-03-01', '2024-03-31'],
+                                 [json.loads(line)['note'] for line in content.decode().splitlines()])
+                response = main.lambda_handler(make_event(2, chat_id=1234, text='/history 2024-04 2024-03'), None)
+                self.assertIn('Usage: /history', reply(response)['text'])
+
+    # --------------update conversation--------------
+    def test_update_conversation(self):
+        # Should continue the conversation from the database, with at most one read and one write per update
+        with mock_aws():
+            create_table()
+            calls = []
+            events = main.get_persistence()._table.meta.client.meta.events
+            events.register('before-call.dynamodb', lambda model, **kwargs: calls.append(model.name))
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                for update_id, text in enumerate(['/update', 'Dollar', 'Julia', '12.5', '/skip', 'Yes'], start=1):
+                    calls.clear()
+                    response = main.lambda_handler(make_event(update_id, 1234, text), None)
+                    self.assertEqual(200, response['statusCode'])
+                    self.assertEqual(['GetItem', 'UpdateItem'], calls)
+                    # The next update reaches a container that knows nothing about the conversation
+                    for handler in main.get_application().handlers[0]:
+                        if isinstance(handler, ConversationHandler):
+                            handler._conversations.data.clear()
+            events.unregister('before-call.dynamodb')
+            # The confirming user gets the new balance in the response of the webhook, the other one with a request
+            self.assertEqual('Julia: 12.5 $\nJack: 0 $', reply(response)['text'])
+            (endpoint, notification), = [call for call in bot_api.calls if call[1].get('chat_id') == 4321]
+            self.assertEqual('sendMessage', endpoint)
+            self.assertTrue(notification['text'].endswith('New status:\nJulia: 12.5 $\nJack: 0 $'))
+
+    def test_update_conversation3(self):
+        # Should write a confirmed payment once when Telegram delivers the confirmation again
+        with mock_aws():
+            create_table()
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                for update_id, text in enumerate(['/update', 'Dollar', 'Julia', '12.5', '/skip', 'Yes'], start=1):
+                    main.lambda_handler(make_event(update_id, 1234, text), None)
+                calls = len(bot_api.calls)
+                # The same container skips it without reading the table, another one finds it in the update log
+                self.assertEqual('Duplicate', main.lambda_handler(make_event(6, 1234, 'Yes'), None)['body'])
+                with mock.patch.object(main, 'update_log', None):
+                    self.assertEqual('Duplicate', main.lambda_handler(make_event(6, 1234, 'Yes'), None)['body'])
+            self.assertEqual(calls, len(bot_api.calls))
+            self.assertEqual(['12.5'], [p.amount for p in main.get_database().get_payments()])
+            self.assertEqual(['duplicate', 'duplicate'], [m['Command'] for m in self.metrics()[-2:]])
+
+    def test_update_conversation4(self):
+        # Should process an update again when it failed before its handlers ran
+        with mock_aws():
+            create_table()
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                with mock.patch.object(main.get_persistence(), 'refresh_conversations',
+                                       side_effect=RuntimeError('throttled')):
+                    self.assertEqual(500, main.lambda_handler(make_event(1, 1234, '/status'), None)['statusCode'])
+                response = main.lambda_handler(make_event(1, 1234, '/status'), None)
+            self.assertEqual(200, response['statusCode'])
+            self.assertEqual('Which wallet do you want to see?', reply(response)['text'])
+
+    def test_update_conversation5(self):
+        # Should not write a confirmed payment again when the write of the conversation failed after it
+        with mock_aws():
+            create_table()
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                for update_id, text in enumerate(['/update', 'Dollar', 'Julia', '12.5', '/skip'], start=1):
+                    main.lambda_handler(make_event(update_id, 1234, text), None)
+                with mock.patch.object(main.get_persistence(), 'flush', side_effect=RuntimeError('throttled')):
+                    self.assertEqual(500, main.lambda_handler(make_event(6, 1234, 'Yes'), None)['statusCode'])
+                # Another container, where the conversation is still at the confirmation
+                for handler in main.get_application().handlers[0]:
+                    if isinstance(handler, ConversationHandler):
+                        handler._conversations.data.clear()
+                with mock.patch.object(main, 'update_log', None):
+                    self.assertEqual('Duplicate', main.lambda_handler(make_event(6, 1234, 'Yes'), None)['body'])
+            self.assertEqual(['12.5'], [p.amount for p in main.get_database().get_payments()])
+            self.assertEqual(1, len([call for call in bot_api.calls if call[1].get('chat_id') == 4321]))
+
+    def test_update_conversation2(self):
+        # Should keep the payments of every group in its own partitions of the shared table
+        data = json.loads(CFG_JSON)
+        groups = {'bot_token': data.pop('bot_token'), 'groups': [
+            {'name': 'family', **data},
+            {'name': 'flat', 'wallets': [{'currency': 'Euro', 'symbol': '€'}],
+             'users': [{'name': 'Anna', 'chat_id': 5555}, {'name': 'Ben', 'chat_id': 6666}]},
+        ]}
+        with mock_aws(), mock.patch.multiple(main, registry=Registry(groups), databases={}, ledger_cache=None,
+                                             persistence=None, application=None, webhook_request=None,
+                                             initialized_loop=None):
+            table = create_table('table-sw-shared-payments')
+            bot_api = FakeBotApi()
+            with bot_api.patch():
+                # The currencies of the other groups are not wallets of the group
+                for update_id, text in enumerate(['/update', 'Dollar', 'Euro', 'Ben', '7', '/skip', 'Yes'], start=1):
+                    response = main.lambda_handler(make_event(update_id, 5555, text), None)
+                    self.assertEqual(200, response['statusCode'])
+            self.assertEqual('Ben: 7 €\nAnna: 0 €', reply(response)['text'])
+            partitions = {item['wallet'] for item in table.scan()['Items']}
+            self.assertEqual({'flat/Euro', 'flat/#balance', 'flat/#stats', '#chat', '#update'}, partitions)
+            self.assertEqual(['flat'], list(main.databases))
+            self.assertIs(main.ledger_cache, main.databases['flat']._cache)
+
+    # --------------register_handlers()--------------
+    def test_register_handlers(self):
+        # Should register the commands, the callback query and the two conversations exactly once
+        self.assertEqual(1, len(main.get_application().handlers))
+        self.assertEqual(9, len(main.get_application().handlers[0]))
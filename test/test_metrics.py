@@ -0,0 +1,31 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from metrics import NAMESPACE, Tracer
+
+
+class TestTracer(unittest.TestCase):
+
+    # --------------emit()--------------
+    def test_emit(self):
+        # Should write the summed durations of the spans as one embedded metric record, and start over
+        tracer = Tracer()
+        traced_sum = tracer.traced('sum')(sum)
+        self.assertEqual(3, traced_sum([1, 2]))
+        traced_sum([3])
+        with tracer.span('step'):
+            pass
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            record = tracer.emit('/start', cold=True)
+            tracer.emit('/start', cold=False)
+        first, second = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(record, first)
+        self.assertEqual('/start', first['Command'])
+        self.assertEqual('cold', first['Start'])
+        metrics = first['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(NAMESPACE, metrics['Namespace'])
+        self.assertEqual(['sum', 'step'], [metric['Name'] for metric in metrics['Metrics']])
+        self.assertGreaterEqual(first['sum'], 0)
+        self.assertEqual([], second['_aws']['CloudWatchMetrics'][0]['Metrics'])
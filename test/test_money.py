@@ -0,0 +1,30 @@
+import unittest
+
+import money
+
+
+class TestMoney(unittest.TestCase):
+
+    # --------------to_minor()--------------
+    def test_to_minor(self):
+        self.assertEqual(1250, money.to_minor('12.50', 2))
+        self.assertEqual(1250, money.to_minor('12.5', 2))
+        self.assertEqual(7, money.to_minor('0.07', 2))
+        self.assertEqual(300, money.to_minor('3', 2))
+        self.assertEqual(3, money.to_minor('3', 0))
+        self.assertEqual(-150, money.to_minor('-1.5', 2))
+
+    def test_to_minor2(self):
+        # Should fail because the amount has more decimal digits than the precision, or is not a number
+        for amount, precision in [('1.234', 2), ('1.5', 0), ('abc', 2), ('', 2), ('NaN', 2), ('Infinity', 2)]:
+            with self.assertRaises(ValueError, msg=amount):
+                money.to_minor(amount, precision)
+
+    # --------------to_major()--------------
+    def test_to_major(self):
+        self.assertEqual('12.5', money.to_major(1250, 2))
+        self.assertEqual('0.07', money.to_major(7, 2))
+        self.assertEqual('3', money.to_major(300, 2))
+        self.assertEqual('0', money.to_major(0, 2))
+        self.assertEqual('-1.5', money.to_major(-150, 2))
+        self.assertEqual('1500', money.to_major(1500, 0))
@@ -0,0 +1,30 @@
+import random
+import unittest
+
+import num2persian
+from test import num2persian_reference
+
+
+class TestNum2Persian(unittest.TestCase):
+
+    # --------------to_persian()--------------
+    def test_to_persian(self):
+        # Should write the integers as the implementation before the table did
+        random.seed(0)
+        numbers = list(range(2000)) + [random.randrange(10 ** digits) for digits in range(4, 62) for _ in range(50)]
+        for number in numbers:
+            for amount in (str(number), f'-{number}', f'+{number}'):
+                self.assertEqual(num2persian_reference.to_persian(amount), num2persian.to_persian(amount), amount)
+
+    def test_to_persian2(self):
+        # Should write the decimal digits as a fraction
+        self.assertEqual('دوازده و پنج دهم تومان', num2persian.to_persian('12.50'))
+        self.assertEqual('دوازده تومان', num2persian.to_persian('12.00'))
+        self.assertEqual('منفی هفتاد و پنج هزارم تومان', num2persian.to_persian('-0.075'))
+        self.assertEqual('یک میلیون و یک میلیونم تومان', num2persian.to_persian('1000000.000001'))
+
+    def test_to_persian3(self):
+        # Should fail because the amount is not a decimal number, or it has too many digits
+        for amount in ['', 'abc', '12.', '.5', '1e5', '1.2.3', '1.2345678', '1' * 64]:
+            with self.assertRaises(ValueError, msg=amount):
+                num2persian.to_persian(amount)
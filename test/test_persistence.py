@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+from moto import mock_aws
+from telegram.ext import ConversationHandler
+from telegram.ext._utils.trackingdict import TrackingDict
+
+from test.local_dynamodb import TABLE_NAME, create_table
+from payment import Payment, PersistedPayment
+from persistence import CHAT_PARTITION, DynamoDBPersistence
+
+
+class TestPersistence(unittest.TestCase):
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.table = create_table()
+        self.persistence = DynamoDBPersistence(TABLE_NAME)
+        self.calls = []
+        self.persistence._table.meta.client.meta.events.register(
+            'before-call.dynamodb', lambda model, **kwargs: self.calls.append(model.name)
+        )
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def get_item(self, chat_id: int) -> dict:
+        return self.table.get_item(Key={'wallet': CHAT_PARTITION, 'timestamp': str(chat_id)}).get('Item', {})
+
+    # --------------update_chat_data()--------------
+    def test_update_chat_data(self):
+        # Should write only the changed keys of the chat data with a single request
+        self.run_async(self.persistence.update_chat_data(1, {'wallet': 'Dollar', 'payer': 'Julia'}))
+        self.run_async(self.persistence.flush())
+        self.assertEqual(['GetItem', 'UpdateItem'], self.calls)
+
+        self.calls.clear()
+        chat_data = {}
+        self.run_async(self.persistence.refresh_chat_data(1, chat_data))
+        self.assertEqual({'wallet': 'Dollar', 'payer': 'Julia'}, chat_data)
+        self.run_async(self.persistence.update_chat_data(1, {'wallet': 'Dollar', 'payer': 'Jack'}))
+        self.run_async(self.persistence.update_chat_data(2, {}))
+        self.run_async(self.persistence.flush())
+        self.assertEqual(['GetItem', 'GetItem', 'UpdateItem'], self.calls)
+        self.assertEqual({'chat_data:wallet', 'chat_data:payer'}, set(self.get_item(1)) - {'wallet', 'timestamp'})
+        self.assertEqual({}, self.get_item(2))
+
+    def test_update_chat_data2(self):
+        # Should remove the keys that are not in the chat data anymore
+        self.run_async(self.persistence.update_chat_data(1, {'wallet': 'Dollar', 'payer': 'Julia'}))
+        self.run_async(self.persistence.flush())
+        self.run_async(self.persistence.drop_chat_data(1))
+        self.run_async(self.persistence.flush())
+        self.assertEqual({'wallet', 'timestamp'}, set(self.get_item(1)))
+
+    def test_update_chat_data3(self):
+        # Should restore the payment kept in chat_data by the confirmation of /update, which is immutable
+        payment = PersistedPayment('Julia', '10', 'Dollar', '$', 'Lunch', '2024-01-01 10:00:00',
+                                   '2024-01-01 10:00:00.5')
+        self.run_async(self.persistence.update_chat_data(1, {'payment': payment}))
+        self.run_async(self.persistence.flush())
+        chat_data = {}
+        self.run_async(self.persistence.refresh_chat_data(1, chat_data))
+        self.assertEqual(repr(payment), repr(chat_data['payment']))
+        self.assertEqual('2024-01-01 10:00:00.5', chat_data['payment'].key)
+        with self.assertRaises(AttributeError):
+            chat_data['payment'].amount = '20'
+
+        # The payments pickled before they had slots are restored from the dict of their attributes
+        restored = Payment.__new__(Payment)
+        restored.__setstate__({'payer': 'Jack', 'amount': '5', 'wallet': 'Dollar', 'wallet_symbol': '$', 'note': '-'})
+        self.assertEqual("Payment ('Jack', '5', 'Dollar', '$', '-')", repr(restored))
+
+    # --------------update_conversation()--------------
+    def test_update_conversation(self):
+        # Should restore the stored states of the chat in the conversation handlers, and forget the ended ones
+        handler = ConversationHandler(entry_points=[], states={}, fallbacks=[], name='update', persistent=True)
+        # The application replaces the conversations of the handler with a tracking dict when it is initialized
+        handler._conversations = TrackingDict()
+        handler._conversations.update_no_track({(1, 1): 4, (2, 2): 3})
+        self.run_async(self.persistence.update_conversation('update', (1, 1), 2))
+        self.run_async(self.persistence.update_conversation('status', (1, 1), 5))
+        self.run_async(self.persistence.flush())
+        self.run_async(self.persistence.refresh_conversations(1, [handler]))
+        self.assertEqual({(1, 1): 2, (2, 2): 3}, dict(handler._conversations))
+
+        self.run_async(self.persistence.update_conversation('update', (1, 1), None))
+        self.run_async(self.persistence.flush())
+        self.run_async(self.persistence.refresh_conversations(1, [handler]))
+        self.assertEqual({(2, 2): 3}, dict(handler._conversations))
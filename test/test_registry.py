@@ -0,0 +1,69 @@
+import json
+import unittest
+
+from test.local_dynamodb import CFG_JSON
+from configuration import ConfigurationError
+from registry import SHARED_TABLE, Registry
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        group = json.loads(CFG_JSON)
+        self.token = group.pop('bot_token')
+        self.groups = {'bot_token': self.token, 'groups': [
+            {'name': 'family', **group},
+            {'name': 'flat', 'wallets': [{'currency': 'Euro', 'symbol': '€'}],
+             'users': [{'name': 'Anna', 'chat_id': 5555}, {'name': 'Ben', 'chat_id': 6666}]},
+        ]}
+
+    # --------------__init__--------------
+    def test_init(self):
+        # Should fail because a chat id is in two groups
+        self.groups['groups'][1]['users'][0]['chat_id'] = 1234
+        with self.assertRaises(ConfigurationError):
+            Registry(self.groups)
+
+    def test_init2(self):
+        # Should fail because the name of the group would not be a valid prefix of its partitions
+        self.groups['groups'][1]['name'] = 'flat/1'
+        with self.assertRaises(ConfigurationError):
+            Registry(self.groups)
+
+    def test_init3(self):
+        # Should fail because two groups have the same name
+        self.groups['groups'][1]['name'] = 'family'
+        with self.assertRaises(ConfigurationError):
+            Registry(self.groups)
+
+    # --------------get_group()--------------
+    def test_get_group(self):
+        registry = Registry(self.groups)
+        self.assertEqual('family', registry.get_group(4321))
+        self.assertEqual('flat', registry.get_group(5555))
+        self.assertEqual([1234, 4321, 5555, 6666], registry.get_chat_ids())
+        self.assertFalse(registry.is_user(9999))
+        with self.assertRaises(ValueError):
+            registry.get_group(9999)
+
+    def test_get_group2(self):
+        # A single group configuration is the group None, in its own table
+        registry = Registry(json.loads(CFG_JSON))
+        self.assertFalse(registry.is_multi_tenant())
+        self.assertIsNone(registry.get_group(1234))
+        self.assertIsNone(registry.get_configuration().get_group())
+        self.assertEqual('table-sw-julia-jack-payments', registry.get_table_name())
+
+    # --------------get_configuration()--------------
+    def test_get_configuration(self):
+        # Should build the configuration of a group once, with the token and the shared table
+        registry = Registry(self.groups)
+        config = registry.get_configuration('flat')
+        self.assertIs(config, registry.get_configuration('flat'))
+        self.assertEqual(['Euro'], config.get_currencies())
+        self.assertEqual(self.token, config.get_token())
+        self.assertEqual('flat', config.get_group())
+        self.assertEqual(SHARED_TABLE, config.get_table_name())
+        self.assertEqual(SHARED_TABLE, registry.get_table_name())
+        with self.assertRaises(ValueError):
+            registry.get_configuration('unknown')
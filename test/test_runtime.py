@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram.request import HTTPXRequest
+
+from runtime import KEEPALIVE_EXPIRY, KeepAliveRequest, Runtime
+
+
+class BotApiHandler(BaseHTTPRequestHandler):
+    # Keeps the connections open between the requests, like api.telegram.org
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'{"ok": true, "result": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRuntime(unittest.TestCase):
+
+    # --------------run()--------------
+    def test_run(self):
+        # Should run the invocations on the same loop
+        runtime = Runtime()
+        loops = [runtime.run(self.running_loop()) for _ in range(3)]
+        self.assertEqual([runtime.loop] * 3, loops)
+        self.assertEqual(1, runtime.loops)
+        self.assertEqual(3, runtime.invocations)
+        runtime.loop.close()
+
+    def test_run2(self):
+        # Should replace the loop when it was closed
+        runtime = Runtime()
+        first = runtime.run(self.running_loop())
+        first.close()
+        second = runtime.run(self.running_loop())
+        self.assertIsNot(first, second)
+        self.assertFalse(second.is_closed())
+        self.assertEqual(2, runtime.loops)
+        second.close()
+
+    def test_run3(self):
+        # Should fail because the loop of the runtime is already running
+        runtime = Runtime()
+
+        async def nested():
+            runtime.run(self.running_loop())
+
+        with self.assertRaises(RuntimeError):
+            runtime.run(nested())
+        runtime.loop.close()
+
+    @staticmethod
+    async def running_loop() -> asyncio.AbstractEventLoop:
+        return asyncio.get_running_loop()
+
+
+class TestKeepAliveRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), BotApiHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/bot123456:my_bot_token/getMe'
+
+    # --------------stats()--------------
+    def test_stats(self):
+        # Should open one connection and reuse it for the next requests, across the invocations
+        runtime = Runtime()
+        request = KeepAliveRequest()
+
+        async def invocation():
+            await request.initialize()
+            await asyncio.gather(*(request.do_request(self.url, 'POST') for _ in range(2)))
+            await request.do_request(self.url, 'POST')
+
+        runtime.run(invocation())
+        self.assertEqual({'requests': 3, 'connections': 2, 'reused': 1}, request.stats())
+        runtime.run(invocation())
+        self.assertEqual({'requests': 6, 'connections': 2, 'reused': 4}, request.stats())
+        runtime.run(request.shutdown())
+        runtime.loop.close()
+
+    # --------------_build_client()--------------
+    def test_build_client(self):
+        # Should build the client of the bot with the private hook of HTTPXRequest, from its private kwargs
+        self.assertIn('_build_client', vars(HTTPXRequest))
+        request = KeepAliveRequest(read_timeout=7.0)
+        client = request._client
+        self.assertEqual([request._on_request], client.event_hooks['request'])
+        self.assertEqual(7.0, client.timeout.read)
+        self.assertEqual(7.0, request._client_kwargs['timeout'].read)
+        self.assertEqual(KEEPALIVE_EXPIRY, client._transport._pool._keepalive_expiry)
@@ -0,0 +1,41 @@
+import random
+import unittest
+
+from settlement import Transfer, net_balances, settle
+
+
+class TestSettlement(unittest.TestCase):
+
+    # --------------net_balances()--------------
+    def test_net_balances(self):
+        self.assertEqual({'A': 600, 'B': -300, 'C': -300}, net_balances({'A': 900}, ['A', 'B', 'C']))
+        self.assertEqual({'A': 500, 'B': -500}, net_balances({'A': 1000}, ['A', 'B']))
+
+    def test_net_balances2(self):
+        # The minor units that cannot be split are owed by the first members
+        self.assertEqual({'A': -1, 'B': 1, 'C': 0}, net_balances({'B': 2, 'C': 1}, ['A', 'B', 'C']))
+        self.assertEqual({'A': 0, 'B': 0}, net_balances({}, ['A', 'B']))
+
+    # --------------settle()--------------
+    def test_settle(self):
+        self.assertEqual([Transfer('B', 'A', 3), Transfer('C', 'A', 2)], settle({'A': 5, 'B': -3, 'C': -2}))
+        self.assertEqual([], settle({'A': 0, 'B': 0}))
+
+    def test_settle2(self):
+        # Should fail because the balances do not sum up to zero
+        with self.assertRaises(ValueError):
+            settle({'A': 5, 'B': -3})
+
+    def test_settle3(self):
+        # Should bring every balance to zero with at most one transfer less than the members
+        rng = random.Random(0)
+        for members in [2, 3, 10, 300]:
+            names = [f'member{i}' for i in range(members)]
+            balances = net_balances({name: rng.randint(0, 10 ** 6) for name in names}, names)
+            transfers = settle(balances)
+            self.assertLessEqual(len(transfers), members - 1)
+            for transfer in transfers:
+                self.assertGreater(transfer.amount, 0)
+                balances[transfer.payer] += transfer.amount
+                balances[transfer.payee] -= transfer.amount
+            self.assertEqual({0}, set(balances.values()))
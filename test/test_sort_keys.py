@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime
+
+from sort_keys import KeyClock, add_months, compact_key, date, end_of, expand_key, import_key, is_second_key, month
+
+
+class TestSortKeys(unittest.TestCase):
+
+    # --------------KeyClock.next()--------------
+    def test_next(self):
+        # Should increase strictly, even when the clock does not move or goes back
+        clock = KeyClock('3f9a')
+        now = datetime(2024, 1, 1, 10, 0, 0, 999999)
+        keys = [clock.next(now), clock.next(now), clock.next(datetime(2024, 1, 1, 9))]
+        self.assertEqual(['2024-01-01 10:00:00.999999~3f9a', '2024-01-01 10:00:01.000000~3f9a',
+                          '2024-01-01 10:00:01.000001~3f9a'], keys)
+
+    def test_next2(self):
+        # Should sort after the keys of the second, and in the order of the time
+        keys = [KeyClock().next() for _ in range(1000)]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(1000, len(set(keys)))
+        self.assertLess(date(keys[0]), keys[0])
+
+    # --------------import_key()--------------
+    def test_import_key(self):
+        self.assertEqual('2024-01-01 10:00:00.000000~0000', import_key('2024-01-01 10:00:00', 0))
+        self.assertEqual('2024-01-01 10:00:00.000000~001a', import_key('2024-01-01T10:00:00', 26))
+        self.assertTrue(is_second_key('2024-01-01 10:00:00'))
+        self.assertFalse(is_second_key(import_key('2024-01-01 10:00:00', 0)))
+        self.assertEqual('2024-01-01 10:00:00', date(import_key('2024-01-01 10:00:00', 3)))
+
+    # --------------add_months()--------------
+    def test_add_months(self):
+        self.assertEqual('2024-01', month(import_key('2024-01-31 23:59:59', 0)))
+        self.assertEqual('2023-12', add_months('2024-01', -1))
+        self.assertEqual('2023-02', add_months('2024-01', -11))
+        self.assertEqual('2025-01', add_months('2024-12', 1))
+
+    # --------------end_of()--------------
+    def test_end_of(self):
+        # Should sort after every key of the day, and before the next day
+        keys = ['2024-03-31', '2024-03-31 23:59:59', import_key('2024-03-31 23:59:59', 0xffff)]
+        self.assertTrue(all(key < end_of('2024-03-31') < '2024-04-01' for key in keys))
+        self.assertLess(end_of('2024-03'), '2024-04')
+
+    # --------------compact_key()--------------
+    def test_compact_key(self):
+        for key in ['2024-01-01 10:00:00', import_key('2024-01-01 10:00:00', 26), KeyClock().next()]:
+            self.assertEqual(key, expand_key(compact_key(key)))
+        self.assertEqual('20240101100000000000~001a', compact_key(import_key('2024-01-01 10:00:00', 26)))
+        for compact in ['not a key', '2024', '20240101100000~001a', '20240101100000000000']:
+            with self.assertRaises(ValueError):
+                expand_key(compact)
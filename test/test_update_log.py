@@ -0,0 +1,55 @@
+import unittest
+
+from moto import mock_aws
+
+from test.local_dynamodb import TABLE_NAME, create_table
+from update_log import LEASE_SECONDS, TTL_ATTRIBUTE, UPDATE_PARTITION, UPDATE_TTL_SECONDS, UpdateLog
+
+
+class TestUpdateLog(unittest.TestCase):
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.table = create_table()
+        self.log = UpdateLog(TABLE_NAME, cache_size=2)
+
+    def get_item(self, update_id: int) -> dict:
+        return self.table.get_item(Key={'wallet': UPDATE_PARTITION, 'timestamp': str(update_id)}).get('Item', {})
+
+    # --------------claim()--------------
+    def test_claim(self):
+        # Should claim an update once, and expire it with the TTL of the table
+        self.assertTrue(self.log.claim(1, now=1000))
+        self.assertFalse(self.log.claim(1, now=1000))
+        self.assertFalse(UpdateLog(TABLE_NAME).claim(1, now=1000))
+        item = self.get_item(1)
+        self.assertEqual(('processing', 1000 + UPDATE_TTL_SECONDS), (item['state'], item[TTL_ATTRIBUTE]))
+
+    def test_claim2(self):
+        # Should claim an update again when its processing did not finish in the lease
+        self.assertTrue(self.log.claim(1, now=1000))
+        self.assertFalse(self.log.claim(1, now=1000 + LEASE_SECONDS))
+        self.assertTrue(self.log.claim(1, now=1001 + LEASE_SECONDS))
+
+    # --------------complete()--------------
+    def test_complete(self):
+        # Should never claim a completed update again, and remember the last completed ones of the container
+        self.log.claim(1, now=1000)
+        self.log.complete(1)
+        self.assertFalse(UpdateLog(TABLE_NAME).claim(1, now=1000 + 10 * LEASE_SECONDS))
+        self.assertEqual('done', self.get_item(1)['state'])
+        for update_id in [2, 3]:
+            self.log.claim(update_id)
+            self.log.complete(update_id)
+        self.assertEqual([False, True, True], [self.log.is_processed(update_id) for update_id in [1, 2, 3]])
+        self.assertEqual(2, self.log.hits)
+
+    # --------------release()--------------
+    def test_release(self):
+        # Should claim a released update again, e.g. to process it after a failure
+        self.log.claim(1, now=1000)
+        self.log.release(1)
+        self.assertEqual({}, self.get_item(1))
+        self.assertTrue(self.log.claim(1, now=1000))
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from telegram.request import HTTPXRequest, RequestData
+from telegram.request._requestparameter import RequestParameter
+
+from webhook_reply import WebhookReplyRequest
+
+URL = 'https://api.telegram.org/bot123456:my_bot_token/'
+
+
+def request_data(**parameters) -> RequestData:
+    return RequestData([RequestParameter.from_input(name, value) for name, value in parameters.items()])
+
+
+class TestWebhookReplyRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.request = WebhookReplyRequest()
+        patcher = mock.patch.object(HTTPXRequest, 'do_request', return_value=(200, b'{"ok": true, "result": true}'))
+        self.sent = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, endpoint: str, data: RequestData):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.request.do_request(URL + endpoint, 'POST', data))
+        finally:
+            loop.close()
+
+    # --------------do_request()--------------
+    def test_do_request(self):
+        # Should capture the first reply only, and send the next ones
+        self.request.start_capture()
+        status, body = self.call('sendMessage', request_data(chat_id=1234, text='Hi'))
+        self.assertEqual(200, status)
+        self.assertEqual(1234, json.loads(body)['result']['chat']['id'])
+        self.call('sendMessage', request_data(chat_id=4321, text='Hello'))
+        self.assertEqual({'method': 'sendMessage', 'chat_id': 1234, 'text': 'Hi'}, self.request.stop_capture())
+        self.assertEqual(1, self.sent.call_count)
+
+    def test_do_request2(self):
+        # Should send the calls that cannot be a reply, and the ones outside of the capture
+        self.call('sendMessage', request_data(chat_id=1234, text='Hi'))
+        self.request.start_capture()
+        self.call('getMe', request_data())
+        self.assertIsNone(self.request.stop_capture())
+        self.assertEqual(2, self.sent.call_count)
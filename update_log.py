@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+from functools import cached_property
+from typing import Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+from metrics import tracer
+
+# Partition that keeps one item per update received by the webhook, the sort key of each item is the update id
+UPDATE_PARTITION = '#update'
+
+# Attribute of the time after which DynamoDB deletes the item, see the ttl of the table in terraform/main.tf. Telegram
+# gives up delivering an update long before, hence the re-deliveries always find its item.
+TTL_ATTRIBUTE = 'expires_at'
+UPDATE_TTL_SECONDS = 24 * 60 * 60
+
+# Time an update is claimed by the invocation that processes it. An invocation that does not finish in it, e.g. because
+# the Lambda timed out, is considered failed and the next delivery of the update processes it again.
+LEASE_SECONDS = 60
+
+# Number of processed update ids remembered by a container, to skip the re-deliveries without reading the table
+FRONT_CACHE_SIZE = 1000
+
+
+class UpdateLog:
+    """
+    Records the updates processed by the webhook, so that an update that Telegram delivers again, e.g. because the
+    webhook was slow or failed, is not processed twice.
+
+    An update is claimed with a conditional write before it is processed, and completed once it is processed, or
+    released if it failed so that its next delivery processes it. The updates completed by the container are also
+    remembered in memory, see is_processed.
+    """
+
+    def __init__(self, table_name: str, cache_size: int = FRONT_CACHE_SIZE):
+        self._table_name = table_name
+        self._cache_size = cache_size
+        self._processed: OrderedDict[int, None] = OrderedDict()
+        self.hits = 0
+
+    @cached_property
+    def _table(self):
+        table = boto3.resource('dynamodb').Table(self._table_name)
+        tracer.trace_client(table.meta.client)
+        return table
+
+    def is_processed(self, update_id: int) -> bool:
+        """Whether the update was processed by the container, without reading the table"""
+        if update_id in self._processed:
+            self.hits += 1
+            return True
+        return False
+
+    def claim(self, update_id: int, now: Optional[float] = None) -> bool:
+        """
+        Returns whether the update is new, or its last processing failed, in which case the caller must process it
+        and then complete or release it
+        """
+        now = int(now or time.time())
+        try:
+            self._table.put_item(
+                Item={'wallet': UPDATE_PARTITION, 'timestamp': str(update_id), 'state': 'processing',
+                      'lease': now + LEASE_SECONDS, TTL_ATTRIBUTE: now + UPDATE_TTL_SECONDS},
+                ConditionExpression='attribute_not_exists(#ts) OR (#s = :processing AND #l < :now)',
+                ExpressionAttributeNames={'#ts': 'timestamp', '#s': 'state', '#l': 'lease'},
+                ExpressionAttributeValues={':processing': 'processing', ':now': now},
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # Processed, or being processed by another invocation
+            return False
+
+    def complete(self, update_id: int) -> None:
+        self._table.update_item(
+            Key={'wallet': UPDATE_PARTITION, 'timestamp': str(update_id)},
+            UpdateExpression='SET #s = :done REMOVE #l',
+            ExpressionAttributeNames={'#s': 'state', '#l': 'lease'},
+            ExpressionAttributeValues={':done': 'done'},
+        )
+        self._processed[update_id] = None
+        if len(self._processed) > self._cache_size:
+            self._processed.popitem(last=False)
+
+    def release(self, update_id: int) -> None:
+        self._table.delete_item(Key={'wallet': UPDATE_PARTITION, 'timestamp': str(update_id)})
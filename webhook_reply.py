@@ -0,0 +1,56 @@
+import json
+import time
+from http import HTTPStatus
+from typing import Callable, Dict, Optional, Tuple
+
+from telegram.request import RequestData
+
+from runtime import KeepAliveRequest
+
+
+def _message(parameters: Dict) -> Dict:
+    return {'message_id': 0, 'date': int(time.time()), 'chat': {'id': parameters.get('chat_id', 0), 'type': 'private'},
+            'text': parameters.get('text', '')}
+
+
+# Bot API methods that can be the reply of the webhook, with the result given to the bot in place of Telegram's one.
+# The handlers do not use the results of these methods, e.g. the id of the sent message is unknown until it is sent.
+REPLY_METHODS: Dict[str, Callable[[Dict], object]] = {
+    'sendMessage': _message,
+    'editMessageText': lambda parameters: True,
+    'answerCallbackQuery': lambda parameters: True,
+}
+
+
+class WebhookReplyRequest(KeepAliveRequest):
+    """
+    Makes the first Bot API call of an update the reply of the webhook, so that Telegram executes it when the webhook
+    answers, instead of the bot calling Telegram while the webhook is pending. The later calls are sent as usual.
+
+    Only the calls between start_capture and stop_capture are captured, and only the ones of REPLY_METHODS without
+    files, as the reply of a webhook is a JSON object.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._capturing = False
+        self._reply: Optional[Dict] = None
+
+    def start_capture(self) -> None:
+        self._capturing = True
+        self._reply = None
+
+    def stop_capture(self) -> Optional[Dict]:
+        """Returns the captured call as the reply of the webhook, None if no call was captured"""
+        reply, self._capturing, self._reply = self._reply, False, None
+        return reply
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         **kwargs) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        if (self._capturing and self._reply is None and endpoint in REPLY_METHODS and request_data
+                and not request_data.multipart_data):
+            self._reply = {'method': endpoint, **request_data.parameters}
+            result = REPLY_METHODS[endpoint](request_data.parameters)
+            return HTTPStatus.OK, json.dumps({'ok': True, 'result': result}).encode()
+        return await super().do_request(url, method, request_data, **kwargs)